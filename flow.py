@@ -8,16 +8,21 @@ from nodes import (
     WriteChapters,
     CombineTutorial
 )
+from utils.retry import RetryPolicy
 
 def create_tutorial_flow():
     """Creates and returns the codebase tutorial generation flow."""
 
+    # Up to 5 full prompts per LLM call: exponential backoff with jitter on
+    # network errors, Retry-After on rate limits, a repair prompt on bad YAML
+    retry_policy = RetryPolicy(max_attempts=5)
+
     # Instantiate nodes
     fetch_repo = FetchRepo()
-    identify_abstractions = IdentifyAbstractions(max_retries=5, wait=20)
-    analyze_relationships = AnalyzeRelationships(max_retries=5, wait=20)
-    order_chapters = OrderChapters(max_retries=5, wait=20)
-    write_chapters = WriteChapters(max_retries=5, wait=20) # This is a BatchNode
+    identify_abstractions = IdentifyAbstractions(retry_policy=retry_policy)
+    analyze_relationships = AnalyzeRelationships(retry_policy=retry_policy)
+    order_chapters = OrderChapters(retry_policy=retry_policy)
+    write_chapters = WriteChapters(retry_policy=retry_policy) # This is a BatchNode
     combine_tutorial = CombineTutorial()
 
     # Connect nodes in sequence based on the design
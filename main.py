@@ -1,8 +1,13 @@
 import dotenv
 import os
 import argparse
+import time
 # Import the function that creates the flow
 from flow import create_tutorial_flow
+from utils.checkpoint import RunCheckpoint
+from utils.context_builder import ABSTRACTION_MODES, DEFAULT_ABSTRACTION_MODE
+from utils.mermaid_utils import DEFAULT_DIAGRAM_FORMAT, DIAGRAM_FORMATS
+from utils.metrics import RunMetrics, format_summary
 
 dotenv.load_dotenv()
 
@@ -39,8 +44,8 @@ DEFAULT_EXCLUDE_PATTERNS = {
 def main():
     parser = argparse.ArgumentParser(description="Generate a tutorial for a GitHub codebase or local directory.")
 
-    # Create mutually exclusive group for source
-    source_group = parser.add_mutually_exclusive_group(required=True)
+    # Create mutually exclusive group for source (not needed with --resume)
+    source_group = parser.add_mutually_exclusive_group()
     source_group.add_argument("--repo", help="URL of the public GitHub repository.")
     source_group.add_argument("--dir", help="Path to local directory.")
 
@@ -50,15 +55,48 @@ def main():
     parser.add_argument("-i", "--include", nargs="+", help="Include file patterns (e.g. '*.py' '*.js'). Defaults to common code files if not specified.")
     parser.add_argument("-e", "--exclude", nargs="+", help="Exclude file patterns (e.g. 'tests/*' 'docs/*'). Defaults to test/build directories if not specified.")
     parser.add_argument("-s", "--max-size", type=int, default=100000, help="Maximum file size in bytes (default: 100000, about 100KB).")
+    parser.add_argument("--fetch-mode", choices=["api", "tarball"], default="api", help="How to download a GitHub repo: file by file through the API, or as one streamed archive (default: api)")
+    # Add mirror parameters to reuse crawled repositories across runs
+    parser.add_argument("--mirror-dir", default=os.environ.get("REPO_MIRROR_DIR", ".repo_mirror"), help="Directory of the local repository mirror keyed by commit SHA (default: ./.repo_mirror)")
+    parser.add_argument("--mirror-quota", type=int, default=2048, help="Disk quota of the repository mirror in MB; least recently used snapshots are evicted beyond it (default: 2048)")
+    parser.add_argument("--no-mirror", action="store_true", help="Always download the repository instead of using the local mirror")
+    # Add incremental flag to reuse the previous tutorial in the output directory
+    parser.add_argument("--incremental", action="store_true", help="Reuse the previous run's results in the output directory and regenerate only chapters whose files changed")
+    # Add render_workers parameter to bound parallel Mermaid rendering
+    parser.add_argument("--render-workers", type=int, default=2, help="Maximum number of mmdc processes rendering diagrams at once; each renders a whole batch of diagrams in one browser session (default: 2)")
+    # Add diagram_format parameter: image format, or mermaid.js in the browser
+    parser.add_argument("--diagram-format", choices=DIAGRAM_FORMATS, default=DEFAULT_DIAGRAM_FORMAT, help="How Mermaid diagrams are shown: rendered to SVG or PNG at build time, or 'client' to keep the code blocks and render them in the browser with mermaid.js (default: svg)")
+    # Add diagram cache parameters to reuse rendered diagrams across tutorials
+    parser.add_argument("--diagram-cache", default=os.environ.get("DIAGRAM_CACHE_DIR", ".diagram_cache"), help="Directory of the rendered diagram cache shared by all tutorials (default: ./.diagram_cache)")
+    parser.add_argument("--diagram-cache-quota", type=int, default=512, help="Disk quota of the diagram cache in MB; least recently used diagrams are evicted beyond it (default: 512)")
+    parser.add_argument("--no-diagram-cache", action="store_true", help="Always render diagrams instead of using the diagram cache")
+    # Add resume parameter to continue an interrupted run from its checkpoint
+    parser.add_argument("--resume", metavar="RUN_ID", help="Resume an interrupted run from <output>/.runs/RUN_ID, skipping finished steps and chapters (other options are taken from that run)")
+    # Add metrics_report parameter for the per-run timing and token report
+    parser.add_argument("--metrics-report", metavar="PATH", help="Where to write the JSON run report with per-step timings, LLM tokens, cache hits, retries and bytes crawled (default: <output>/.runs/reports/<run id>-<time>.json)")
+    # Add quiet flag for batch jobs
+    parser.add_argument("--quiet", action="store_true", help="Don't print crawl progress (counters are still collected)")
     # Add language parameter for multi-language support
     parser.add_argument("--language", default="english", help="Language for the generated tutorial (default: english)")
     # Add use_cache parameter to control LLM caching
     parser.add_argument("--no-cache", action="store_true", help="Disable LLM response caching (default: caching enabled)")
     # Add max_abstraction_num parameter to control the number of abstractions
     parser.add_argument("--max-abstractions", type=int, default=10, help="Maximum number of abstractions to identify (default: 10)")
+    # Add token_budget parameter to cap the codebase context sent to the LLM
+    parser.add_argument("--token-budget", type=int, default=120000, help="Approximate token budget for the codebase context used to identify abstractions (default: 120000)")
+    # Add abstraction_mode parameter to handle repositories larger than the token budget
+    parser.add_argument("--abstraction-mode", choices=ABSTRACTION_MODES, default=DEFAULT_ABSTRACTION_MODE, help="How to identify abstractions: one budget-packed prompt (files that don't fit are reduced to signatures), map-reduce over directory shards, or map-reduce only when files would not fit even as signatures (default: auto)")
+    # Add concurrency parameter to run LLM calls in parallel
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of LLM calls to run in parallel when writing chapters or analyzing map-reduce shards (default: 1, sequential)")
 
     args = parser.parse_args()
 
+    if args.resume:
+        resume_run(args)
+        return
+    if not (args.repo or args.dir):
+        parser.error("one of the arguments --repo --dir is required")
+
     # Get GitHub token from argument or environment variable if using repo
     github_token = None
     if args.repo:
@@ -78,6 +116,11 @@ def main():
         "include_patterns": set(args.include) if args.include else DEFAULT_INCLUDE_PATTERNS,
         "exclude_patterns": set(args.exclude) if args.exclude else DEFAULT_EXCLUDE_PATTERNS,
         "max_file_size": args.max_size,
+        "github_fetch_mode": args.fetch_mode,
+        "mirror_dir": None if args.no_mirror else args.mirror_dir,
+        "mirror_quota_mb": args.mirror_quota,
+        "quiet": args.quiet,
+        "incremental": args.incremental,
 
         # Add language for multi-language support
         "language": args.language,
@@ -88,6 +131,21 @@ def main():
         # Add max_abstraction_num parameter
         "max_abstraction_num": args.max_abstractions,
 
+        # Add context_token_budget parameter
+        "context_token_budget": args.token_budget,
+
+        # Add abstraction_mode parameter
+        "abstraction_mode": args.abstraction_mode,
+
+        # Add llm_concurrency parameter (1 = sequential LLM calls)
+        "llm_concurrency": args.concurrency,
+
+        # Add render_workers parameter (parallel mmdc processes)
+        "render_workers": args.render_workers,
+        "diagram_format": args.diagram_format,
+        "diagram_cache_dir": None if args.no_diagram_cache else args.diagram_cache,
+        "diagram_cache_quota_mb": args.diagram_cache_quota,
+
         # Outputs will be populated by the nodes
         "files": [],
         "abstractions": [],
@@ -97,15 +155,73 @@ def main():
         "final_output_dir": None
     }
 
+    # Checkpoint every finished step so an interrupted run can be resumed
+    checkpoint = RunCheckpoint.create(args.output, checkpoint_inputs(shared))
+    shared["checkpoint"] = checkpoint
+    print(f"Run id: {checkpoint.run_id} (resume with --resume {checkpoint.run_id} -o {args.output})")
+
     # Display starting message with repository/directory and language
     print(f"Starting tutorial generation for: {args.repo or args.dir} in {args.language.capitalize()} language")
     print(f"LLM caching: {'Disabled' if args.no_cache else 'Enabled'}")
 
-    # Create the flow instance
-    tutorial_flow = create_tutorial_flow()
-
     # Run the flow
-    tutorial_flow.run(shared)
+    run_flow(shared, checkpoint, args.metrics_report)
+
+
+def run_flow(shared, checkpoint, report_path=None):
+    """
+    Run the tutorial flow, then write the run report and print its summary
+    (also if the run fails). A completed run removes its checkpoint; a
+    failed one keeps it for --resume.
+    """
+    metrics = RunMetrics(run_id=checkpoint.run_id)
+    try:
+        with metrics.activate():
+            create_tutorial_flow().run(shared)
+    finally:
+        report_path = report_path or os.path.join(
+            os.path.dirname(checkpoint.run_dir), "reports",
+            f"{checkpoint.run_id}-{time.strftime('%H%M%S')}.json",
+        )
+        report = metrics.write_report(report_path)
+        print("\n" + format_summary(report))
+        print(f"Run report: {report_path}")
+    checkpoint.discard()
+
+# Shared keys filled by the nodes; everything else is an input of the run
+OUTPUT_KEYS = ("files", "abstractions", "relationships", "chapter_order", "chapters", "final_output_dir")
+
+
+def checkpoint_inputs(shared):
+    """Inputs of the run as JSON: no outputs, no token, sets as sorted lists"""
+    inputs = {}
+    for key, value in shared.items():
+        if key in OUTPUT_KEYS or key in ("github_token", "checkpoint"):
+            continue
+        inputs[key] = sorted(value) if isinstance(value, set) else value
+    return inputs
+
+
+def resume_run(args):
+    """Restart a checkpointed run from its first unfinished step or chapter"""
+    try:
+        checkpoint = RunCheckpoint.open(args.output, args.resume)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    shared = checkpoint.load_inputs()
+    shared["include_patterns"] = set(shared["include_patterns"])
+    shared["exclude_patterns"] = set(shared["exclude_patterns"])
+    # Tokens are never written to the run directory
+    shared["github_token"] = (args.token or os.environ.get('GITHUB_TOKEN')) if shared.get("repo_url") else None
+    shared.update({"files": [], "abstractions": [], "relationships": {}, "chapter_order": [], "chapters": [], "final_output_dir": None})
+    checkpoint.restore(shared)
+    shared["checkpoint"] = checkpoint
+
+    finished = ", ".join(shared["reusable_outputs"]) or "nothing"
+    print(f"Resuming run {checkpoint.run_id} for: {shared['repo_url'] or shared['local_dir']} (finished: {finished})")
+    run_flow(shared, checkpoint, args.metrics_report)
+
 
 if __name__ == "__main__":
     main()
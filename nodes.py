@@ -1,12 +1,43 @@
+import atexit
+import functools
 import os
-from utils import generate_mermaid_png
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from utils import MERMAID_THEME, generate_mermaid_batch, generate_mermaid_png, mermaid_cli_version
 
 import yaml
 from pocketflow import Node, BatchNode
 from utils.crawl_github_files import crawl_github_files
+from utils.progress import ProgressReporter
+from utils.file_table import LazyFileTable
+from utils.tutorial_manifest import (
+    REUSE_SETTINGS,
+    changed_files,
+    chapter_key,
+    file_hashes,
+    load_manifest,
+    save_manifest,
+)
+from utils.repo_mirror import DEFAULT_QUOTA_MB, RepoMirror
 from utils.call_llm import call_llm
+from utils.retry import RetryPolicy
+from utils.context_builder import (
+    DEFAULT_ABSTRACTION_MODE,
+    DEFAULT_TOKEN_BUDGET,
+    build_context,
+    shard_files,
+)
 from utils.crawl_local_files import crawl_local_files
-from utils.mermaid_utils import render_mermaid_blocks
+from utils.mermaid_utils import (
+    CLIENT_FORMAT,
+    DEFAULT_DIAGRAM_FORMAT,
+    LEGACY_DIAGRAM_FORMAT,
+    MermaidRewriter,
+)
+from utils.metrics import current_metrics, record_crawl
+from utils.mermaid_renderer import DEFAULT_RENDER_WORKERS, MermaidRenderer
+from utils.diagram_cache import DEFAULT_DIAGRAM_QUOTA_MB, DiagramCache
 from pathlib import Path
 
 
@@ -22,7 +53,95 @@ def get_content_for_indices(files_data, indices):
     return content_map
 
 
-class FetchRepo(Node):
+def get_paths_for_indices(files_data, indices):
+    """(index, path) of valid indices; a LazyFileTable is not asked for contents"""
+    path_of = getattr(files_data, "path", None) or (lambda i: files_data[i][0])
+    return [(i, path_of(i)) for i in indices if 0 <= i < len(files_data)]
+
+
+def _scratch_blob_store() -> RepoMirror:
+    """Temporary blob store for one run, removed at exit"""
+    root = tempfile.mkdtemp(prefix="tutorial-files-")
+    atexit.register(shutil.rmtree, root, True)
+    return RepoMirror(root)
+
+
+class _ResumableStep:
+    """
+    Mixin for flow steps whose output can come from an earlier run: the
+    previous tutorial's manifest (--incremental) or a checkpoint
+    (--resume). If shared["reusable_outputs"] has the step's output, the
+    node skips prep, exec and post. Either way, with a checkpoint in shared
+    the output is saved once the step is done.
+    """
+
+    output_key = None
+
+    def _run(self, shared):
+        reusable = shared.get("reusable_outputs", {})
+        if self.output_key in reusable:
+            shared[self.output_key] = reusable[self.output_key]
+            print(f"Reusing {self.output_key} from a previous run.")
+            metrics = current_metrics()
+            if metrics is not None:
+                metrics.reused(type(self).__name__)
+            self._after_reuse(shared)
+            action = None
+        else:
+            action = super()._run(shared)
+        checkpoint = shared.get("checkpoint")
+        if checkpoint is not None and not checkpoint.has_output(self.output_key):
+            checkpoint.save_output(self.output_key, shared)
+        return action
+
+    def _after_reuse(self, shared):
+        pass
+
+
+class _MeteredStep:
+    """
+    Mixin timing a flow step's prep, exec and post into the run's metrics
+    (utils.metrics). LLM calls made meanwhile, from any thread, are
+    attributed to the step. Without active metrics it is a plain Node run.
+    """
+
+    def _run(self, shared):
+        metrics = current_metrics()
+        if metrics is None:
+            return super()._run(shared)
+        stage = type(self).__name__
+        with metrics.phase(stage, "prep"):
+            prep_res = self.prep(shared)
+        with metrics.phase(stage, "exec"):
+            exec_res = self._exec(prep_res)
+        with metrics.phase(stage, "post"):
+            return self.post(shared, prep_res, exec_res)
+
+
+class _LLMStep:
+    """
+    Mixin for flow steps that call the LLM. Calls go through a RetryPolicy
+    (backoff by error class, cheap repair prompts for unparseable YAML)
+    rather than Node's fixed ``wait`` between full re-runs of exec. Without
+    a policy a call is made once, like a Node with the default max_retries.
+    """
+
+    def __init__(self, retry_policy=None, **kwargs):
+        super().__init__(**kwargs)
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=1)
+
+    def ask_llm(self, prompt, use_cache, parse=None, label=None):
+        # Parsed answers are YAML: let a streamed answer without a ```yaml
+        # block be cut off early instead of generated to the end
+        llm = call_llm if parse is None else functools.partial(call_llm, expect_fence="yaml")
+        return self.retry_policy.run(
+            llm, prompt, parse=parse, use_cache=use_cache, label=label or type(self).__name__
+        )
+
+
+class FetchRepo(_ResumableStep, _MeteredStep, Node):
+    output_key = "files"
+
     def prep(self, shared):
         repo_url = shared.get("repo_url")
         local_dir = shared.get("local_dir")
@@ -49,11 +168,19 @@ class FetchRepo(Node):
             "exclude_patterns": exclude_patterns,
             "max_file_size": max_file_size,
             "use_relative_paths": True,
+            "fetch_mode": shared.get("github_fetch_mode", "api"),
+            "mirror_dir": shared.get("mirror_dir"),
+            "mirror_quota_mb": shared.get("mirror_quota_mb", DEFAULT_QUOTA_MB),
+            "quiet": shared.get("quiet", False),
+            "checkpoint": shared.get("checkpoint"),
         }
 
     def exec(self, prep_res):
         if prep_res["repo_url"]:
             print(f"Crawling repository: {prep_res['repo_url']}...")
+            mirror = RepoMirror(
+                prep_res["mirror_dir"], prep_res["mirror_quota_mb"] * 1024 * 1024
+            ) if prep_res["mirror_dir"] else None
             result = crawl_github_files(
                 repo_url=prep_res["repo_url"],
                 token=prep_res["token"],
@@ -61,7 +188,17 @@ class FetchRepo(Node):
                 exclude_patterns=prep_res["exclude_patterns"],
                 max_file_size=prep_res["max_file_size"],
                 use_relative_paths=prep_res["use_relative_paths"],
+                fetch_mode=prep_res["fetch_mode"],
+                mirror=mirror,
+                progress=ProgressReporter("Crawling repository", quiet=prep_res["quiet"]),
             )
+            record_crawl(result.get("stats", {}))
+            # Keep contents out of memory: serve them from the mirror's blobs,
+            # else from the checkpoint's (saved as digests, no second copy),
+            # else from a scratch blob store for this run
+            checkpoint = prep_res.get("checkpoint")
+            store = mirror or (checkpoint.blobs if checkpoint is not None else _scratch_blob_store())
+            files_list = LazyFileTable.from_blob_store(store, result.get("files", {}))
         else:
             print(f"Crawling directory: {prep_res['local_dir']}...")
 
@@ -70,40 +207,276 @@ class FetchRepo(Node):
                 include_patterns=prep_res["include_patterns"],
                 exclude_patterns=prep_res["exclude_patterns"],
                 max_file_size=prep_res["max_file_size"],
-                use_relative_paths=prep_res["use_relative_paths"]
+                use_relative_paths=prep_res["use_relative_paths"],
+                progress=ProgressReporter("Crawling directory", quiet=prep_res["quiet"]),
+                lazy=True,
             )
+            record_crawl(result.get("stats", {}))
+            files_list = result["files"]
 
-        # Convert dict to list of tuples: [(path, content), ...]
-        files_list = list(result.get("files", {}).items())
+        # files_list is a LazyFileTable: a sequence of (path, content) tuples
         if len(files_list) == 0:
             raise (ValueError("Failed to fetch files"))
         print(f"Fetched {len(files_list)} files.")
         return files_list
 
     def post(self, shared, prep_res, exec_res):
-        shared["files"] = exec_res  # List of (path, content) tuples
+        shared["files"] = exec_res  # Sequence of (path, content) tuples, loaded lazily
+        shared["file_hashes"] = file_hashes(exec_res)
+        if shared.get("incremental"):
+            _plan_incremental_run(shared)
+
+    def _after_reuse(self, shared):
+        # Resumed run: the manifest diff still has to be planned
+        if shared.get("incremental") and "previous_manifest" not in shared:
+            _plan_incremental_run(shared)
+
+
+def _plan_incremental_run(shared):
+    """
+    Diff the crawled files against the manifest of the previous run and
+    record what later nodes may reuse: abstractions, relationships and
+    chapter order when the file list is unchanged, and chapters by key.
+    """
+    output_path = os.path.join(shared.get("output_dir", "output"), shared["project_name"])
+    previous = load_manifest(output_path)
+    if previous is None:
+        print(f"Incremental: no manifest in {output_path}; running the full pipeline.")
+        return
+    if any(previous.get("settings", {}).get(k) != shared.get(k) for k in REUSE_SETTINGS):
+        print("Incremental: settings changed since the previous run; running the full pipeline.")
+        return
+
+    hashes = shared["file_hashes"]
+    changed = changed_files(previous.get("files", {}), hashes)
+    shared["previous_manifest"] = previous
+    # File indices in abstractions stay valid only if the file list is identical
+    if list(previous.get("files", {})) == list(hashes):
+        # Outputs restored from a checkpoint take precedence
+        reusable = shared.setdefault("reusable_outputs", {})
+        for key in ("abstractions", "relationships", "chapter_order"):
+            reusable.setdefault(key, previous[key])
+    print(f"Incremental: {len(changed)} of {len(hashes)} files changed since the previous run.")
+
+
+# Helpers shared by the single-pass and map-reduce modes of IdentifyAbstractions
+def _abstraction_lang_hints(language):
+    # Add language instruction and hints only if not English
+    language_instruction = ""
+    name_lang_hint = ""
+    desc_lang_hint = ""
+    if language.lower() != "english":
+        language_instruction = f"IMPORTANT: Generate the `name` and `description` for each abstraction in **{language.capitalize()}** language. Do NOT use English for these fields.\n\n"
+        # Keep specific hints here as name/description are primary targets
+        name_lang_hint = f" (value in {language.capitalize()})"
+        desc_lang_hint = f" (value in {language.capitalize()})"
+    return language_instruction, name_lang_hint, desc_lang_hint
+
+
+def _abstractions_output_format(name_lang_hint, desc_lang_hint, max_abstraction_num):
+    return f"""Format the output as a YAML list of dictionaries:
 
+```yaml
+- name: |
+    Query Processing{name_lang_hint}
+  description: |
+    Explains what the abstraction does.
+    It's like a central dispatcher routing requests.{desc_lang_hint}
+  file_indices:
+    - 0 # path/to/file1.py
+    - 3 # path/to/related.py
+- name: |
+    Query Optimization{name_lang_hint}
+  description: |
+    Another core concept, similar to a blueprint for objects.{desc_lang_hint}
+  file_indices:
+    - 5 # path/to/another.js
+# ... up to {max_abstraction_num} abstractions
+```"""
+
+
+def _abstractions_prompt(project_name, context, file_listing_for_prompt, language, max_abstraction_num):
+    language_instruction, name_lang_hint, desc_lang_hint = _abstraction_lang_hints(language)
+    return f"""
+For the project `{project_name}`:
+
+Codebase Context:
+{context}
+
+{language_instruction}Analyze the codebase context.
+Identify the top 5-{max_abstraction_num} core most important abstractions to help those new to the codebase.
+
+For each abstraction, provide:
+1. A concise `name`{name_lang_hint}.
+2. A beginner-friendly `description` explaining what it is with a simple analogy, in around 100 words{desc_lang_hint}.
+3. A list of relevant `file_indices` (integers) using the format `idx # path/comment`.
+
+List of file indices and paths present in the context:
+{file_listing_for_prompt}
+
+{_abstractions_output_format(name_lang_hint, desc_lang_hint, max_abstraction_num)}"""
+
+
+def _merge_abstractions_prompt(project_name, candidates, files_data, shard_count, language, max_abstraction_num):
+    language_instruction, name_lang_hint, desc_lang_hint = _abstraction_lang_hints(language)
+    candidate_lines = []
+    referenced = set()
+    for i, cand in enumerate(candidates):
+        indices_str = ", ".join(str(idx) for idx in cand["files"])
+        candidate_lines.append(
+            f"- Candidate {i}: {cand['name'].strip()} (file indices: [{indices_str}])\n"
+            f"  Description: {cand['description'].strip()}"
+        )
+        referenced.update(cand["files"])
+    file_listing_for_prompt = "\n".join(
+        f"- {idx} # {files_data[idx][0]}" for idx in sorted(referenced)
+    )
+    return f"""
+For the project `{project_name}`:
+
+The codebase was analyzed in {shard_count} parts. These candidate abstractions were found in the parts:
+{chr(10).join(candidate_lines)}
+
+{language_instruction}Merge candidates that describe the same concept (combining their file indices), drop minor or overly specific ones, and select the top 5-{max_abstraction_num} core most important abstractions to help those new to the codebase.
+
+For each abstraction, provide:
+1. A concise `name`{name_lang_hint}.
+2. A beginner-friendly `description` explaining what it is with a simple analogy, in around 100 words{desc_lang_hint}.
+3. A list of relevant `file_indices` (integers) using the format `idx # path/comment`, taken from the candidates.
+
+List of file indices and paths referenced by the candidates:
+{file_listing_for_prompt}
+
+{_abstractions_output_format(name_lang_hint, desc_lang_hint, max_abstraction_num)}"""
+
+
+def _parse_abstractions(response, file_count):
+    # --- Validation ---
+    yaml_str = response.strip().split("```yaml")[1].split("```")[0].strip()
+    abstractions = yaml.safe_load(yaml_str)
+
+    if not isinstance(abstractions, list):
+        raise ValueError("LLM Output is not a list")
+
+    validated_abstractions = []
+    for item in abstractions:
+        if not isinstance(item, dict) or not all(
+            k in item for k in ["name", "description", "file_indices"]
+        ):
+            raise ValueError(f"Missing keys in abstraction item: {item}")
+        if not isinstance(item["name"], str):
+            raise ValueError(f"Name is not a string in item: {item}")
+        if not isinstance(item["description"], str):
+            raise ValueError(f"Description is not a string in item: {item}")
+        if not isinstance(item["file_indices"], list):
+            raise ValueError(f"file_indices is not a list in item: {item}")
+
+        # Validate indices
+        validated_indices = []
+        for idx_entry in item["file_indices"]:
+            try:
+                if isinstance(idx_entry, int):
+                    idx = idx_entry
+                elif isinstance(idx_entry, str) and "#" in idx_entry:
+                    idx = int(idx_entry.split("#")[0].strip())
+                else:
+                    idx = int(str(idx_entry).strip())
+
+                if not (0 <= idx < file_count):
+                    raise ValueError(
+                        f"Invalid file index {idx} found in item {item['name']}. Max index is {file_count - 1}."
+                    )
+                validated_indices.append(idx)
+            except (ValueError, TypeError):
+                raise ValueError(
+                    f"Could not parse index from entry: {idx_entry} in item {item['name']}"
+                )
+
+        item["files"] = sorted(list(set(validated_indices)))
+        # Store only the required fields
+        validated_abstractions.append(
+            {
+                "name": item["name"],  # Potentially translated name
+                "description": item[
+                    "description"
+                ],  # Potentially translated description
+                "files": item["files"],
+            }
+        )
+    return validated_abstractions
+
+
+class IdentifyAbstractions(_ResumableStep, _MeteredStep, _LLMStep, Node):
+    """
+    Identifies the core abstractions of the codebase.
+
+    In the default ``single`` mode all files are packed into one prompt. In
+    ``map_reduce`` mode (or ``auto`` when the files exceed the token budget)
+    files are sharded by directory into token-bounded chunks, candidates are
+    identified per shard in parallel, and a final call merges them into the
+    top ``max_abstraction_num`` with file indices remapped to global ones.
+    """
+
+    output_key = "abstractions"
 
-class IdentifyAbstractions(Node):
     def prep(self, shared):
         files_data = shared["files"]
         project_name = shared["project_name"]  # Get project name
         language = shared.get("language", "english")  # Get language
         use_cache = shared.get("use_cache", True)  # Get use_cache flag, default to True
         max_abstraction_num = shared.get("max_abstraction_num", 10)  # Get max_abstraction_num, default to 10
+        token_budget = shared.get("context_token_budget") or DEFAULT_TOKEN_BUDGET
+        mode = shared.get("abstraction_mode", DEFAULT_ABSTRACTION_MODE)
+        concurrency = max(1, int(shared.get("llm_concurrency", 1)))
+
+        packed = None
+        if mode == "auto":
+            # Same packing as the single prompt: shard only if files would be
+            # dropped, not merely reduced to signatures
+            packed = build_context(files_data, token_budget)
+            mode = "map_reduce" if packed[2]["dropped_count"] else "single"
+
+        shards = None
+        if mode == "map_reduce":
+            # Each shard gets its own budget-packed context with local indices
+            shards = []
+            for indices in shard_files(files_data, token_budget):
+                shard_context, shard_info, _ = build_context(
+                    [files_data[i] for i in indices], token_budget
+                )
+                shards.append(
+                    {
+                        "context": shard_context,
+                        "file_listing": "\n".join(
+                            f"- {idx} # {path}" for idx, path in shard_info
+                        ),
+                        "indices": indices,  # local index -> global index
+                    }
+                )
+            print(f"Map-reduce mode: {len(files_data)} files in {len(shards)} shards.")
+            return (
+                None,
+                None,
+                len(files_data),
+                project_name,
+                language,
+                use_cache,
+                max_abstraction_num,
+                shards,
+                files_data,
+                concurrency,
+            )
 
-        # Helper to create context from files, respecting limits (basic example)
-        def create_llm_context(files_data):
-            context = ""
-            file_info = []  # Store tuples of (index, path)
-            for i, (path, content) in enumerate(files_data):
-                entry = f"--- File Index {i}: {path} ---\n{content}\n\n"
-                context += entry
-                file_info.append((i, path))
-
-            return context, file_info  # file_info is list of (index, path)
-
-        context, file_info = create_llm_context(files_data)
+        # Pack the most relevant files into the token budget; the rest are
+        # reduced to signatures or dropped (file_info still lists every file)
+        context, file_info, report = packed or build_context(files_data, token_budget)
+        shared["context_report"] = report
+        print(
+            f"Context: {report['full_count']} files in full, "
+            f"{report['signature_count']} as signatures, "
+            f"{report['dropped_count']} dropped "
+            f"(~{report['used_tokens']} of {token_budget} tokens)."
+        )
         # Format file info for the prompt (comment is just a hint for LLM)
         file_listing_for_prompt = "\n".join(
             [f"- {idx} # {path}" for idx, path in file_info]
@@ -116,6 +489,9 @@ class IdentifyAbstractions(Node):
             language,
             use_cache,
             max_abstraction_num,
+            shards,
+            files_data,
+            concurrency,
         )  # Return all parameters
 
     def exec(self, prep_res):
@@ -127,120 +503,141 @@ class IdentifyAbstractions(Node):
             language,
             use_cache,
             max_abstraction_num,
+            shards,
+            files_data,
+            concurrency,
         ) = prep_res  # Unpack all parameters
-        print(f"Identifying abstractions using LLM...")
 
-        # Add language instruction and hints only if not English
-        language_instruction = ""
-        name_lang_hint = ""
-        desc_lang_hint = ""
-        if language.lower() != "english":
-            language_instruction = f"IMPORTANT: Generate the `name` and `description` for each abstraction in **{language.capitalize()}** language. Do NOT use English for these fields.\n\n"
-            # Keep specific hints here as name/description are primary targets
-            name_lang_hint = f" (value in {language.capitalize()})"
-            desc_lang_hint = f" (value in {language.capitalize()})"
-
-        prompt = f"""
-For the project `{project_name}`:
-
-Codebase Context:
-{context}
+        if shards is not None:
+            return self._exec_map_reduce(prep_res)
 
-{language_instruction}Analyze the codebase context.
-Identify the top 5-{max_abstraction_num} core most important abstractions to help those new to the codebase.
+        print(f"Identifying abstractions using LLM...")
+        prompt = _abstractions_prompt(
+            project_name, context, file_listing_for_prompt, language, max_abstraction_num
+        )
+        validated_abstractions = self.ask_llm(
+            prompt, use_cache, parse=lambda response: _parse_abstractions(response, file_count)
+        )
+        print(f"Identified {len(validated_abstractions)} abstractions.")
+        return validated_abstractions
 
-For each abstraction, provide:
-1. A concise `name`{name_lang_hint}.
-2. A beginner-friendly `description` explaining what it is with a simple analogy, in around 100 words{desc_lang_hint}.
-3. A list of relevant `file_indices` (integers) using the format `idx # path/comment`.
+    def _identify_in_shard(self, shard, project_name, language, use_cache, max_abstraction_num):
+        # A failing shard is retried on its own instead of restarting the whole map phase
+        prompt = _abstractions_prompt(
+            project_name, shard["context"], shard["file_listing"], language, max_abstraction_num
+        )
+        candidates = self.ask_llm(
+            prompt,
+            use_cache,
+            parse=lambda response: _parse_abstractions(response, len(shard["indices"])),
+            label="IdentifyAbstractions shard",
+        )
+        # Remap shard-local file indices to global ones
+        for cand in candidates:
+            cand["files"] = sorted(shard["indices"][i] for i in cand["files"])
+        return candidates
 
-List of file indices and paths present in the context:
-{file_listing_for_prompt}
+    def _exec_map_reduce(self, prep_res):
+        (
+            _,
+            _,
+            file_count,
+            project_name,
+            language,
+            use_cache,
+            max_abstraction_num,
+            shards,
+            files_data,
+            concurrency,
+        ) = prep_res
+
+        print(f"Identifying candidate abstractions in {len(shards)} shards using LLM...")
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            per_shard = list(
+                pool.map(
+                    lambda shard: self._identify_in_shard(
+                        shard, project_name, language, use_cache, max_abstraction_num
+                    ),
+                    shards,
+                )
+            )
+        candidates = [cand for shard_candidates in per_shard for cand in shard_candidates]
+        print(f"Found {len(candidates)} candidate abstractions; merging...")
 
-Format the output as a YAML list of dictionaries:
+        prompt = _merge_abstractions_prompt(
+            project_name, candidates, files_data, len(shards), language, max_abstraction_num
+        )
+        validated_abstractions = self.ask_llm(
+            prompt, use_cache, parse=lambda response: _parse_abstractions(response, file_count)
+        )
+        print(f"Identified {len(validated_abstractions)} abstractions.")
+        return validated_abstractions
 
-```yaml
-- name: |
-    Query Processing{name_lang_hint}
-  description: |
-    Explains what the abstraction does.
-    It's like a central dispatcher routing requests.{desc_lang_hint}
-  file_indices:
-    - 0 # path/to/file1.py
-    - 3 # path/to/related.py
-- name: |
-    Query Optimization{name_lang_hint}
-  description: |
-    Another core concept, similar to a blueprint for objects.{desc_lang_hint}
-  file_indices:
-    - 5 # path/to/another.js
-# ... up to {max_abstraction_num} abstractions
-```"""
-        response = call_llm(prompt, use_cache=(use_cache and self.cur_retry == 0))  # Use cache only if enabled and not retrying
+    def post(self, shared, prep_res, exec_res):
+        shared["abstractions"] = (
+            exec_res  # List of {"name": str, "description": str, "files": [int]}
+        )
 
-        # --- Validation ---
-        yaml_str = response.strip().split("```yaml")[1].split("```")[0].strip()
-        abstractions = yaml.safe_load(yaml_str)
 
-        if not isinstance(abstractions, list):
-            raise ValueError("LLM Output is not a list")
+def _parse_relationships(response, num_abstractions):
+    # --- Validation ---
+    yaml_str = response.strip().split("```yaml")[1].split("```")[0].strip()
+    relationships_data = yaml.safe_load(yaml_str)
 
-        validated_abstractions = []
-        for item in abstractions:
-            if not isinstance(item, dict) or not all(
-                k in item for k in ["name", "description", "file_indices"]
+    if not isinstance(relationships_data, dict) or not all(
+        k in relationships_data for k in ["summary", "relationships"]
+    ):
+        raise ValueError(
+            "LLM output is not a dict or missing keys ('summary', 'relationships')"
+        )
+    if not isinstance(relationships_data["summary"], str):
+        raise ValueError("summary is not a string")
+    if not isinstance(relationships_data["relationships"], list):
+        raise ValueError("relationships is not a list")
+
+    # Validate relationships structure
+    validated_relationships = []
+    for rel in relationships_data["relationships"]:
+        # Check for 'label' key
+        if not isinstance(rel, dict) or not all(
+            k in rel for k in ["from_abstraction", "to_abstraction", "label"]
+        ):
+            raise ValueError(
+                f"Missing keys (expected from_abstraction, to_abstraction, label) in relationship item: {rel}"
+            )
+        # Validate 'label' is a string
+        if not isinstance(rel["label"], str):
+            raise ValueError(f"Relationship label is not a string: {rel}")
+
+        # Validate indices
+        try:
+            from_idx = int(str(rel["from_abstraction"]).split("#")[0].strip())
+            to_idx = int(str(rel["to_abstraction"]).split("#")[0].strip())
+            if not (
+                0 <= from_idx < num_abstractions and 0 <= to_idx < num_abstractions
             ):
-                raise ValueError(f"Missing keys in abstraction item: {item}")
-            if not isinstance(item["name"], str):
-                raise ValueError(f"Name is not a string in item: {item}")
-            if not isinstance(item["description"], str):
-                raise ValueError(f"Description is not a string in item: {item}")
-            if not isinstance(item["file_indices"], list):
-                raise ValueError(f"file_indices is not a list in item: {item}")
-
-            # Validate indices
-            validated_indices = []
-            for idx_entry in item["file_indices"]:
-                try:
-                    if isinstance(idx_entry, int):
-                        idx = idx_entry
-                    elif isinstance(idx_entry, str) and "#" in idx_entry:
-                        idx = int(idx_entry.split("#")[0].strip())
-                    else:
-                        idx = int(str(idx_entry).strip())
-
-                    if not (0 <= idx < file_count):
-                        raise ValueError(
-                            f"Invalid file index {idx} found in item {item['name']}. Max index is {file_count - 1}."
-                        )
-                    validated_indices.append(idx)
-                except (ValueError, TypeError):
-                    raise ValueError(
-                        f"Could not parse index from entry: {idx_entry} in item {item['name']}"
-                    )
-
-            item["files"] = sorted(list(set(validated_indices)))
-            # Store only the required fields
-            validated_abstractions.append(
+                raise ValueError(
+                    f"Invalid index in relationship: from={from_idx}, to={to_idx}. Max index is {num_abstractions-1}."
+                )
+            validated_relationships.append(
                 {
-                    "name": item["name"],  # Potentially translated name
-                    "description": item[
-                        "description"
-                    ],  # Potentially translated description
-                    "files": item["files"],
+                    "from": from_idx,
+                    "to": to_idx,
+                    "label": rel["label"],  # Potentially translated label
                 }
             )
+        except (ValueError, TypeError):
+            raise ValueError(f"Could not parse indices from relationship: {rel}")
 
-        print(f"Identified {len(validated_abstractions)} abstractions.")
-        return validated_abstractions
+    return {
+        "summary": relationships_data["summary"],  # Potentially translated summary
+        "details": validated_relationships,  # Store validated, index-based relationships with potentially translated labels
+    }
 
-    def post(self, shared, prep_res, exec_res):
-        shared["abstractions"] = (
-            exec_res  # List of {"name": str, "description": str, "files": [int]}
-        )
 
+class AnalyzeRelationships(_ResumableStep, _MeteredStep, _LLMStep, Node):
+    output_key = "relationships"
 
-class AnalyzeRelationships(Node):
     def prep(self, shared):
         abstractions = shared[
             "abstractions"
@@ -347,70 +744,63 @@ relationships:
 
 Now, provide the YAML output:
 """
-        response = call_llm(prompt, use_cache=(use_cache and self.cur_retry == 0)) # Use cache only if enabled and not retrying
+        relationships = self.ask_llm(
+            prompt, use_cache, parse=lambda response: _parse_relationships(response, num_abstractions)
+        )
+        print("Generated project summary and relationship details.")
+        return relationships
 
-        # --- Validation ---
-        yaml_str = response.strip().split("```yaml")[1].split("```")[0].strip()
-        relationships_data = yaml.safe_load(yaml_str)
+    def post(self, shared, prep_res, exec_res):
+        # Structure is now {"summary": str, "details": [{"from": int, "to": int, "label": str}]}
+        # Summary and label might be translated
+        shared["relationships"] = exec_res
 
-        if not isinstance(relationships_data, dict) or not all(
-            k in relationships_data for k in ["summary", "relationships"]
-        ):
-            raise ValueError(
-                "LLM output is not a dict or missing keys ('summary', 'relationships')"
-            )
-        if not isinstance(relationships_data["summary"], str):
-            raise ValueError("summary is not a string")
-        if not isinstance(relationships_data["relationships"], list):
-            raise ValueError("relationships is not a list")
-
-        # Validate relationships structure
-        validated_relationships = []
-        for rel in relationships_data["relationships"]:
-            # Check for 'label' key
-            if not isinstance(rel, dict) or not all(
-                k in rel for k in ["from_abstraction", "to_abstraction", "label"]
-            ):
+
+def _parse_chapter_order(response, num_abstractions):
+    # --- Validation ---
+    yaml_str = response.strip().split("```yaml")[1].split("```")[0].strip()
+    ordered_indices_raw = yaml.safe_load(yaml_str)
+
+    if not isinstance(ordered_indices_raw, list):
+        raise ValueError("LLM output is not a list")
+
+    ordered_indices = []
+    seen_indices = set()
+    for entry in ordered_indices_raw:
+        try:
+            if isinstance(entry, int):
+                idx = entry
+            elif isinstance(entry, str) and "#" in entry:
+                idx = int(entry.split("#")[0].strip())
+            else:
+                idx = int(str(entry).strip())
+
+            if not (0 <= idx < num_abstractions):
                 raise ValueError(
-                    f"Missing keys (expected from_abstraction, to_abstraction, label) in relationship item: {rel}"
+                    f"Invalid index {idx} in ordered list. Max index is {num_abstractions-1}."
                 )
-            # Validate 'label' is a string
-            if not isinstance(rel["label"], str):
-                raise ValueError(f"Relationship label is not a string: {rel}")
+            if idx in seen_indices:
+                raise ValueError(f"Duplicate index {idx} found in ordered list.")
+            ordered_indices.append(idx)
+            seen_indices.add(idx)
 
-            # Validate indices
-            try:
-                from_idx = int(str(rel["from_abstraction"]).split("#")[0].strip())
-                to_idx = int(str(rel["to_abstraction"]).split("#")[0].strip())
-                if not (
-                    0 <= from_idx < num_abstractions and 0 <= to_idx < num_abstractions
-                ):
-                    raise ValueError(
-                        f"Invalid index in relationship: from={from_idx}, to={to_idx}. Max index is {num_abstractions-1}."
-                    )
-                validated_relationships.append(
-                    {
-                        "from": from_idx,
-                        "to": to_idx,
-                        "label": rel["label"],  # Potentially translated label
-                    }
-                )
-            except (ValueError, TypeError):
-                raise ValueError(f"Could not parse indices from relationship: {rel}")
+        except (ValueError, TypeError):
+            raise ValueError(
+                f"Could not parse index from ordered list entry: {entry}"
+            )
 
-        print("Generated project summary and relationship details.")
-        return {
-            "summary": relationships_data["summary"],  # Potentially translated summary
-            "details": validated_relationships,  # Store validated, index-based relationships with potentially translated labels
-        }
+    # Check if all abstractions are included
+    if len(ordered_indices) != num_abstractions:
+        raise ValueError(
+            f"Ordered list length ({len(ordered_indices)}) does not match number of abstractions ({num_abstractions}). Missing indices: {set(range(num_abstractions)) - seen_indices}"
+        )
+
+    return ordered_indices
 
-    def post(self, shared, prep_res, exec_res):
-        # Structure is now {"summary": str, "details": [{"from": int, "to": int, "label": str}]}
-        # Summary and label might be translated
-        shared["relationships"] = exec_res
 
+class OrderChapters(_ResumableStep, _MeteredStep, _LLMStep, Node):
+    output_key = "chapter_order"
 
-class OrderChapters(Node):
     def prep(self, shared):
         abstractions = shared["abstractions"]  # Name/description might be translated
         relationships = shared["relationships"]  # Summary/label might be translated
@@ -489,55 +879,51 @@ Output the ordered list of abstraction indices, including the name in a comment
 
 Now, provide the YAML output:
 """
-        response = call_llm(prompt, use_cache=(use_cache and self.cur_retry == 0)) # Use cache only if enabled and not retrying
+        ordered_indices = self.ask_llm(
+            prompt, use_cache, parse=lambda response: _parse_chapter_order(response, num_abstractions)
+        )
+        print(f"Determined chapter order (indices): {ordered_indices}")
+        return ordered_indices  # Return the list of indices
 
-        # --- Validation ---
-        yaml_str = response.strip().split("```yaml")[1].split("```")[0].strip()
-        ordered_indices_raw = yaml.safe_load(yaml_str)
+    def post(self, shared, prep_res, exec_res):
+        # exec_res is already the list of ordered indices
+        shared["chapter_order"] = exec_res  # List of indices
 
-        if not isinstance(ordered_indices_raw, list):
-            raise ValueError("LLM output is not a list")
 
-        ordered_indices = []
-        seen_indices = set()
-        for entry in ordered_indices_raw:
-            try:
-                if isinstance(entry, int):
-                    idx = entry
-                elif isinstance(entry, str) and "#" in entry:
-                    idx = int(entry.split("#")[0].strip())
-                else:
-                    idx = int(str(entry).strip())
+# Transitions added to parallel drafts that lack them, by tutorial language:
+# (previous chapter sentence, next chapter sentence)
+TRANSITION_TEXT = {
+    "english": ("In the previous chapter we covered {link}.", "Next: {link}"),
+    "russian": ("В предыдущей главе мы рассмотрели {link}.", "Далее: {link}"),
+    "chinese": ("在上一章中，我们介绍了 {link}。", "下一章：{link}"),
+    "spanish": ("En el capítulo anterior vimos {link}.", "Siguiente: {link}"),
+    "french": ("Dans le chapitre précédent, nous avons vu {link}.", "Suivant : {link}"),
+    "german": ("Im vorherigen Kapitel haben wir {link} behandelt.", "Weiter: {link}"),
+    "japanese": ("前の章では {link} を取り上げました。", "次へ: {link}"),
+}
 
-                if not (0 <= idx < num_abstractions):
-                    raise ValueError(
-                        f"Invalid index {idx} in ordered list. Max index is {num_abstractions-1}."
-                    )
-                if idx in seen_indices:
-                    raise ValueError(f"Duplicate index {idx} found in ordered list.")
-                ordered_indices.append(idx)
-                seen_indices.add(idx)
 
-            except (ValueError, TypeError):
-                raise ValueError(
-                    f"Could not parse index from ordered list entry: {entry}"
-                )
+class WriteChapters(_ResumableStep, _MeteredStep, _LLMStep, BatchNode):
+    """
+    Writes one chapter per abstraction.
 
-        # Check if all abstractions are included
-        if len(ordered_indices) != num_abstractions:
-            raise ValueError(
-                f"Ordered list length ({len(ordered_indices)}) does not match number of abstractions ({num_abstractions}). Missing indices: {set(range(num_abstractions)) - seen_indices}"
-            )
+    With ``llm_concurrency`` > 1 in shared, chapters are drafted in a
+    thread pool: each draft sees an outline of the preceding chapters
+    instead of their full text, and a cheap sequential pass afterwards
+    adds any missing prev/next links. With the default of 1 chapters are
+    written one by one, each seeing the full text of the previous ones.
 
-        print(f"Determined chapter order (indices): {ordered_indices}")
-        return ordered_indices  # Return the list of indices
+    Chapters whose chapter_key matches one from the previous tutorial
+    (--incremental) or from the run's checkpoint (--resume) are not
+    rewritten; with a checkpoint, every new chapter is saved as it is done.
+    """
 
-    def post(self, shared, prep_res, exec_res):
-        # exec_res is already the list of ordered indices
-        shared["chapter_order"] = exec_res  # List of indices
+    output_key = "chapters"
 
+    def __init__(self, max_retries=1, wait=0, retry_policy=None):
+        super().__init__(max_retries=max_retries, wait=wait, retry_policy=retry_policy)
+        self.concurrency = 1
 
-class WriteChapters(BatchNode):
     def prep(self, shared):
         chapter_order = shared["chapter_order"]  # List of indices
         abstractions = shared[
@@ -547,6 +933,20 @@ class WriteChapters(BatchNode):
         project_name = shared["project_name"]
         language = shared.get("language", "english")
         use_cache = shared.get("use_cache", True)  # Get use_cache flag, default to True
+        self.concurrency = max(1, int(shared.get("llm_concurrency", 1)))
+        # Contents are loaded in exec, only for chapters actually written
+        self.files_data = files_data
+        hashes = shared.get("file_hashes", {})
+        # Chapters of the previous run (--incremental) or already written
+        # by this one before it was interrupted (--resume), by chapter_key
+        previous_chapters = {
+            chapter["key"]: chapter["content"]
+            for chapter in (shared.get("previous_manifest") or {}).get("chapters", [])
+        }
+        self.checkpoint = shared.get("checkpoint")
+        if self.checkpoint is not None:
+            previous_chapters.update(self.checkpoint.chapters())
+        parallel = self.concurrency > 1
 
         # Get already written chapters to provide context
         # We store them temporarily during the batch run, not in shared memory yet
@@ -582,6 +982,7 @@ class WriteChapters(BatchNode):
         full_chapter_listing = "\n".join(all_chapters)
 
         items_to_process = []
+        outline_so_far = []  # Planned (not written) chapters, used as context by parallel drafts
         for i, abstraction_index in enumerate(chapter_order):
             if 0 <= abstraction_index < len(abstractions):
                 abstraction_details = abstractions[
@@ -589,10 +990,8 @@ class WriteChapters(BatchNode):
                 ]  # Contains potentially translated name/desc
                 # Use 'files' (list of indices) directly
                 related_file_indices = abstraction_details.get("files", [])
-                # Get content using helper, passing indices
-                related_files_content_map = get_content_for_indices(
-                    files_data, related_file_indices
-                )
+                # Paths only: chapter_key needs no contents, exec loads them
+                related_files = get_paths_for_indices(files_data, related_file_indices)
 
                 # Get previous chapter info for transitions (uses potentially translated name)
                 prev_chapter = None
@@ -611,7 +1010,7 @@ class WriteChapters(BatchNode):
                         "chapter_num": i + 1,
                         "abstraction_index": abstraction_index,
                         "abstraction_details": abstraction_details,  # Has potentially translated name/desc
-                        "related_files_content_map": related_files_content_map,
+                        "related_files": related_files,  # (index, path) pairs
                         "project_name": shared["project_name"],  # Add project name
                         "full_chapter_listing": full_chapter_listing,  # Add the full chapter listing (uses potentially translated names)
                         "chapter_filenames": chapter_filenames,  # Add chapter filenames mapping (uses potentially translated names)
@@ -619,17 +1018,63 @@ class WriteChapters(BatchNode):
                         "next_chapter": next_chapter,  # Add next chapter info (uses potentially translated name)
                         "language": language,  # Add language for multi-language support
                         "use_cache": use_cache, # Pass use_cache flag
+                        "parallel": parallel,  # Draft without waiting for previous chapters
+                        "previous_chapters_outline": "\n---\n".join(outline_so_far),
                         # previous_chapters_summary will be added dynamically in exec
                     }
                 )
+                item = items_to_process[-1]
+                item["chapter_key"] = chapter_key(
+                    item, hashes, [path for _, path in related_files]
+                )
+                # Unchanged abstraction, files and position: copy the old chapter
+                item["reused_content"] = previous_chapters.get(item["chapter_key"])
+                outline_so_far.append(
+                    f"Chapter {i + 1}: {abstraction_details['name']}\n{abstraction_details['description']}"
+                )
             else:
                 print(
                     f"Warning: Invalid abstraction index {abstraction_index} in chapter_order. Skipping."
                 )
 
-        print(f"Preparing to write {len(items_to_process)} chapters...")
+        mode = f"{self.concurrency} in parallel" if parallel else "sequentially"
+        print(f"Preparing to write {len(items_to_process)} chapters ({mode})...")
         return items_to_process  # Iterable for BatchNode
 
+    def _exec(self, items):
+        if self.concurrency <= 1 or not items:
+            return super()._exec(items)
+
+        # Draft all chapters concurrently; map() keeps results in chapter order.
+        # Retries happen per LLM call, inside the RetryPolicy.
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            drafts = list(pool.map(self.exec, items))
+
+        # Cheap sequential pass: drafts never saw their neighbours, so make sure
+        # each one links to the previous and next chapter.
+        chapters = [
+            self._ensure_transitions(draft, item) for draft, item in zip(drafts, items)
+        ]
+        self.chapters_written_so_far = list(chapters)
+        return chapters
+
+    @staticmethod
+    def _ensure_transitions(chapter_content, item):
+        prev_chapter = item.get("prev_chapter")
+        next_chapter = item.get("next_chapter")
+        # Other languages get bare links rather than English sentences
+        previous_text, next_text = TRANSITION_TEXT.get(
+            item.get("language", "english").lower(), ("← {link}", "→ {link}")
+        )
+        if prev_chapter and f"({prev_chapter['filename']})" not in chapter_content:
+            heading, _, body = chapter_content.partition("\n")
+            link = f"[{prev_chapter['name']}]({prev_chapter['filename']})"
+            chapter_content = f"{heading}\n\n{previous_text.format(link=link)}\n{body}"
+        if next_chapter and f"({next_chapter['filename']})" not in chapter_content:
+            link = f"[{next_chapter['name']}]({next_chapter['filename']})"
+            chapter_content = chapter_content.rstrip("\n") + f"\n\n{next_text.format(link=link)}\n"
+        return chapter_content
+
     def exec(self, item):
         # This runs for each item prepared above
         abstraction_name = item["abstraction_details"][
@@ -642,17 +1087,26 @@ class WriteChapters(BatchNode):
         project_name = item.get("project_name")
         language = item.get("language", "english")
         use_cache = item.get("use_cache", True) # Read use_cache from item
+        if item.get("reused_content") is not None:
+            print(f"Reusing chapter {chapter_num} ({abstraction_name}) from the previous run.")
+            if not item.get("parallel"):
+                self.chapters_written_so_far.append(item["reused_content"])
+            return item["reused_content"]
         print(f"Writing chapter {chapter_num} for: {abstraction_name} using LLM...")
 
-        # Prepare file context string from the map
+        # Prepare file context string, loading the files of this chapter only
         file_context_str = "\n\n".join(
-            f"--- File: {idx_path.split('# ')[1] if '# ' in idx_path else idx_path} ---\n{content}"
-            for idx_path, content in item["related_files_content_map"].items()
+            f"--- File: {path} ---\n{self.files_data[i][1]}"
+            for i, path in item["related_files"]
         )
 
         # Get summary of chapters written *before* this one
-        # Use the temporary instance variable
-        previous_chapters_summary = "\n---\n".join(self.chapters_written_so_far)
+        if item.get("parallel"):
+            # Parallel drafts can't wait for earlier chapters: use their planned outline
+            previous_chapters_summary = item["previous_chapters_outline"]
+        else:
+            # Use the temporary instance variable
+            previous_chapters_summary = "\n---\n".join(self.chapters_written_so_far)
 
         # Add language instruction and context notes only if not English
         language_instruction = ""
@@ -726,7 +1180,7 @@ Instructions for the chapter (Generate content in {language.capitalize()} unless
 
 Now, directly provide a super beginner-friendly Markdown output (DON'T need ```markdown``` tags):
 """
-        chapter_content = call_llm(prompt, use_cache=(use_cache and self.cur_retry == 0)) # Use cache only if enabled and not retrying
+        chapter_content = self.ask_llm(prompt, use_cache, label=f"WriteChapters chapter {chapter_num}")
         # Basic validation/cleanup
         actual_heading = f"# Chapter {chapter_num}: {abstraction_name}"  # Use potentially translated name
         if not chapter_content.strip().startswith(f"# Chapter {chapter_num}"):
@@ -740,20 +1194,30 @@ Now, directly provide a super beginner-friendly Markdown output (DON'T need ```m
             else:  # Otherwise, prepend it
                 chapter_content = f"{actual_heading}\n\n{chapter_content}"
 
+        checkpoint = getattr(self, "checkpoint", None)
+        if checkpoint is not None:
+            checkpoint.save_chapter(item["chapter_key"], chapter_content)
+
         # Add the generated content to our temporary list for the next iteration's context
-        self.chapters_written_so_far.append(chapter_content)
+        # (parallel drafts are collected in order by _exec instead)
+        if not item.get("parallel"):
+            self.chapters_written_so_far.append(chapter_content)
 
         return chapter_content  # Return the Markdown string (potentially translated)
 
     def post(self, shared, prep_res, exec_res_list):
         # exec_res_list contains the generated Markdown for each chapter, in order
         shared["chapters"] = exec_res_list
-        # Clean up the temporary instance variable
+        shared["chapter_keys"] = [item["chapter_key"] for item in prep_res]
+        # Clean up the temporary instance variables
         del self.chapters_written_so_far
+        del self.files_data
         print(f"Finished writing {len(exec_res_list)} chapters.")
 
 
-class CombineTutorial(Node):
+class CombineTutorial(_ResumableStep, _MeteredStep, Node):
+    output_key = "final_output_dir"
+
     def prep(self, shared):
         project_name = shared["project_name"]
         output_base_dir = shared.get("output_dir", "output")  # Default output dir
@@ -772,6 +1236,20 @@ class CombineTutorial(Node):
         chapters_content = shared[
             "chapters"
         ]  # list of strings -> content potentially translated
+        chapter_keys = shared.get("chapter_keys", [])
+
+        # --incremental: leave files alone whose inputs didn't change
+        previous = shared.get("previous_manifest") or {}
+        diagram_format = shared.get("diagram_format", DEFAULT_DIAGRAM_FORMAT)
+        # Switching the diagram format rewrites every diagram reference
+        same_format = previous.get("diagram_format", LEGACY_DIAGRAM_FORMAT) == diagram_format
+        index_unchanged = bool(previous) and same_format and all(
+            previous.get(key) == shared[key]
+            for key in ("abstractions", "relationships", "chapter_order")
+        )
+        previous_keys = (
+            {chapter["key"] for chapter in previous.get("chapters", [])} if same_format else set()
+        )
 
         # --- Generate Mermaid Diagram ---
         mermaid_lines = ["flowchart TD"]
@@ -838,7 +1316,11 @@ class CombineTutorial(Node):
 
 
                 # Store filename and corresponding content
-                chapter_files.append({"filename": filename, "content": chapter_content})
+                chapter_files.append({
+                    "filename": filename,
+                    "content": chapter_content,
+                    "unchanged": i < len(chapter_keys) and chapter_keys[i] in previous_keys,
+                })
             else:
                 print(
                     f"Warning: Mismatch between chapter order, abstractions, or content at index {i} (abstraction index {abstraction_index}). Skipping file generation for this entry."
@@ -847,60 +1329,122 @@ class CombineTutorial(Node):
         # Add attribution to index content (using English fixed string)
         index_content += f"\n\n---\n\nGenerated"
 
+        # Manifest for the next --incremental run; only real runs have file hashes
+        manifest = None
+        if "file_hashes" in shared:
+            manifest = {
+                "settings": {key: shared.get(key) for key in REUSE_SETTINGS},
+                "files": shared["file_hashes"],
+                "abstractions": abstractions,
+                "relationships": relationships_data,
+                "chapter_order": chapter_order,
+                "diagram_format": diagram_format,
+                "chapters": [
+                    {"key": key, "content": content}
+                    for key, content in zip(chapter_keys, chapters_content)
+                ],
+            }
+
         return {
             "output_path": output_path,
             "index_content": index_content,
-            "chapter_files": chapter_files,  # List[{"filename","content"}]
+            "chapter_files": chapter_files,  # List[{"filename","content","unchanged"}]
             "arch_mermaid": mermaid_diagram,  # ← новая строка
+            "index_unchanged": index_unchanged,
+            "manifest": manifest,
+            "diagram_format": diagram_format,
+            "render_workers": shared.get("render_workers", DEFAULT_RENDER_WORKERS),
+            "diagram_cache_dir": shared.get("diagram_cache_dir"),
+            "diagram_cache_quota_mb": shared.get("diagram_cache_quota_mb", DEFAULT_DIAGRAM_QUOTA_MB),
         }
 
     def exec(self, prep_res):
         out = Path(prep_res["output_path"])
         out.mkdir(parents=True, exist_ok=True)
 
-        # ---------- 1. архитектурная схема ----------
-        arch_mmd = out / "diagram.mmd"
-        arch_png = out / "diagram.png"
-        arch_mmd.write_text(prep_res["arch_mermaid"], encoding="utf-8")
-        png_ok = generate_mermaid_png(arch_mmd, arch_png)
-        if png_ok:
-            print(f"  - Generated {arch_png}")
-        else:
-            print("  - Skipped PNG generation for architecture diagram.")
+        write_index = not (prep_res.get("index_unchanged") and (out / "index.md").exists())
+        if not write_index:
+            # Abstractions and relationships are the same as last run
+            print("  - Abstractions and relationships unchanged; kept index.md and diagram.")
 
-        # ---------- 2. формируем index.md ----------
-        index_src = prep_res["index_content"]
+        chapters = []
+        for ch in prep_res["chapter_files"]:
+            if ch.get("unchanged") and (out / ch["filename"]).exists():
+                print(f"  - Kept {out / ch['filename']} (unchanged)")
+            else:
+                chapters.append(ch)
+
+        # ---------- 1. все диаграммы туториала — одним пакетом ----------
+        fmt = prep_res.get("diagram_format", DEFAULT_DIAGRAM_FORMAT)
+        jobs = []
+        arch_image = out / f"diagram.{fmt}"
+        if write_index and fmt != CLIENT_FORMAT:
+            arch_mmd = out / "diagram.mmd"
+            arch_mmd.write_text(prep_res["arch_mermaid"], encoding="utf-8")
+            # Always re-rendered: the file name doesn't change with the diagram
+            arch_image.unlink(missing_ok=True)
+            jobs.append((arch_mmd, arch_image))
+        rewriter = MermaidRewriter(out, fmt=fmt)
+        for ch in chapters:
+            jobs.extend(rewriter.jobs(ch["content"].splitlines()))
+        cache = None
+        if prep_res.get("diagram_cache_dir"):
+            # Shared by all tutorials; keyed by source, mermaid-cli version and theme
+            cache = DiagramCache(
+                prep_res["diagram_cache_dir"],
+                prep_res["diagram_cache_quota_mb"] * 1024 * 1024,
+                version=mermaid_cli_version(),
+                theme=MERMAID_THEME,
+            )
+        renderer = MermaidRenderer(
+            generate_mermaid_png,
+            generate_mermaid_batch,
+            max_workers=prep_res["render_workers"],
+            cache=cache,
+        )
+        rendered = renderer.render(jobs)
 
-        if png_ok:
-            # Заменяем ТОЛЬКО первый ```mermaid``` на картинку
-            new, skip, done = [], False, False
-            for ln in index_src.splitlines():
-                if ln.strip().startswith("```mermaid") and not done:
-                    new.append("![Architecture Diagram](diagram.png)")
-                    skip, done = True, True
-                    continue
-                if skip:
-                    if ln.strip().startswith("```"):
-                        skip = False
-                    continue
-                new.append(ln)
-            index_src = "\n".join(new)
-
-        # ‼️ Больше НЕ вызываем render_mermaid_blocks для index.md —
-        # второй (и любые последующие) блоки остаются как есть
-        (out / "index.md").write_text(index_src, encoding="utf-8")
-        print(f"  - Wrote {out / 'index.md'}")
+        if write_index:
+            self._write_index(out, prep_res, arch_image if arch_image in rendered else None)
 
         # ---------- 3. главы ----------
-        for ch in prep_res["chapter_files"]:
-            processed = render_mermaid_blocks(
-                ch["content"], out, generate_mermaid_png
-            )
-            (out / ch["filename"]).write_text(processed, encoding="utf-8")
+        for ch in chapters:
+            # Diagrams were rendered above; blocks without an image stay as code
+            with open(out / ch["filename"], "w", encoding="utf-8") as fh:
+                rewriter.write(ch["content"].splitlines(), fh)
             print(f"  - Wrote {out / ch['filename']}")
 
+        if prep_res.get("manifest") is not None:
+            save_manifest(str(out), prep_res["manifest"])
+
         return str(out)
 
+    def _write_index(self, out, prep_res, arch_image):
+        # ---------- 1. архитектурная схема ----------
+        client = prep_res.get("diagram_format") == CLIENT_FORMAT
+        if arch_image is not None:
+            print(f"  - Generated {arch_image}")
+        elif client:
+            print("  - Architecture diagram is rendered in the browser (mermaid.js).")
+        else:
+            print("  - Skipped image generation for architecture diagram.")
+
+        # ---------- 2. формируем index.md ----------
+        index_src = prep_res["index_content"]
+
+        with open(out / "index.md", "w", encoding="utf-8") as fh:
+            if arch_image is not None:
+                # Заменяем ТОЛЬКО первый ```mermaid``` на картинку;
+                # второй (и любые последующие) блоки остаются как есть
+                MermaidRewriter(
+                    out, first_block_image=f"![Architecture Diagram]({arch_image.name})"
+                ).write(index_src.splitlines(), fh)
+            elif client:
+                MermaidRewriter(out, fmt=CLIENT_FORMAT).write(index_src.splitlines(), fh)
+            else:
+                fh.write(index_src)
+        print(f"  - Wrote {out / 'index.md'}")
+
     def post(self, shared, prep_res, exec_res):
         shared["final_output_dir"] = exec_res  # Store the output path
         print(f"\nTutorial generation complete! Files are in: {exec_res}")
@@ -18,7 +18,8 @@ DEFAULT_EXCLUDES: Set[str] = {
 DEFAULT_BLACKLIST: Set[str] = {
     '.venv', 'docs', 'assets', '__pycache__', '.idea', '.git','.pytest_cache'
     ,'project_dump.txt','.clinerules', '.cursorrules', '.gitignore'
-    ,'.windsurfrules', 'logs', 'llm_cache.json', '.env.sample'
+    ,'.windsurfrules', 'logs', 'llm_cache.json', 'llm_cache.json.migrated'
+    ,'llm_cache.sqlite3', 'llm_cache.sqlite3-wal', 'llm_cache.sqlite3-shm', 'llm_cache.jsonl', '.repo_mirror', '.runs', '.diagram_cache', '.env.sample'
 }
 
 DEFAULT_MAX_BYTES = 1_000_000  # 1 MiB
@@ -0,0 +1,161 @@
+# tests/bench_mermaid_blocks.py
+"""
+Микро-бенчмарк переписывания mermaid-блоков на больших Markdown-файлах:
+прежняя реализация `render_mermaid_blocks` (список `result` + "\\n".join)
+против однопроходного сканера `MermaidRewriter`, пишущего сразу в файл.
+
+Запуск:  python tests/bench_mermaid_blocks.py [число_глав]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from utils.mermaid_utils import MERMAID_PREFIXES, MermaidRewriter, _sha10  # noqa: E402
+
+
+def legacy_render_mermaid_blocks(
+    md_text: str,
+    out_dir: Path,
+    png_func: Callable[[Path, Path], bool],
+) -> str:
+    """Прежняя реализация: список `result`, повторный split кода."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    result: List[str] = []
+    in_mermaid = False
+    nested = 0
+    block: List[str] = []
+
+    for raw in md_text.splitlines():
+        stripped = raw.strip()
+
+        # ---------- открытие внешнего блока ----------
+        if not in_mermaid and stripped.startswith("```mermaid"):
+            in_mermaid = True
+            block.clear()
+            continue
+
+        # ---------- внутри mermaid-блока --------------
+        if in_mermaid:
+            # встречен ```
+            if stripped.startswith("```"):
+                # вложенный ```lang (например ```yaml)
+                if stripped != "```":
+                    nested += 1
+                    block.append(raw)
+                    continue
+
+                # закрытие вложенного блока
+                if nested:
+                    nested -= 1
+                    block.append(raw)
+                    continue
+
+                # закрываем ВНЕШНИЙ mermaid-блок
+                code = "\n".join(block).strip()
+                first = next((ln for ln in code.splitlines() if ln.strip()), "")
+
+                is_real = first.lstrip().startswith(MERMAID_PREFIXES)
+                replaced = False
+
+                if is_real:
+                    sha = _sha10(code)
+                    png_name = f"{sha}.png"
+                    png_path = out_dir / png_name
+
+                    # .mmd сохраняем независимо от результата рендера —
+                    # полезно для отладки
+                    mmd_path = out_dir / f"{sha}.mmd"
+                    if not mmd_path.exists():
+                        mmd_path.write_text(code, encoding="utf-8")
+
+                    # рендер PNG (только если ещё нет)
+                    ok = png_path.exists() or png_func(mmd_path, png_path)
+
+                    if ok:
+                        result.append(f"![Diagram]({png_name})")
+                        replaced = True
+
+                if not replaced:
+                    # либо демонстрационный блок, либо рендер упал —
+                    # возвращаем исходный блок
+                    result.append("```mermaid")
+                    result.extend(block)
+                    result.append("```")
+
+                in_mermaid = False
+                continue
+
+            # обычная строка внутри mermaid
+            block.append(raw)
+            continue
+
+        # ---------- вне mermaid-блока ------------------
+        result.append(raw)
+
+    # незакрытый mermaid в конце файла — возвращаем как есть
+    if in_mermaid:
+        result.append("```mermaid")
+        result.extend(block)
+
+    return "\n".join(result)
+
+
+def make_markdown(sections: int) -> str:
+    """Большая «глава»: текст, код, настоящие и демонстрационные диаграммы."""
+    parts = []
+    for i in range(sections):
+        parts.append(f"## Section {i}\n\n" + "Some explanatory text with `code` and **bold**.\n" * 20)
+        parts.append(f"```python\ndef f{i}():\n    return {i}\n```\n")
+        parts.append(f"```mermaid\nsequenceDiagram\n    A->>B: call {i}\n    B-->>A: result {i}\n```\n")
+        if i % 5 == 0:
+            parts.append("```mermaid\n```yaml\n- name: demo\n```\n```\n")
+    return "\n".join(parts)
+
+
+def _png(mmd_path: Path, png_path: Path) -> bool:
+    png_path.write_bytes(b"png")
+    return True
+
+
+def _best_of(runs: int, func: Callable[[], None]) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(sections: int = 2000, runs: int = 5):
+    md_text = make_markdown(sections)
+    with tempfile.TemporaryDirectory() as tmp:
+        out = Path(tmp)
+        # один прогон «вхолостую», чтобы все PNG уже лежали на диске
+        legacy_render_mermaid_blocks(md_text, out, _png)
+
+        def _legacy():
+            (out / "legacy.md").write_text(legacy_render_mermaid_blocks(md_text, out, _png), encoding="utf-8")
+
+        def _streaming():
+            with open(out / "streaming.md", "w", encoding="utf-8") as fh:
+                MermaidRewriter(out, _png, fmt="png").write(md_text.splitlines(), fh)
+
+        legacy = _best_of(runs, _legacy)
+        streaming = _best_of(runs, _streaming)
+        assert (out / "legacy.md").read_text(encoding="utf-8") == (out / "streaming.md").read_text(encoding="utf-8")
+
+    size_mb = len(md_text.encode("utf-8")) / 1e6
+    print(f"{size_mb:.1f} MB of Markdown, {sections} diagrams, best of {runs}:")
+    print(f"  legacy    {legacy * 1000:8.1f} ms")
+    print(f"  streaming {streaming * 1000:8.1f} ms  ({legacy / streaming:.2f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -5,8 +5,19 @@
 и любой импорт вида `import utils` находил наш пакет utils.
 """
 from pathlib import Path
+import atexit
+import os
+import shutil
 import sys
+import tempfile
 
 ROOT_DIR = Path(__file__).resolve().parents[1]   # на уровень выше каталога tests
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
+
+# Лог промптов utils.call_llm создаётся при импорте модуля (LOG_DIR, по
+# умолчанию ./logs): направляем его во временный каталог, чтобы тесты
+# не дописывали PROMPT/RESPONSE в логи репозитория
+_LOG_DIR = tempfile.mkdtemp(prefix="llm-logs-")
+os.environ["LOG_DIR"] = _LOG_DIR
+atexit.register(shutil.rmtree, _LOG_DIR, True)
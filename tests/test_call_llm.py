@@ -0,0 +1,234 @@
+# tests/test_call_llm.py
+"""
+Проверяем слой клиентов call_llm: одна HTTP-сессия и один genai.Client
+на ключ переиспользуются между вызовами и потоками; потоковый режим
+читает SSE/фрагменты, соблюдает таймаут простоя и обрывает ответ без ```yaml.
+"""
+import json
+import threading
+import time
+
+import pytest
+
+import utils.call_llm as cl
+from utils.retry import MalformedOutputError
+
+
+@pytest.fixture(autouse=True)
+def _fresh_clients(monkeypatch):
+    monkeypatch.setattr(cl, "_http_session", None)
+    monkeypatch.setattr(cl, "_genai_clients", {})
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self._text = text
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"choices": [{"message": {"content": self._text}}]}
+
+
+# ---------- 1. одна сессия на все потоки ----------------------------------
+def test_http_session_is_shared_across_threads():
+    sessions = []
+    threads = [
+        threading.Thread(target=lambda: sessions.append(cl.get_http_session()))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len({id(s) for s in sessions}) == 1
+    adapter = sessions[0].get_adapter("https://openrouter.ai")
+    assert adapter._pool_maxsize == cl.HTTP_POOL_SIZE
+
+
+# ---------- 2. OpenRouter идёт через общую сессию -------------------------
+def test_openrouter_calls_reuse_session(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "key")
+    monkeypatch.setenv("LLM_STREAM", "0")
+    session = cl.get_http_session()
+    calls = []
+
+    def _fake_post(url, **kwargs):
+        calls.append(kwargs["json"]["messages"][0]["content"])
+        return _FakeResponse("ok")
+
+    monkeypatch.setattr(session, "post", _fake_post)
+
+    assert cl.call_llm("one", use_cache=False) == "ok"
+    assert cl.call_llm("two", use_cache=False) == "ok"
+    assert calls == ["one", "two"]
+    assert cl.get_http_session() is session
+
+
+# ---------- 3. genai.Client кешируется по ключу ---------------------------
+def test_genai_client_cached_per_key(monkeypatch):
+    created = []
+
+    class _FakeClient:
+        def __init__(self, api_key):
+            created.append(api_key)
+
+    monkeypatch.setattr(cl.genai, "Client", _FakeClient)
+
+    a1 = cl.get_genai_client("A")
+    a2 = cl.get_genai_client("A")
+    b = cl.get_genai_client("B")
+
+    assert a1 is a2 and a1 is not b
+    assert created == ["A", "B"]
+
+
+# ---------- 4. Потоковый режим --------------------------------------------
+class _FakeStream:
+    def __init__(self, lines, read):
+        self._lines = lines
+        self._read = read
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self):
+        for line in self._lines:
+            self._read.append(line)
+            yield line
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def _sse(*texts):
+    lines = [b": OPENROUTER PROCESSING", b""]
+    for text in texts:
+        chunk = {"choices": [{"delta": {"content": text}}]}
+        lines += [b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8"), b""]
+    return lines + [b"data: [DONE]"]
+
+
+def test_openrouter_stream_uses_idle_timeout(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "key")
+    monkeypatch.setenv("LLM_IDLE_TIMEOUT", "45")
+    session = cl.get_http_session()
+    requests_made = []
+
+    def _fake_post(url, **kwargs):
+        requests_made.append(kwargs)
+        return _FakeStream(_sse("При", "вет", "!"), [])
+
+    monkeypatch.setattr(session, "post", _fake_post)
+
+    assert list(cl.stream_llm("hi", use_cache=False)) == ["При", "вет", "!"]
+    assert cl.call_llm("hi", use_cache=False) == "Привет!"
+    assert requests_made[0]["json"]["stream"] is True
+    assert requests_made[0]["stream"] is True
+    assert requests_made[0]["timeout"] == (cl.CONNECT_TIMEOUT, 45.0)
+
+
+def test_stream_without_yaml_fence_is_aborted_early(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "key")
+    monkeypatch.setenv("LLM_FENCE_WINDOW", "20")
+    session = cl.get_http_session()
+    read = []
+    monkeypatch.setattr(
+        session, "post", lambda url, **kwargs: _FakeStream(_sse(*["I think that "] * 50), read)
+    )
+
+    with pytest.raises(MalformedOutputError):
+        cl.call_llm("list", use_cache=False, expect_fence="yaml")
+    # оборвали после двух фрагментов, остальные 48 не читали
+    assert len(read) < 10
+
+
+def test_stream_with_yaml_fence_is_read_to_the_end(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "key")
+    monkeypatch.setenv("LLM_FENCE_WINDOW", "5")
+    session = cl.get_http_session()
+    monkeypatch.setattr(
+        session, "post", lambda url, **kwargs: _FakeStream(_sse("```yaml\n", "- 1\n", "```"), [])
+    )
+
+    assert cl.call_llm("list", use_cache=False, expect_fence="yaml") == "```yaml\n- 1\n```"
+
+
+def test_gemini_stream_idle_timeout(monkeypatch):
+    monkeypatch.delenv("OPENROUTER_API_KEY", raising=False)
+    monkeypatch.setenv("LLM_IDLE_TIMEOUT", "0.2")
+
+    class _Chunk:
+        def __init__(self, text):
+            self.text = text
+
+    class _FakeModels:
+        def generate_content_stream(self, model, contents):
+            yield _Chunk("начало")
+            time.sleep(1)  # модель «зависла»
+            yield _Chunk("конец")
+
+    class _FakeClient:
+        models = _FakeModels()
+
+    monkeypatch.setattr(cl, "get_genai_client", lambda api_key: _FakeClient())
+
+    stream = cl.stream_llm("hi", use_cache=False)
+    assert next(stream) == "начало"
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        next(stream)
+    assert time.monotonic() - started < 0.9
+
+
+def test_gemini_stream_closed_on_idle_timeout(monkeypatch):
+    monkeypatch.delenv("OPENROUTER_API_KEY", raising=False)
+    monkeypatch.setenv("LLM_IDLE_TIMEOUT", "0.2")
+
+    class _Chunk:
+        text = "фрагмент"
+
+    class _HungStream:
+        """Ответ genai: следующий фрагмент не придёт, пока поток не закрыт."""
+
+        def __init__(self):
+            self.closed = threading.Event()
+            self.reads = 0
+
+        def __iter__(self):
+            return self
+
+        def __next__(self):
+            self.reads += 1
+            if self.reads > 1:
+                self.closed.wait(5)
+            if self.closed.is_set():
+                raise StopIteration
+            return _Chunk()
+
+        def close(self):
+            self.closed.set()
+
+    response = _HungStream()
+
+    class _FakeModels:
+        def generate_content_stream(self, model, contents):
+            return response
+
+    class _FakeClient:
+        models = _FakeModels()
+
+    monkeypatch.setattr(cl, "get_genai_client", lambda api_key: _FakeClient())
+
+    stream = cl.stream_llm("hi", use_cache=False)
+    assert next(stream) == "фрагмент"
+    with pytest.raises(TimeoutError):
+        next(stream)
+    assert response.closed.is_set()
+    time.sleep(0.1)
+    assert response.reads == 2  # фоновый поток больше не читает
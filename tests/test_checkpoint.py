@@ -0,0 +1,177 @@
+# tests/test_checkpoint.py
+"""
+Контрольные точки прогона и продолжение по --resume.
+
+Проверяем, что:
+  1. файлы, результаты шагов и главы сохраняются и восстанавливаются;
+  2. после падения на середине WriteChapters повторный прогон не вызывает
+     LLM для завершённых шагов и уже написанных глав;
+  3. файлы из зеркала не копируются, а завершённый прогон удаляет свой каталог.
+"""
+from pathlib import Path
+
+import pytest
+
+import nodes
+from utils.checkpoint import RUNS_DIR_NAME, RunCheckpoint
+
+
+def _inputs(src, out):
+    return {
+        "repo_url": None,
+        "local_dir": str(src),
+        "project_name": "demo",
+        "output_dir": str(out),
+        "include_patterns": {"*.py"},
+        "exclude_patterns": set(),
+        "max_file_size": 100_000,
+        "language": "english",
+        "max_abstraction_num": 10,
+        "use_cache": False,
+        "quiet": True,
+    }
+
+
+def _make_src(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.py").write_text("def alpha():\n    return 1\n", encoding="utf-8")
+    (src / "b.py").write_text("def beta():\n    return 2\n", encoding="utf-8")
+    return src
+
+
+# ---------- 1. Сохранение и восстановление ---------------------------------
+def test_round_trip(tmp_path):
+    checkpoint = RunCheckpoint.create(str(tmp_path), {"language": "english"})
+    shared = {
+        "files": [("a.py", "print('a')\n"), ("b.py", "привет\n")],
+        "file_hashes": {"a.py": "h1", "b.py": "h2"},
+        "project_name": "demo",
+        "abstractions": [{"name": "Alpha", "description": "A", "files": [0]}],
+    }
+    checkpoint.save_output("files", shared)
+    checkpoint.save_output("abstractions", shared)
+    checkpoint.save_chapter("key1", "# Chapter 1\n")
+
+    resumed = RunCheckpoint.open(str(tmp_path), checkpoint.run_id)
+    assert resumed.load_inputs() == {"language": "english"}
+    assert resumed.chapters() == {"key1": "# Chapter 1\n"}
+
+    restored = {}
+    reusable = resumed.restore(restored)
+    assert list(reusable["files"]) == shared["files"]
+    assert reusable["abstractions"] == shared["abstractions"]
+    assert restored["file_hashes"] == shared["file_hashes"]
+    assert restored["project_name"] == "demo"
+    assert "relationships" not in reusable
+
+
+def test_open_unknown_run(tmp_path):
+    with pytest.raises(ValueError):
+        RunCheckpoint.open(str(tmp_path), "missing")
+
+
+# ---------- 2. Продолжение после падения -----------------------------------
+def test_resume_after_failed_chapter(tmp_path, monkeypatch):
+    src = _make_src(tmp_path)
+    out = tmp_path / "out"
+    llm_calls = []
+    failing = {'about the concept: "Beta"'}
+
+    def _fake_llm(prompt, use_cache=True):
+        llm_calls.append(prompt)
+        if any(marker in prompt for marker in failing):
+            raise RuntimeError("LLM unavailable")
+        return "# Chapter: X\n\nbody"
+
+    def _fake_png(mmd_path, png_path):
+        Path(png_path).write_bytes(b"png")
+        return True
+
+    monkeypatch.setattr(nodes, "call_llm", _fake_llm)
+    monkeypatch.setattr(nodes, "generate_mermaid_png", _fake_png)
+
+    # Первый прогон: шаги с LLM до WriteChapters подменены готовыми результатами
+    shared = _inputs(src, out)
+    checkpoint = RunCheckpoint.create(str(out), {"language": "english"})
+    shared["checkpoint"] = checkpoint
+    nodes.FetchRepo()._run(shared)
+    shared["abstractions"] = [
+        {"name": "Alpha", "description": "A", "files": [0]},
+        {"name": "Beta", "description": "B", "files": [1]},
+    ]
+    shared["relationships"] = {"summary": "S", "details": [{"from": 0, "to": 1, "label": "uses"}]}
+    shared["chapter_order"] = [0, 1]
+    for key in ("abstractions", "relationships", "chapter_order"):
+        checkpoint.save_output(key, shared)
+
+    with pytest.raises(RuntimeError):
+        nodes.WriteChapters()._run(shared)
+    assert len(checkpoint.chapters()) == 1
+    assert not checkpoint.has_output("chapters")
+    assert (out / RUNS_DIR_NAME / checkpoint.run_id / "files.json").is_file()
+
+    # Повторный прогон: всё до второй главы берётся из контрольной точки
+    failing.clear()
+    llm_calls.clear()
+    resumed = _inputs(src, out)
+    resumed["project_name"] = None
+    run = RunCheckpoint.open(str(out), checkpoint.run_id)
+    run.restore(resumed)
+    resumed["checkpoint"] = run
+    for node_cls in (nodes.FetchRepo, nodes.IdentifyAbstractions, nodes.AnalyzeRelationships,
+                     nodes.OrderChapters, nodes.WriteChapters, nodes.CombineTutorial):
+        node_cls()._run(resumed)
+
+    assert resumed["project_name"] == "demo"
+    # Только вторая глава: первая и все шаги до WriteChapters взяты из контрольной точки
+    assert len(llm_calls) == 1 and 'about the concept: "Beta"' in llm_calls[0]
+    assert len(resumed["chapters"]) == 2
+    assert run.has_output("chapters") and run.has_output("final_output_dir")
+    assert (out / "demo" / "index.md").is_file()
+
+
+# ---------- 3. без лишних копий и без мусора --------------------------------
+def test_mirrored_files_are_referenced_not_copied(tmp_path):
+    from utils.file_table import LazyFileTable
+    from utils.repo_mirror import RepoMirror
+
+    mirror = RepoMirror(str(tmp_path / "mirror"))
+    files = LazyFileTable.from_blob_store(mirror, {"a.py": "print('a')\n", "b.py": "b = 2\n"})
+    checkpoint = RunCheckpoint.create(str(tmp_path / "out"), {})
+    checkpoint.save_output("files", {"files": files, "file_hashes": {}, "project_name": "demo"})
+
+    assert not Path(checkpoint.blobs.blob_dir).exists()
+    restored = {}
+    RunCheckpoint.open(str(tmp_path / "out"), checkpoint.run_id).restore(restored)
+    assert list(restored["reusable_outputs"]["files"]) == list(files)
+
+
+def test_completed_run_removes_its_checkpoint(tmp_path, monkeypatch):
+    import main
+
+    class _Flow:
+        def run(self, shared):
+            shared["final_output_dir"] = "done"
+
+    monkeypatch.setattr(main, "create_tutorial_flow", lambda: _Flow())
+    checkpoint = RunCheckpoint.create(str(tmp_path), {})
+    main.run_flow({}, checkpoint)
+
+    assert not Path(checkpoint.run_dir).exists()
+    assert list((tmp_path / RUNS_DIR_NAME / "reports").glob(f"{checkpoint.run_id}-*.json"))
+
+
+def test_failed_run_keeps_its_checkpoint(tmp_path, monkeypatch):
+    import main
+
+    class _Flow:
+        def run(self, shared):
+            raise RuntimeError("LLM unavailable")
+
+    monkeypatch.setattr(main, "create_tutorial_flow", lambda: _Flow())
+    checkpoint = RunCheckpoint.create(str(tmp_path), {})
+    with pytest.raises(RuntimeError):
+        main.run_flow({}, checkpoint)
+
+    assert Path(checkpoint.run_dir, "inputs.json").is_file()
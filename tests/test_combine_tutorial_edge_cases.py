@@ -23,6 +23,7 @@ def _minimal_shared(tmp_path):
     return {
         "project_name": "demo_project",
         "output_dir": str(tmp_path),
+        "diagram_format": "png",
         "repo_url": "https://example.com/repo",
         "relationships": {
             "summary": "Demo summary",
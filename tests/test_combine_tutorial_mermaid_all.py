@@ -37,6 +37,7 @@ def test_chapter_png_and_second_block_kept(tmp_path, monkeypatch):
     shared = {
         "project_name": "merdemo",
         "output_dir": str(tmp_path),
+        "diagram_format": "png",
         "repo_url": "https://ex/repo",
         "relationships": {"summary": "Sum", "details": [{"from": 0, "to": 0, "label": "Self"}]},
         "chapter_order": [0],
@@ -74,6 +75,7 @@ def test_identical_mermaid_code_reuses_png(tmp_path, monkeypatch):
     shared = {
         "project_name": "reuse_demo",
         "output_dir": str(tmp_path),
+        "diagram_format": "png",
         "repo_url": "https://ex/repo",
         "relationships": {"summary": "S", "details": [{"from": 0, "to": 1, "label": "L"}]},
         "chapter_order": [0, 1],
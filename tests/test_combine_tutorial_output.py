@@ -29,6 +29,7 @@ def test_combine_tutorial_creates_markdown_and_png(tmp_path, monkeypatch):
     shared = {
         "project_name": "demo_project",
         "output_dir": str(tmp_path),                     # пишем в temp-каталог
+        "diagram_format": "png",
         "repo_url": "https://example.com/repo",
 
         "relationships": {
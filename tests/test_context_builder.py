@@ -0,0 +1,74 @@
+# tests/test_context_builder.py
+"""
+Упаковка контекста для IdentifyAbstractions в бюджет токенов.
+"""
+from utils.context_builder import (
+    build_context,
+    estimate_tokens,
+    extract_signatures,
+    score_files,
+    shard_files,
+)
+
+
+def _files():
+    return [
+        ("pkg/helpers.py", "def helper():\n    return 1\n" * 50),
+        ("pkg/core.py", "class Core:\n    def run(self):\n        pass\n"),
+        ("main.py", "from pkg import core\ncore.Core().run()\n"),
+        ("pkg/uses_core.py", "import core\n"),
+    ]
+
+
+# ---------- 1. всё помещается — контекст полный и в исходном порядке -------
+def test_everything_fits():
+    files = _files()
+    context, file_info, report = build_context(files, token_budget=10_000)
+
+    assert report["full_count"] == 4 and report["dropped_count"] == 0
+    assert file_info == [(i, p) for i, (p, _) in enumerate(files)]
+    positions = [context.index(f"--- File Index {i}: ") for i in range(4)]
+    assert positions == sorted(positions)
+
+
+# ---------- 2. ранжирование: точка входа и fan-in выше --------------------
+def test_entry_point_and_fan_in_rank_higher():
+    scores = score_files(_files())
+    helpers, core, main, _ = scores
+    assert main > helpers
+    assert core > helpers  # на core ссылаются два файла
+
+
+# ---------- 3. не влезло → сигнатуры или выброшено -------------------------
+def test_budget_reduces_to_signatures_and_drops():
+    files = _files()
+    small = sum(estimate_tokens(f"--- File Index {i}: {p} ---\n{c}\n\n")
+                for i, (p, c) in enumerate(files[1:], start=1))
+    context, _, report = build_context(files, token_budget=small + 20)
+
+    assert report["used_tokens"] <= report["token_budget"]
+    assert "pkg/helpers.py" in report["signature_files"] + report["dropped_files"]
+    assert "--- File Index 1: pkg/core.py ---" in context
+
+
+def test_extract_signatures_keeps_declarations_only():
+    src = "import os\n\nclass A:\n    x = 1\n    def f(self):\n        return 2\n"
+    assert extract_signatures(src) == "class A:\n    def f(self):"
+
+
+# ---------- 4. шардирование по каталогам ----------------------------------
+def test_shard_files_groups_by_directory_within_budget():
+    files = [
+        ("b/x.py", "x" * 400),
+        ("a/one.py", "1" * 400),
+        ("b/y.py", "y" * 400),
+        ("a/two.py", "2" * 400),
+        ("big.py", "z" * 4000),
+    ]
+    shards = shard_files(files, token_budget=250)
+
+    assert sorted(i for shard in shards for i in shard) == list(range(5))
+    # каталог a/ целиком в одном шарде, b/ — в другом
+    assert [1, 3] in shards and [0, 2] in shards
+    # файл больше бюджета — отдельный шард
+    assert [4] in shards
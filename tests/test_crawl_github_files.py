@@ -0,0 +1,411 @@
+# tests/test_crawl_github_files.py
+"""
+crawl_github_files против локального HTTP-сервера, изображающего GitHub API.
+
+Проверяем:
+  1. Параллельная загрузка находит все файлы, фильтры и лимит размера
+     работают, результат упорядочен по пути.
+  2. Загрузки действительно идут одновременно (ограничено max_workers).
+  3. Rate limit: одна глобальная пауза до X-RateLimit-Reset, после чего
+     запрос повторяется.
+  4. Листинг одним запросом Git Trees API; при truncated — обход /contents.
+  5. Режим tarball: один потоковый запрос архива, фильтры применяются на лету.
+  6. Shallow/sparse клон для git-URL.
+  7. Локальное зеркало: повторный запуск на том же коммите не качает файлы,
+     URL с SHA не делает ни одного запроса, LRU-вытеснение по квоте.
+"""
+import io
+import json
+import subprocess
+import tarfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from utils.crawl_github_files import RateLimiter, crawl_github_files
+from utils.repo_mirror import RepoMirror
+
+REPO_FILES = {
+    "README.md": "# Demo",
+    "src/app.py": "print('app')",
+    "src/util/helpers.py": "def helper(): pass",
+    "src/util/big.py": "x" * 5000,
+    "tests/test_app.py": "def test(): pass",
+    "docs/guide.txt": "guide",
+}
+COMMIT = "c0ffee" + "0" * 34
+
+
+class FakeGitHub:
+    """Минимальный GitHub: /contents, /git/trees, raw-загрузка, счётчики и rate limit."""
+
+    def __init__(self, files):
+        self.files = files
+        self.requests = []
+        self.tree_truncated = False
+        self.rate_limit_remaining = 0  # сколько ответов 403 ещё отдать
+        self.download_delay = 0.0
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.base = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def listing(self, path):
+        prefix = f"{path}/" if path else ""
+        entries = {}
+        for fpath, content in self.files.items():
+            if not fpath.startswith(prefix):
+                continue
+            head = fpath[len(prefix):].split("/")[0]
+            full = prefix + head
+            if full == fpath:
+                entries[head] = {
+                    "type": "file", "name": head, "path": full,
+                    "size": len(content.encode()),
+                    "download_url": f"{self.base}/raw/o/r/main/{full}",
+                    "url": f"{self.base}/blob/{full}",
+                }
+            else:
+                entries.setdefault(head, {"type": "dir", "name": head, "path": full})
+        return [entries[k] for k in sorted(entries)]
+
+    def tarball(self):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+            for fpath, content in sorted(self.files.items()):
+                data = content.encode()
+                info = tarfile.TarInfo(f"o-r-abc1234/{fpath}")
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        return buf.getvalue()
+
+    def _handler(self):
+        gh = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *_):
+                pass
+
+            def _send(self, code, body, headers=None):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(code)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                with gh._lock:
+                    gh.requests.append(url.path)
+                    limited = gh.rate_limit_remaining > 0
+                    if limited:
+                        gh.rate_limit_remaining -= 1
+                if limited:
+                    return self._send(
+                        403, {"message": "API rate limit exceeded"},
+                        {"X-RateLimit-Remaining": "0",
+                         "X-RateLimit-Reset": str(int(time.time()) + 1)},
+                    )
+                gh.route(self, url.path, parse_qs(url.query))
+
+        return Handler
+
+    def route(self, handler, path, query):
+        if path == "/repos/o/r":
+            return handler._send(200, {"default_branch": "main"})
+        if path == "/repos/o/r/branches":
+            return handler._send(200, [{"name": "main"}])
+        if path in ("/repos/o/r/commits/HEAD", "/repos/o/r/commits/main"):
+            return handler._send(200, COMMIT.encode())
+        if path in ("/repos/o/r/git/trees/main", f"/repos/o/r/git/trees/{COMMIT}") \
+                and query.get("recursive") == ["1"]:
+            dirs = {p.rsplit("/", 1)[0] for p in self.files if "/" in p}
+            tree = [{"path": d, "type": "tree"} for d in sorted(dirs)] + [
+                {"path": p, "type": "blob", "size": len(c.encode())}
+                for p, c in sorted(self.files.items())
+            ]
+            return handler._send(200, {"sha": "t1", "tree": tree, "truncated": self.tree_truncated})
+        if path in ("/repos/o/r/tarball", "/repos/o/r/tarball/main", f"/repos/o/r/tarball/{COMMIT}"):
+            return handler._send(200, self.tarball(), {"Content-Type": "application/x-gzip"})
+        prefix = "/repos/o/r/contents"
+        if path.startswith(prefix):
+            sub = path[len(prefix):].strip("/")
+            if sub in self.files:
+                return handler._send(200, {
+                    "type": "file", "name": sub.split("/")[-1], "path": sub,
+                    "size": len(self.files[sub].encode()),
+                    "download_url": f"{self.base}/raw/o/r/main/{sub}",
+                })
+            listing = self.listing(sub)
+            if not listing:
+                return handler._send(404, {"message": "Not Found"})
+            return handler._send(200, listing)
+        if path.startswith("/raw/"):
+            with self._lock:
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+            time.sleep(self.download_delay)
+            with self._lock:
+                self.active -= 1
+            return handler._send(200, self.files[path.split("/", 5)[5]].encode())
+        return handler._send(404, {"message": "Not Found"})
+
+
+@pytest.fixture
+def fake_github():
+    gh = FakeGitHub(REPO_FILES)
+    yield gh
+    gh.close()
+
+
+def _crawl(gh, **kwargs):
+    return crawl_github_files(
+        "https://github.com/o/r",
+        api_base=gh.base,
+        raw_base=f"{gh.base}/raw",
+        use_relative_paths=True,
+        **kwargs,
+    )
+
+
+# ---------- 1. фильтры, лимит размера, порядок -----------------------------
+def test_parallel_crawl_collects_filtered_files(fake_github):
+    result = _crawl(
+        fake_github,
+        include_patterns={"*.py", "*.md"},
+        exclude_patterns={"tests/*"},
+        max_file_size=1000,
+    )
+
+    assert list(result["files"]) == ["README.md", "src/app.py", "src/util/helpers.py"]
+    assert result["files"]["src/app.py"] == "print('app')"
+    assert result["stats"]["skipped_files"] == [("src/util/big.py", 5000)]
+    assert result["stats"]["scanned"] == len(REPO_FILES)
+    assert result["stats"]["skipped_by_reason"] == {"pattern": 2, "size": 1}
+
+
+# ---------- 2. загрузки идут одновременно ----------------------------------
+def test_downloads_run_concurrently(fake_github):
+    fake_github.download_delay = 0.1
+    result = _crawl(fake_github, max_workers=4)
+
+    assert len(result["files"]) == len(REPO_FILES)
+    assert 1 < fake_github.peak <= 4
+
+
+# ---------- 3. глобальная пауза при rate limit ----------------------------
+def test_rate_limit_pauses_and_retries(fake_github):
+    fake_github.rate_limit_remaining = 1
+    started = time.time()
+    result = _crawl(fake_github, include_patterns={"*.md"})
+
+    assert result["files"] == {"README.md": "# Demo"}
+    assert time.time() - started >= 0.5
+    # первый (отклонённый) запрос повторён
+    assert fake_github.requests[0] == fake_github.requests[1] == "/repos/o/r"
+
+
+class _Limited:
+    status_code = 429
+    text = ""
+
+    def __init__(self, headers):
+        self.headers = headers
+
+
+@pytest.mark.parametrize("retry_after, expected", [
+    ("30", 30),
+    (lambda: formatdate(time.time() + 30, usegmt=True), 30),
+    ("soon", 1),  # не разобрать: ждём до X-RateLimit-Reset
+])
+def test_retry_after_seconds_or_http_date(retry_after, expected):
+    if callable(retry_after):
+        retry_after = retry_after()
+    limiter = RateLimiter()
+    assert limiter.update(_Limited({"Retry-After": retry_after, "X-RateLimit-Reset": "0"}))
+    assert limiter._resume_at - time.time() == pytest.approx(expected, abs=2)
+
+
+# ---------- 4. Git Trees API и откат на /contents -------------------------
+def test_tree_listing_uses_single_request(fake_github):
+    result = _crawl(fake_github, include_patterns={"*.py"}, exclude_patterns={"tests/*"})
+
+    assert result["stats"]["source"] == "git_tree"
+    assert set(result["files"]) == {"src/app.py", "src/util/helpers.py", "src/util/big.py"}
+    listing = [r for r in fake_github.requests if not r.startswith("/raw/")]
+    assert listing == ["/repos/o/r", "/repos/o/r/git/trees/main"]
+    # отфильтрованные файлы даже не запрашивались
+    assert "/raw/o/r/main/README.md" not in fake_github.requests
+
+
+def test_truncated_tree_falls_back_to_contents_walk(fake_github):
+    fake_github.tree_truncated = True
+    result = _crawl(fake_github, include_patterns={"*.py"})
+
+    assert result["stats"]["source"] == "contents_api"
+    assert "src/util/helpers.py" in result["files"]
+    assert "/repos/o/r/contents/src/util" in fake_github.requests
+
+
+# ---------- 5. режим tarball ----------------------------------------------
+def test_tarball_mode_streams_single_archive(fake_github):
+    result = _crawl(
+        fake_github,
+        fetch_mode="tarball",
+        include_patterns={"*.py", "*.md"},
+        exclude_patterns={"tests/*"},
+        max_file_size=1000,
+    )
+
+    assert fake_github.requests == ["/repos/o/r/tarball"]
+    assert result["stats"]["source"] == "tarball"
+    assert result["files"] == {
+        "README.md": "# Demo",
+        "src/app.py": "print('app')",
+        "src/util/helpers.py": "def helper(): pass",
+    }
+    assert result["stats"]["skipped_files"] == [("src/util/big.py", 5000)]
+
+
+def test_tarball_mode_respects_subdirectory(fake_github):
+    result = crawl_github_files(
+        "https://github.com/o/r/tree/main/src/util",
+        api_base=fake_github.base,
+        use_relative_paths=True,
+        fetch_mode="tarball",
+    )
+    assert set(result["files"]) == {"helpers.py", "big.py"}
+
+
+# ---------- 6. shallow/sparse клон из локального bare-репозитория ----------
+def _git(*args, cwd):
+    subprocess.run(
+        ["git", "-c", "user.email=t@t", "-c", "user.name=t", *args],
+        cwd=cwd, check=True, capture_output=True,
+    )
+
+
+@pytest.fixture
+def bare_repo(tmp_path):
+    work = tmp_path / "work"
+    for path, content in REPO_FILES.items():
+        (work / path).parent.mkdir(parents=True, exist_ok=True)
+        (work / path).write_text(content)
+    _git("init", "-q", "-b", "main", cwd=work)
+    _git("add", ".", cwd=work)
+    _git("commit", "-qm", "first", cwd=work)
+    (work / "src/app.py").write_text("print('v2')")
+    _git("commit", "-qam", "second", cwd=work)
+    _git("branch", "feature/x", "HEAD~1", cwd=work)
+    bare = tmp_path / "repo.git"
+    _git("clone", "-q", "--bare", str(work), str(bare), cwd=tmp_path)
+    _git("config", "uploadpack.allowFilter", "true", cwd=bare)
+    return bare
+
+
+def test_clone_is_shallow_and_sparse(bare_repo):
+    result = crawl_github_files(
+        f"file://{bare_repo}",
+        include_patterns={"*.py"},
+        exclude_patterns={"tests/*"},
+    )
+
+    assert result["stats"]["source"] == "git_clone"
+    assert result["files"] == {
+        "src/app.py": "print('v2')",
+        "src/util/big.py": "x" * 5000,
+        "src/util/helpers.py": "def helper(): pass",
+    }
+
+
+def test_clone_honors_ref_and_subdirectory(bare_repo):
+    result = crawl_github_files(
+        f"file://{bare_repo}/tree/feature/x/src",
+        use_relative_paths=True,
+        max_file_size=1000,
+    )
+
+    # ветка со слэшем распознана, файлы — из первого коммита, пути — от src/
+    assert result["files"] == {
+        "app.py": "print('app')",
+        "util/helpers.py": "def helper(): pass",
+    }
+    assert result["stats"]["base_path"] == "src"
+    assert result["stats"]["skipped_files"] == [("util/big.py", 5000)]
+
+
+# ---------- 7. локальное зеркало по SHA коммита ----------------------------
+def test_mirror_serves_repeat_run_without_downloads(fake_github, tmp_path):
+    mirror = RepoMirror(str(tmp_path / "mirror"))
+    first = _crawl(fake_github, include_patterns={"*.py"}, mirror=mirror)
+    assert first["stats"]["commit"] == COMMIT
+    assert f"/raw/o/r/{COMMIT}/src/app.py" in fake_github.requests
+
+    fake_github.requests.clear()
+    second = _crawl(fake_github, include_patterns={"*.py"}, mirror=mirror)
+
+    assert second["files"] == first["files"]
+    assert second["stats"]["source"] == "mirror"
+    assert fake_github.requests == ["/repos/o/r/commits/HEAD"]
+
+
+def test_mirror_sha_url_makes_no_requests(fake_github, tmp_path):
+    mirror = RepoMirror(str(tmp_path / "mirror"))
+    url = f"https://github.com/o/r/tree/{COMMIT}"
+    mirror.store("github.com/o/r", COMMIT, {
+        "path": "", "include": [], "exclude": [], "max_file_size": 1024, "relative": True,
+    }, {"a.py": "a"}, {"source": "git_tree"})
+
+    result = crawl_github_files(url, api_base=fake_github.base, use_relative_paths=True,
+                                max_file_size=1024, mirror=mirror)
+
+    assert result["files"] == {"a.py": "a"}
+    assert fake_github.requests == []
+
+
+def test_mirror_different_filters_miss(fake_github, tmp_path):
+    mirror = RepoMirror(str(tmp_path / "mirror"))
+    _crawl(fake_github, include_patterns={"*.py"}, mirror=mirror)
+    result = _crawl(fake_github, include_patterns={"*.md"}, mirror=mirror)
+
+    assert result["stats"]["source"] == "git_tree"
+    assert result["files"] == {"README.md": "# Demo"}
+
+
+def test_mirror_evicts_least_recently_used(tmp_path):
+    mirror = RepoMirror(str(tmp_path / "mirror"), quota_bytes=10**9)
+    shared_blob = "s" * 1000
+    mirror.store("r", "a" * 40, {}, {"x": "x" * 1000, "s": shared_blob}, {})
+    mirror.store("r", "b" * 40, {}, {"y": "y" * 1000, "s": shared_blob}, {})
+    assert mirror.load("r", "a" * 40, {}) is not None  # a — недавно использован
+
+    mirror.quota_bytes = mirror.size() - 1
+    mirror.evict()
+
+    assert mirror.load("r", "b" * 40, {}) is None
+    files, _ = mirror.load("r", "a" * 40, {})
+    assert files == {"x": "x" * 1000, "s": shared_blob}  # общий блоб не удалён
+    assert mirror.size() <= mirror.quota_bytes
+
+
+def test_mirror_for_clone_urls(bare_repo, tmp_path):
+    mirror = RepoMirror(str(tmp_path / "mirror"))
+    url = f"file://{bare_repo}"
+    first = crawl_github_files(url, include_patterns={"*.py"}, mirror=mirror)
+    second = crawl_github_files(url, include_patterns={"*.py"}, mirror=mirror)
+
+    assert first["stats"]["source"] == "git_clone"
+    assert second["stats"]["source"] == "mirror"
+    assert second["files"] == first["files"]
@@ -0,0 +1,106 @@
+# tests/test_crawl_local_files.py
+"""
+Обход локального каталога через os.scandir в пуле потоков.
+
+Проверяем:
+  1. walk_files отдаёт все файлы с размерами, включая глубокую вложенность.
+  2. Это генератор: первые файлы приходят до окончания обхода.
+  3. crawl_local_files возвращает файлы в стабильном (отсортированном) порядке.
+  4. Чтение в пуле потоков: бинарники отсеиваются по первым байтам,
+     не-UTF-8 декодируется цепочкой кодировок, есть метрики по файлам.
+"""
+import os
+import threading
+
+import utils.crawl_local_files as clf
+
+
+def _make_tree(root, files):
+    for path, content in files.items():
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_text(content)
+
+
+# ---------- 1. все файлы и размеры ----------------------------------------
+def test_walk_files_yields_relpaths_with_sizes(tmp_path):
+    files = {f"d{i}/sub/f{j}.txt": "x" * (i + j) for i in range(5) for j in range(3)}
+    files["top.py"] = "print(1)"
+    _make_tree(tmp_path, files)
+    os.symlink(tmp_path / "d0", tmp_path / "link_to_d0")  # не идём по ссылкам на каталоги
+
+    walked = dict(clf.walk_files(str(tmp_path), max_workers=4))
+
+    assert walked == {os.path.join(*p.split("/")): len(c) for p, c in files.items()}
+
+
+# ---------- 2. потоковая выдача -------------------------------------------
+def test_walk_files_streams_before_walk_finishes(tmp_path, monkeypatch):
+    _make_tree(tmp_path, {"a.txt": "a", "slow/b.txt": "b"})
+    release = threading.Event()
+    real_scan = clf._scan_directory
+
+    def _scan(directory, rel_dir, matcher):
+        if rel_dir == "slow":
+            release.wait(5)  # подкаталог «висит», пока не получим первый файл
+        return real_scan(directory, rel_dir, matcher)
+
+    monkeypatch.setattr(clf, "_scan_directory", _scan)
+    walker = clf.walk_files(str(tmp_path))
+
+    assert next(walker) == ("a.txt", 1)
+    release.set()
+    assert list(walker) == [(os.path.join("slow", "b.txt"), 1)]
+
+
+# ---------- 3. стабильный порядок результата ------------------------------
+def test_crawl_local_files_sorted_result(tmp_path):
+    _make_tree(tmp_path, {"z.py": "z", "a/b.py": "b", "m.py": "m", "big.py": "x" * 100})
+
+    result = clf.crawl_local_files(str(tmp_path), {"*.py"}, max_file_size=50)
+
+    assert list(result["files"]) == sorted([os.path.join("a", "b.py"), "m.py", "z.py"])
+
+
+# ---------- 4. чтение: бинарники, кодировки, метрики ----------------------
+def test_read_skips_binaries_and_decodes_fallback_encodings(tmp_path):
+    (tmp_path / "utf8.py").write_text("# привет\n", encoding="utf-8")
+    (tmp_path / "legacy.txt").write_bytes("комментарий".encode("cp1251"))
+    (tmp_path / "wide.txt").write_text("wide", encoding="utf-16")
+    (tmp_path / "blob.bin").write_bytes(b"\x89PNG\0\0" + b"x" * 100_000)
+
+    result = clf.crawl_local_files(str(tmp_path), max_workers=4)
+
+    assert result["files"] == {
+        "legacy.txt": "комментарий",
+        "utf8.py": "# привет\n",
+        "wide.txt": "wide",
+    }
+    stats = result["stats"]
+    assert stats["skipped_by_reason"] == {"binary": 1}
+    metrics = stats["file_metrics"]
+    assert metrics["legacy.txt"]["encoding"] == "cp1251"
+    assert metrics["utf8.py"]["encoding"] == "utf-8-sig"
+    # бинарник прочитан лишь на длину пробы
+    assert metrics["blob.bin"]["bytes"] == clf.BINARY_SNIFF_BYTES
+    assert stats["read_seconds"] >= 0
+
+
+def test_reads_run_concurrently(tmp_path, monkeypatch):
+    _make_tree(tmp_path, {f"f{i}.txt": str(i) for i in range(8)})
+    lock, active, peak = threading.Lock(), [0], [0]
+    real_read = clf.read_text_file
+
+    def _slow_read(path):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        threading.Event().wait(0.05)
+        with lock:
+            active[0] -= 1
+        return real_read(path)
+
+    monkeypatch.setattr(clf, "read_text_file", _slow_read)
+    result = clf.crawl_local_files(str(tmp_path), max_workers=4)
+
+    assert len(result["files"]) == 8
+    assert 1 < peak[0] <= 4
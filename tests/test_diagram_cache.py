@@ -0,0 +1,113 @@
+# tests/test_diagram_cache.py
+"""
+Глобальный кеш диаграмм:
+  1. ключ — исходник + версия mermaid-cli + тема + формат;
+  2. выдача — жёсткой ссылкой, LRU-вытеснение по размеру;
+  3. повторная генерация с теми же диаграммами не вызывает рендер вовсе;
+  4. версия mermaid-cli читается из package.json без запуска mmdc.
+"""
+import json
+import os
+
+import nodes
+import utils
+from utils.diagram_cache import DiagramCache
+
+SOURCE = "flowchart TD\n    A --> B"
+
+
+def _rendered(tmp_path, name="r.png", data=b"png"):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return path
+
+
+# ---------- 1. ключ ---------------------------------------------------------
+def test_key_depends_on_version_theme_and_format(tmp_path):
+    base = DiagramCache(str(tmp_path), version="10.9.0")
+    assert base.key(SOURCE, "png") == DiagramCache(str(tmp_path), version="10.9.0").key(SOURCE + "\n", "png")
+    assert base.key(SOURCE, "png") != DiagramCache(str(tmp_path), version="11.0.0").key(SOURCE, "png")
+    assert base.key(SOURCE, "png") != DiagramCache(str(tmp_path), version="10.9.0", theme="dark").key(SOURCE, "png")
+    assert base.key(SOURCE, "png") != base.key(SOURCE, "svg")
+
+
+# ---------- 2. выдача и вытеснение ------------------------------------------
+def test_fetch_hard_links_cached_file(tmp_path):
+    cache = DiagramCache(str(tmp_path / "cache"))
+    target = tmp_path / "out" / "diagram.png"
+
+    assert cache.fetch(SOURCE, target) is False
+    cache.store(SOURCE, _rendered(tmp_path))
+    assert cache.fetch(SOURCE, target) is True
+
+    assert target.read_bytes() == b"png"
+    assert os.path.samefile(target, cache.entry_path(SOURCE, "png"))
+
+
+def test_lru_eviction_by_size(tmp_path):
+    cache = DiagramCache(str(tmp_path / "cache"), quota_bytes=250)
+    sources = [f"graph TD\n    N{i} --> M{i}" for i in range(3)]
+    cache.store(sources[0], _rendered(tmp_path, "a.png", b"x" * 100))
+    cache.store(sources[1], _rendered(tmp_path, "b.png", b"x" * 100))
+    # первый читали недавно — вытеснять надо второй
+    assert cache.fetch(sources[0], tmp_path / "out.png")
+    cache.store(sources[2], _rendered(tmp_path, "c.png", b"x" * 100))
+
+    assert cache.size() <= 250
+    assert os.path.exists(cache.entry_path(sources[0], "png"))
+    assert not os.path.exists(cache.entry_path(sources[1], "png"))
+    assert os.path.exists(cache.entry_path(sources[2], "png"))
+
+
+# ---------- 3. повторная генерация без рендера ------------------------------
+def test_second_tutorial_renders_nothing(tmp_path, monkeypatch):
+    renders = []
+
+    def _fake_png(mmd_path, png_path):
+        renders.append(mmd_path.name)
+        png_path.write_bytes(b"png")
+        return True
+
+    monkeypatch.setattr(nodes, "generate_mermaid_png", _fake_png)
+    monkeypatch.setattr(nodes, "generate_mermaid_batch", lambda jobs: set())
+
+    def _shared(output_dir):
+        return {
+            "project_name": "demo",
+            "output_dir": str(output_dir),
+            "diagram_format": "png",
+            "repo_url": None,
+            "relationships": {"summary": "S", "details": [{"from": 0, "to": 1, "label": "uses"}]},
+            "chapter_order": [0, 1],
+            "abstractions": [{"name": n, "description": n, "files": []} for n in "AB"],
+            "chapters": [f"# Chapter {n}\n\n```mermaid\ngraph TD\n    X{n} --> Y{n}\n```\n" for n in range(2)],
+            "diagram_cache_dir": str(tmp_path / "cache"),
+        }
+
+    nodes.CombineTutorial().run(_shared(tmp_path / "first"))
+    assert len(renders) == 3  # схема + две главы
+
+    renders.clear()
+    nodes.CombineTutorial().run(_shared(tmp_path / "second"))
+    assert renders == []
+    assert (tmp_path / "second" / "demo" / "diagram.png").read_bytes() == b"png"
+    assert "![Architecture Diagram](diagram.png)" in (tmp_path / "second" / "demo" / "index.md").read_text(encoding="utf-8")
+
+
+# ---------- 4. версия mermaid-cli -------------------------------------------
+def test_mermaid_cli_version_from_package_json(tmp_path, monkeypatch):
+    package = tmp_path / "node_modules" / "@mermaid-js" / "mermaid-cli"
+    (package / "src").mkdir(parents=True)
+    (package / "package.json").write_text(
+        json.dumps({"name": "@mermaid-js/mermaid-cli", "version": "10.9.1"}), encoding="utf-8"
+    )
+    (package / "src" / "cli.js").write_text("", encoding="utf-8")
+    (tmp_path / "bin").mkdir()
+    os.symlink(package / "src" / "cli.js", tmp_path / "bin" / "mmdc")
+
+    monkeypatch.setattr(utils.shutil, "which", lambda _cmd: str(tmp_path / "bin" / "mmdc"))
+    utils.mermaid_cli_version.cache_clear()
+    try:
+        assert utils.mermaid_cli_version() == "10.9.1"
+    finally:
+        utils.mermaid_cli_version.cache_clear()
@@ -0,0 +1,76 @@
+# tests/test_file_table.py
+"""
+LazyFileTable: в памяти только (path, size, hash), содержимое — по запросу.
+
+Проверяем:
+  1. Загрузка по требованию и LRU-вытеснение декодированных строк.
+  2. Таблица ведёт себя как список кортежей (len, индексы, срезы, итерация).
+  3. crawl_local_files(lazy=True) даёт то же, что обычный режим; большие
+     файлы читаются через mmap.
+  4. from_blob_store: содержимое уходит в контентно-адресуемое хранилище.
+"""
+import utils.file_table as ft
+from utils.crawl_local_files import crawl_local_files
+from utils.file_table import FileRecord, LazyFileTable
+from utils.repo_mirror import RepoMirror
+
+
+def _table(n, cache_size):
+    loads = []
+
+    def _loader(record):
+        loads.append(record.path)
+        return f"content of {record.path}"
+
+    records = [FileRecord(f"f{i}.py", 10, f"h{i}", f"src{i}") for i in range(n)]
+    return LazyFileTable(records, _loader, cache_size=cache_size), loads
+
+
+# ---------- 1. ленивость и LRU --------------------------------------------
+def test_loads_on_demand_with_lru():
+    table, loads = _table(5, cache_size=2)
+    assert loads == []  # создание таблицы ничего не читает
+
+    assert table[0] == ("f0.py", "content of f0.py")
+    table[1]
+    table[0]  # из кеша, f0 становится самым свежим
+    table[2]  # вытесняет f1
+    table[1]
+
+    assert loads == ["f0.py", "f1.py", "f2.py", "f1.py"]
+    assert table.path(4) == "f4.py" and len(loads) == 4
+
+
+# ---------- 2. интерфейс последовательности -------------------------------
+def test_behaves_like_list_of_tuples():
+    table, _ = _table(3, cache_size=8)
+    assert len(table) == 3
+    assert table[-1][0] == "f2.py"
+    assert [p for p, _ in table] == ["f0.py", "f1.py", "f2.py"]
+    assert table[1:] == [("f1.py", "content of f1.py"), ("f2.py", "content of f2.py")]
+    assert dict(table)["f0.py"] == "content of f0.py"
+    assert table.hashes() == {"f0.py": "h0", "f1.py": "h1", "f2.py": "h2"}
+
+
+# ---------- 3. ленивый режим локального краулера --------------------------
+def test_lazy_local_crawl_matches_eager(tmp_path, monkeypatch):
+    monkeypatch.setattr(ft, "MMAP_THRESHOLD", 100)
+    (tmp_path / "small.py").write_text("x = 1\n")
+    (tmp_path / "big.py").write_text("# большой файл\n" * 50)
+    (tmp_path / "legacy.txt").write_bytes("старый".encode("cp1251"))
+
+    eager = crawl_local_files(str(tmp_path))["files"]
+    lazy = crawl_local_files(str(tmp_path), lazy=True)["files"]
+
+    assert isinstance(lazy, LazyFileTable)
+    assert list(lazy) == list(eager.items())
+
+
+# ---------- 4. хранилище блобов -------------------------------------------
+def test_from_blob_store_reads_back_from_disk(tmp_path):
+    store = RepoMirror(str(tmp_path / "blobs"))
+    table = LazyFileTable.from_blob_store(store, {"a.py": "a", "b.py": "привет"})
+
+    assert list(table) == [("a.py", "a"), ("b.py", "привет")]
+    assert table.records[1].size == len("привет".encode("utf-8"))
+    assert table.records[0].digest == table.records[0].source
@@ -0,0 +1,106 @@
+# tests/test_identify_abstractions.py
+"""
+Map-reduce режим IdentifyAbstractions: кандидаты ищутся по шардам,
+индексы файлов переводятся в глобальные, финальный вызов их сливает.
+"""
+import re
+
+import nodes
+
+
+def _yaml(items):
+    body = "".join(
+        f"- name: {name}\n  description: {name} desc\n  file_indices:\n"
+        + "".join(f"    - {i}\n" for i in idx)
+        for name, idx in items
+    )
+    return f"```yaml\n{body}```"
+
+
+def _shared(mode, budget):
+    return {
+        "project_name": "demo",
+        "language": "english",
+        "use_cache": False,
+        "max_abstraction_num": 5,
+        "context_token_budget": budget,
+        "abstraction_mode": mode,
+        "llm_concurrency": 2,
+        "files": [
+            ("core/engine.py", "class Engine: pass\n" * 20),
+            ("web/app.py", "def app(): pass\n" * 20),
+            ("core/state.py", "class State: pass\n" * 20),
+        ],
+    }
+
+
+def test_map_reduce_remaps_indices_and_merges(monkeypatch):
+    prompts = []
+
+    def _fake_llm(prompt, use_cache=True, expect_fence=None):
+        prompts.append(prompt)
+        if "candidate abstractions were found" in prompt:
+            # слияние: ссылаемся на глобальные индексы
+            assert re.search(r"Engine.*file indices: \[0, 2\]", prompt)
+            assert re.search(r"App.*file indices: \[1\]", prompt)
+            return _yaml([("Engine", ["0 # core/engine.py", 2]), ("App", [1])])
+        if "core/engine.py" in prompt:
+            # шард core/: локальные индексы 0 и 1
+            return _yaml([("Engine", [0, 1])])
+        return _yaml([("App", [0])])
+
+    monkeypatch.setattr(nodes, "call_llm", _fake_llm)
+
+    node = nodes.IdentifyAbstractions()
+    shared = _shared("map_reduce", budget=250)
+    node.run(shared)
+
+    assert len(prompts) == 3  # два шарда + слияние
+    assert shared["abstractions"] == [
+        {"name": "Engine", "description": "Engine desc", "files": [0, 2]},
+        {"name": "App", "description": "App desc", "files": [1]},
+    ]
+
+
+def test_auto_mode_uses_single_prompt_when_files_fit(monkeypatch):
+    prompts = []
+
+    def _fake_llm(prompt, use_cache=True, expect_fence=None):
+        prompts.append(prompt)
+        return _yaml([("Everything", [0, 1, 2])])
+
+    monkeypatch.setattr(nodes, "call_llm", _fake_llm)
+
+    shared = _shared("auto", budget=100_000)
+    nodes.IdentifyAbstractions().run(shared)
+
+    assert len(prompts) == 1
+    assert shared["abstractions"][0]["files"] == [0, 1, 2]
+
+
+def test_auto_mode_packs_signatures_before_sharding(monkeypatch):
+    prompts = []
+
+    def _fake_llm(prompt, use_cache=True, expect_fence=None):
+        prompts.append(prompt)
+        return _yaml([("Everything", [0, 1, 2])])
+
+    monkeypatch.setattr(nodes, "call_llm", _fake_llm)
+
+    shared = _shared("auto", budget=200)
+    shared["files"] = [
+        (f"pkg/m{i}.py", f"def f{i}():\n" + "    x = 1\n" * 50) for i in range(3)
+    ]
+    nodes.IdentifyAbstractions().run(shared)
+
+    # не влезают целиком, но влезают сигнатурами — один промпт, не map-reduce
+    assert len(prompts) == 1
+    assert shared["context_report"]["signature_count"] == 2
+    assert shared["context_report"]["dropped_count"] == 0
+
+
+def test_default_mode_is_auto():
+    shared = _shared("auto", budget=5)
+    del shared["abstraction_mode"]
+    prep = nodes.IdentifyAbstractions().prep(shared)
+    assert prep[7] is not None  # не влезает даже сигнатурами — шарды
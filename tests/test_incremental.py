@@ -0,0 +1,97 @@
+# tests/test_incremental.py
+"""
+Инкрементальная перегенерация по манифесту хешей файлов (--incremental).
+
+Сценарий: полный прогон → меняем один файл → повторный прогон.
+Проверяем, что:
+  1. абстракции/связи/порядок взяты из манифеста без вызовов LLM;
+  2. переписана только глава, чьи файлы изменились;
+  3. index.md и диаграмма не перестраивались;
+  4. при изменении списка файлов абстракции определяются заново.
+"""
+from pathlib import Path
+
+import nodes
+
+
+def _shared(src, out):
+    return {
+        "repo_url": None,
+        "local_dir": str(src),
+        "project_name": "demo",
+        "output_dir": str(out),
+        "include_patterns": {"*.py"},
+        "exclude_patterns": set(),
+        "max_file_size": 100_000,
+        "language": "english",
+        "max_abstraction_num": 10,
+        "use_cache": False,
+        "quiet": True,
+        "incremental": True,
+    }
+
+
+def _run_pipeline(shared, llm_calls, pngs, monkeypatch):
+    def _fake_llm(prompt, use_cache=True):
+        llm_calls.append(prompt)
+        return "# Chapter 1: X\n\nbody"
+
+    def _fake_png(mmd_path, png_path):
+        pngs.append(Path(png_path).name)
+        Path(png_path).write_bytes(b"png")
+        return True
+
+    monkeypatch.setattr(nodes, "call_llm", _fake_llm)
+    monkeypatch.setattr(nodes, "generate_mermaid_png", _fake_png)
+
+    nodes.FetchRepo()._run(shared)
+    if "reusable_outputs" in shared:
+        # Повторный прогон: узлы берут результаты из манифеста
+        for node_cls in (nodes.IdentifyAbstractions, nodes.AnalyzeRelationships, nodes.OrderChapters):
+            node_cls()._run(shared)
+    else:
+        # Первый прогон: шаги с LLM до WriteChapters подменены готовыми результатами
+        shared["abstractions"] = [
+            {"name": "Alpha", "description": "A", "files": [0]},
+            {"name": "Beta", "description": "B", "files": [1]},
+        ]
+        shared["relationships"] = {"summary": "S", "details": [{"from": 0, "to": 1, "label": "uses"}]}
+        shared["chapter_order"] = [0, 1]
+    nodes.WriteChapters()._run(shared)
+    nodes.CombineTutorial()._run(shared)
+
+
+def test_second_run_rewrites_only_changed_chapter(tmp_path, monkeypatch):
+    src, out = tmp_path / "src", tmp_path / "out"
+    src.mkdir()
+    (src / "a.py").write_text("a = 1\n")
+    (src / "b.py").write_text("b = 1\n")
+
+    calls, pngs = [], []
+    _run_pipeline(_shared(src, out), calls, pngs, monkeypatch)
+    assert len(calls) == 2
+    assert (out / "demo" / ".tutorial_manifest.json").exists()
+
+    (src / "b.py").write_text("b = 2\n")
+    calls.clear(), pngs.clear()
+    shared = _shared(src, out)
+    _run_pipeline(shared, calls, pngs, monkeypatch)
+
+    assert set(shared["reusable_outputs"]) == {"abstractions", "relationships", "chapter_order"}
+    assert len(calls) == 1 and "Beta" in calls[0]
+    assert pngs == []  # диаграмма не перерисовывалась
+
+
+def test_changed_file_list_disables_reuse(tmp_path, monkeypatch):
+    src, out = tmp_path / "src", tmp_path / "out"
+    src.mkdir()
+    (src / "a.py").write_text("a = 1\n")
+    (src / "b.py").write_text("b = 1\n")
+    _run_pipeline(_shared(src, out), [], [], monkeypatch)
+
+    (src / "c.py").write_text("c = 1\n")
+    shared = _shared(src, out)
+    nodes.FetchRepo()._run(shared)
+
+    assert "reusable_outputs" not in shared
+    assert shared["previous_manifest"]["files"].keys() == {"a.py", "b.py"}
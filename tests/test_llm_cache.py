@@ -0,0 +1,121 @@
+# tests/test_llm_cache.py
+"""
+Проверяем бэкенды дискового кеша LLM и миграцию из старого llm_cache.json.
+"""
+
+import json
+
+import pytest
+
+from utils.llm_cache import (
+    LogCache,
+    SQLiteCache,
+    cache_key,
+    migrate_json_cache,
+    open_cache,
+)
+
+
+@pytest.fixture(params=["sqlite", "log"])
+def backend_name(request):
+    return request.param
+
+
+# ---------- 1. запись переживает переоткрытие ------------------------------
+def test_roundtrip_and_reopen(tmp_path, backend_name):
+    path = tmp_path / "cache.db"
+    cache = open_cache(backend_name, str(path), legacy_json=None)
+    k1, k2 = cache_key("p1"), cache_key("p2")
+    cache.set(k1, "ответ")
+    cache.set(k1, "ответ-2")  # перезапись
+    cache.set(k2, "other")
+    cache.close()
+
+    cache = open_cache(backend_name, str(path), legacy_json=None)
+    assert cache.get(k1) == "ответ-2"
+    assert cache.get(k2) == "other"
+    assert cache.get(cache_key("missing")) is None
+    cache.close()
+
+
+# ---------- 2. оборванный хвост журнала отбрасывается, битая строка — нет ---
+def test_log_cache_ignores_torn_tail(tmp_path):
+    path = tmp_path / "cache.jsonl"
+    ok, torn, after = cache_key("ok"), cache_key("torn"), cache_key("after")
+    cache = LogCache(str(path))
+    cache.set(ok, "value")
+    cache.close()
+
+    with open(path, "ab") as f:
+        f.write(b'{"k": "' + torn.encode() + b'", "v": "unfinis')
+
+    cache = LogCache(str(path))
+    assert cache.get(ok) == "value"
+    assert cache.get(torn) is None
+    cache.set(after, "crash")
+    cache.close()
+
+    assert LogCache(str(path)).get(after) == "crash"
+
+
+def test_log_cache_skips_corrupt_line_in_the_middle(tmp_path):
+    path = tmp_path / "cache.jsonl"
+    first, last = cache_key("first"), cache_key("last")
+    path.write_bytes(
+        b'{"k": "' + first.encode() + b'", "v": "one"}\n'
+        b"not json\n"
+        b'{"k": "' + last.encode() + b'", "v": "two"}\n'
+    )
+    size = path.stat().st_size
+
+    cache = LogCache(str(path))
+    assert (cache.get(first), cache.get(last)) == ("one", "two")
+    assert len(cache) == 2
+    cache.close()
+    assert path.stat().st_size == size  # не обрезано
+
+
+# ---------- 3. однократная миграция из JSON --------------------------------
+def test_migrate_legacy_json(tmp_path):
+    legacy = tmp_path / "llm_cache.json"
+    legacy.write_text(json.dumps({"prompt A": "resp A", "prompt B": "resp B"}), encoding="utf-8")
+
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    assert migrate_json_cache(str(legacy), cache, "gemini", "gemini-x") == 2
+    assert cache.get(cache_key("prompt A", "gemini", "gemini-x")) == "resp A"
+    assert cache.get(cache_key("prompt A", "openrouter", "other")) is None
+    assert not legacy.exists()
+    assert (tmp_path / "llm_cache.json.migrated").exists()
+
+    # повторный вызов ничего не делает
+    assert migrate_json_cache(str(legacy), cache) == 0
+
+
+# ---------- 4. ключ зависит от провайдера, модели и параметров ---------------
+def test_cache_key_scoped_by_model_and_params():
+    base = cache_key("same prompt", "openrouter", "model-a")
+    assert cache_key("same prompt", "openrouter", "model-b") != base
+    assert cache_key("same prompt", "gemini", "model-a") != base
+    assert cache_key("same prompt", "openrouter", "model-a", {"t": 0.2}) != base
+    assert cache_key("x", params={"a": 1, "b": 2}) == cache_key("x", params={"b": 2, "a": 1})
+    assert len(bytes.fromhex(base)) == 16
+
+
+# ---------- 5. промпты — только по запросу, в побочной таблице -------------
+def test_prompts_stored_only_when_enabled(tmp_path, backend_name):
+    key = cache_key("debug me")
+    off = open_cache(backend_name, str(tmp_path / "off"), legacy_json=None)
+    off.store_prompts = False
+    off.set(key, "r", prompt="debug me")
+    assert off.get_prompt(key) is None
+
+    on = open_cache(backend_name, str(tmp_path / "on"), legacy_json=None)
+    on.store_prompts = True
+    on.set(key, "r", prompt="debug me")
+    assert on.get_prompt(key) == "debug me"
+    assert on.get(key) == "r"
+
+
+def test_unknown_backend_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        open_cache("redis", str(tmp_path / "x"), legacy_json=None)
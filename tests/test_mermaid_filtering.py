@@ -3,8 +3,11 @@
 Проверяем корректность фильтрации и рендера mermaid-блоков.
 """
 
+import io
 from pathlib import Path
-from utils.mermaid_utils import render_mermaid_blocks, _sha10
+from utils.mermaid_utils import MERMAID_JS_INCLUDE, MermaidRewriter, render_mermaid_blocks, _sha10
+
+from tests.bench_mermaid_blocks import legacy_render_mermaid_blocks, make_markdown
 
 
 def _fake_png_success(src: Path, dst: Path) -> bool:
@@ -19,7 +22,7 @@ def _fake_png_fail(src: Path, dst: Path) -> bool:
 # ---------- 1. демонстрационный блок остаётся -----------------------------
 def test_demo_block_kept(tmp_path):
     md_in = "Text\n```mermaid\n```yaml\n- name: demo\n```\n```\nEnd"
-    md_out = render_mermaid_blocks(md_in, tmp_path, _fake_png_success)
+    md_out = render_mermaid_blocks(md_in, tmp_path, _fake_png_success, fmt="png")
     assert md_out == md_in
     assert not list(tmp_path.glob("*.png"))
 
@@ -30,7 +33,7 @@ def test_real_mermaid_block_rendered(tmp_path):
     sha = _sha10(code)
     md_in = f"```mermaid\n{code}\n```"
 
-    md_out = render_mermaid_blocks(md_in, tmp_path, _fake_png_success)
+    md_out = render_mermaid_blocks(md_in, tmp_path, _fake_png_success, fmt="png")
 
     assert f"![Diagram]({sha}.png)" in md_out
     assert (tmp_path / f"{sha}.png").exists()
@@ -41,8 +44,57 @@ def test_render_failure_keeps_block(tmp_path):
     code = "flowchart LR; A-->B;"
     md_in = f"```mermaid\n{code}\n```"
 
-    md_out = render_mermaid_blocks(md_in, tmp_path, _fake_png_fail)
+    md_out = render_mermaid_blocks(md_in, tmp_path, _fake_png_fail, fmt="png")
 
     # блок остался прежним, PNG нет
     assert md_out == md_in
     assert not list(tmp_path.glob("*.png"))
+
+
+# ---------- 4. потоковый проход совпадает с прежней реализацией -----------
+def test_rewriter_matches_legacy_output(tmp_path):
+    md_in = make_markdown(12) + "\n```mermaid\ngraph TD\n    A --> B"  # незакрытый в конце
+    expected = legacy_render_mermaid_blocks(md_in, tmp_path / "legacy", _fake_png_success)
+
+    assert render_mermaid_blocks(md_in, tmp_path / "new", _fake_png_success, fmt="png") == expected
+
+
+# ---------- 5. index.md: первый блок → схема архитектуры ------------------
+def test_first_block_image_replaces_only_first_block(tmp_path):
+    md_in = "# Demo\n```mermaid\nflowchart TD\n    A-->B\n```\nText\n```mermaid\ngraph TD; C-->D;\n```"
+    buf = io.StringIO()
+    MermaidRewriter(tmp_path, first_block_image="![Architecture Diagram](diagram.png)").write(
+        md_in.splitlines(), buf
+    )
+
+    assert buf.getvalue() == "# Demo\n![Architecture Diagram](diagram.png)\nText\n```mermaid\ngraph TD; C-->D;\n```"
+    assert not list(tmp_path.glob("*.mmd"))
+
+
+# ---------- 6. SVG: картинка в выбранном формате --------------------------
+def test_svg_format(tmp_path):
+    code = "graph TD; A-->B;"
+    sha = _sha10(code)
+
+    md_out = render_mermaid_blocks(f"```mermaid\n{code}\n```", tmp_path, _fake_png_success, fmt="svg")
+
+    assert md_out == f"![Diagram]({sha}.svg)"
+    assert (tmp_path / f"{sha}.svg").exists()
+
+
+# ---------- 7. client: блок остаётся, подключается mermaid.js --------------
+def test_client_format_keeps_blocks_and_includes_mermaid_js(tmp_path):
+    def _no_render(src, dst):
+        raise AssertionError("client mode must not render")
+
+    md_in = "Text\n```mermaid\ngraph TD; A-->B;\n```\n```mermaid\nflowchart LR; C-->D;\n```"
+    md_out = render_mermaid_blocks(md_in, tmp_path, _no_render, fmt="client")
+
+    assert md_out == md_in + "\n\n" + MERMAID_JS_INCLUDE + "\n"
+    assert not list(tmp_path.iterdir())
+    assert list(MermaidRewriter(tmp_path, fmt="client").jobs(md_in.splitlines())) == []
+
+
+def test_client_format_without_diagrams_adds_nothing(tmp_path):
+    md_in = "Text\n```mermaid\n```yaml\n- name: demo\n```\n```\nEnd"
+    assert render_mermaid_blocks(md_in, tmp_path, _fake_png_fail, fmt="client") == md_in
@@ -0,0 +1,271 @@
+# tests/test_mermaid_renderer.py
+"""
+Пакетный рендер Mermaid:
+  1. все диаграммы уходят одной пачкой — один запуск mmdc на пачку;
+  2. то, что пачка не отдала, рендерится по одной;
+  3. число одновременных рендеров ограничено max_workers;
+  4. generate_mermaid_batch собирает .mmd в один Markdown для mmdc, а
+     зависший mmdc держит пачку не дольше одного тайм-аута;
+  5. CombineTutorial рендерит схему и диаграммы глав одним пакетом;
+  6. по умолчанию svg, формат передаётся mmdc, режим client не рендерит ничего.
+"""
+import functools
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+import nodes
+import utils
+from utils.mermaid_renderer import MermaidRenderer
+
+
+def _jobs(tmp_path, count):
+    jobs = []
+    for i in range(count):
+        mmd = tmp_path / f"d{i}.mmd"
+        mmd.write_text(f"flowchart TD\n    A{i} --> B{i}", encoding="utf-8")
+        jobs.append((mmd, tmp_path / f"d{i}.png"))
+    return jobs
+
+
+def _fake_batch(calls, fail=()):
+    def _render(batch):
+        calls.append(len(batch))
+        done = set()
+        for mmd, png in batch:
+            if mmd.name not in fail:
+                png.write_bytes(b"png")
+                done.add(png)
+        return done
+    return _render
+
+
+# ---------- 1. одна пачка ---------------------------------------------------
+def test_batch_renders_everything_in_one_session(tmp_path):
+    batches, singles = [], []
+    renderer = MermaidRenderer(
+        lambda mmd, png: singles.append(mmd) or True, _fake_batch(batches), batch_size=40
+    )
+    jobs = _jobs(tmp_path, 30)
+
+    rendered = renderer.render(jobs + jobs[:5])  # повторы рендерятся один раз
+
+    assert batches == [30]
+    assert singles == []
+    assert rendered == {png for _, png in jobs}
+
+
+def test_existing_png_is_not_rendered_again(tmp_path):
+    batches = []
+    jobs = _jobs(tmp_path, 3)
+    jobs[0][1].write_bytes(b"old")
+
+    rendered = MermaidRenderer(lambda *_: False, _fake_batch(batches)).render(jobs)
+
+    assert batches == [2]
+    assert len(rendered) == 3
+
+
+# ---------- 2. остаток — по одной -------------------------------------------
+def test_failed_batch_items_fall_back_to_single_renders(tmp_path):
+    batches, singles = [], []
+    renderer = MermaidRenderer(
+        lambda mmd, png: singles.append(mmd.name) or mmd.name != "d2.mmd",
+        _fake_batch(batches, fail={"d1.mmd", "d2.mmd"}),
+    )
+    jobs = _jobs(tmp_path, 4)
+
+    rendered = renderer.render(jobs)
+
+    assert sorted(singles) == ["d1.mmd", "d2.mmd"]
+    assert jobs[2][1] not in rendered
+    assert len(rendered) == 3
+
+
+# ---------- 3. ограничение параллелизма -------------------------------------
+def test_worker_count_is_bounded(tmp_path):
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def _slow_render(mmd, png):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        return True
+
+    MermaidRenderer(_slow_render, max_workers=3).render(_jobs(tmp_path, 12))
+
+    assert peak[0] <= 3
+
+
+# ---------- 4. generate_mermaid_batch ---------------------------------------
+def test_generate_mermaid_batch_runs_mmdc_once(monkeypatch, tmp_path):
+    monkeypatch.setattr(utils.shutil, "which", lambda _cmd: "mmdc")
+    runs = []
+
+    def _fake_run(args, **kwargs):
+        runs.append(args)
+        source = Path(args[args.index("-i") + 1]).read_text(encoding="utf-8")
+        out = Path(args[args.index("-o") + 1])
+        for n in range(1, source.count("```mermaid") + 1):
+            out.with_name(f"out-{n}.png").write_bytes(b"png")
+
+    monkeypatch.setattr(utils.subprocess, "run", _fake_run)
+    jobs = _jobs(tmp_path, 5)
+
+    rendered = utils.generate_mermaid_batch(jobs)
+
+    assert len(runs) == 1
+    assert rendered == {png for _, png in jobs}
+    assert all(png.read_bytes() == b"png" for _, png in jobs)
+
+
+def test_generate_mermaid_batch_without_mmdc(monkeypatch, tmp_path):
+    monkeypatch.setattr(utils.shutil, "which", lambda _cmd: None)
+    assert utils.generate_mermaid_batch(_jobs(tmp_path, 2)) == set()
+
+
+_HANGING_MMDC = """#!{python}
+import pathlib, sys, time
+out = pathlib.Path(sys.argv[sys.argv.index("-o") + 1])
+out.with_name("out-1.png").write_bytes(b"png")
+time.sleep(60)  # вторая диаграмма «подвесила» Chromium
+"""
+
+
+def test_hung_batch_costs_one_diagram_timeout(monkeypatch, tmp_path):
+    mmdc = tmp_path / "mmdc"
+    mmdc.write_text(_HANGING_MMDC.format(python=sys.executable), encoding="utf-8")
+    mmdc.chmod(0o755)
+    monkeypatch.setattr(utils.shutil, "which", lambda _cmd: str(mmdc))
+    singles = []
+
+    def _render_one(mmd, png):
+        singles.append(mmd.name)
+        png.write_bytes(b"png")
+        return True
+
+    jobs = _jobs(tmp_path, 40)
+    renderer = MermaidRenderer(
+        _render_one, functools.partial(utils.generate_mermaid_batch, timeout=1), batch_size=40
+    )
+    started = time.monotonic()
+    rendered = renderer.render(jobs)
+
+    assert time.monotonic() - started < 5  # не startup + timeout * 40
+    assert rendered == {png for _, png in jobs}
+    assert "d0.mmd" not in singles and len(singles) == 39
+
+
+# ---------- 5. CombineTutorial ----------------------------------------------
+def test_combine_tutorial_renders_all_diagrams_in_one_batch(tmp_path, monkeypatch):
+    batches = []
+    monkeypatch.setattr(nodes, "generate_mermaid_batch", _fake_batch(batches))
+    monkeypatch.setattr(nodes, "generate_mermaid_png", lambda *_: False)
+
+    chapter = "# Chapter {n}\n\n```mermaid\nsequenceDiagram\n    A->>B: step {n}\n```\n"
+    shared = {
+        "project_name": "demo",
+        "output_dir": str(tmp_path),
+        "diagram_format": "png",
+        "repo_url": None,
+        "relationships": {"summary": "S", "details": [{"from": 0, "to": 1, "label": "uses"}]},
+        "chapter_order": [0, 1, 2],
+        "abstractions": [{"name": n, "description": n, "files": []} for n in "ABC"],
+        "chapters": [chapter.format(n=n) for n in range(3)],
+    }
+    nodes.CombineTutorial().run(shared)
+
+    out = tmp_path / "demo"
+    assert batches == [4]  # схема + три главы
+    assert "![Architecture Diagram](diagram.png)" in (out / "index.md").read_text(encoding="utf-8")
+    for md in out.glob("0*.md"):
+        assert "![Diagram](" in md.read_text(encoding="utf-8")
+
+
+# ---------- 6. форматы -------------------------------------------------------
+def _shared(tmp_path, diagram_format):
+    chapter = "# Chapter {n}\n\n```mermaid\nsequenceDiagram\n    A->>B: step {n}\n```\n"
+    return {
+        "project_name": "demo",
+        "output_dir": str(tmp_path),
+        "repo_url": None,
+        "relationships": {"summary": "S", "details": [{"from": 0, "to": 1, "label": "uses"}]},
+        "chapter_order": [0, 1],
+        "abstractions": [{"name": n, "description": n, "files": []} for n in "AB"],
+        "chapters": [chapter.format(n=n) for n in range(2)],
+        "diagram_format": diagram_format,
+    }
+
+
+def test_generate_mermaid_batch_svg(monkeypatch, tmp_path):
+    monkeypatch.setattr(utils.shutil, "which", lambda _cmd: "mmdc")
+    runs = []
+
+    def _fake_run(args, **kwargs):
+        runs.append(args)
+        out = Path(args[args.index("-o") + 1])
+        out.with_name("out-1.svg").write_text("<svg/>", encoding="utf-8")
+
+    monkeypatch.setattr(utils.subprocess, "run", _fake_run)
+    mmd = tmp_path / "d.mmd"
+    mmd.write_text("graph TD; A-->B;", encoding="utf-8")
+
+    assert utils.generate_mermaid_batch([(mmd, tmp_path / "d.svg")]) == {tmp_path / "d.svg"}
+    assert runs[0][runs[0].index("-e") + 1] == "svg"
+
+
+def test_combine_tutorial_svg(tmp_path, monkeypatch):
+    monkeypatch.setattr(nodes, "generate_mermaid_batch", _fake_batch([]))
+    monkeypatch.setattr(nodes, "generate_mermaid_png", lambda *_: False)
+
+    nodes.CombineTutorial().run(_shared(tmp_path, "svg"))
+
+    out = tmp_path / "demo"
+    assert "![Architecture Diagram](diagram.svg)" in (out / "index.md").read_text(encoding="utf-8")
+    assert not list(out.glob("*.png"))
+    assert len(list(out.glob("*.svg"))) == 3
+
+
+def test_combine_tutorial_client_mode_renders_nothing(tmp_path, monkeypatch):
+    def _no_render(*_):
+        raise AssertionError("client mode must not render")
+
+    monkeypatch.setattr(nodes, "generate_mermaid_batch", _no_render)
+    monkeypatch.setattr(nodes, "generate_mermaid_png", _no_render)
+
+    nodes.CombineTutorial().run(_shared(tmp_path, "client"))
+
+    out = tmp_path / "demo"
+    for md in out.glob("*.md"):
+        text = md.read_text(encoding="utf-8")
+        assert "```mermaid" in text
+        assert text.count("mermaid.esm.min.mjs") == 1
+    assert not list(out.glob("*.mmd"))
+
+
+def test_combine_tutorial_defaults_to_svg(tmp_path, monkeypatch):
+    monkeypatch.setattr(nodes, "generate_mermaid_batch", _fake_batch([]))
+    monkeypatch.setattr(nodes, "generate_mermaid_png", lambda *_: False)
+    shared = _shared(tmp_path, "svg")
+    del shared["diagram_format"]
+
+    nodes.CombineTutorial().run(shared)
+
+    assert "![Architecture Diagram](diagram.svg)" in (tmp_path / "demo" / "index.md").read_text(encoding="utf-8")
+
+
+def test_unknown_image_format_is_not_rendered(monkeypatch, tmp_path):
+    monkeypatch.setattr(utils.shutil, "which", lambda _cmd: "mmdc")
+    monkeypatch.setattr(utils.subprocess, "run", lambda *a, **k: pytest.fail("mmdc must not run"))
+    mmd = tmp_path / "d.mmd"
+    mmd.write_text("graph TD; A-->B;", encoding="utf-8")
+
+    assert utils.generate_mermaid_png(mmd, tmp_path / "d.pdf") is False
+    assert utils.generate_mermaid_batch([(mmd, tmp_path / "d.pdf")]) == set()
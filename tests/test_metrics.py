@@ -0,0 +1,188 @@
+# tests/test_metrics.py
+"""
+Метрики запуска:
+  1. call_llm учитывает токены провайдера, попадания в кеш и оценку без usage;
+  2. prep/exec/post шагов замеряются, вызовы LLM из потоков шага — его;
+  3. повторы RetryPolicy и обход при краулинге попадают в отчёт;
+  4. JSON-отчёт, стоимость и сводная таблица.
+"""
+import json
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pocketflow import Node
+
+import nodes
+import utils.call_llm as cl
+from utils.metrics import RunMetrics, format_summary, record_crawl
+from utils.retry import RetryPolicy
+
+
+class _FakeResponse:
+    def __init__(self, text, usage=None):
+        self._text = text
+        self._usage = usage
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        data = {"choices": [{"message": {"content": self._text}}]}
+        if self._usage:
+            data["usage"] = self._usage
+        return data
+
+
+@pytest.fixture
+def openrouter(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "key")
+    monkeypatch.setenv("LLM_STREAM", "0")
+    monkeypatch.setattr(cl, "_http_session", None)
+    cache = {}
+    monkeypatch.setattr(cl, "_cache_get", lambda key, *_: cache.get(key))
+    monkeypatch.setattr(cl, "_cache_set", lambda key, p, m, prompt, text: cache.__setitem__(key, text))
+    usage = {"prompt_tokens": 120, "completion_tokens": 30}
+    monkeypatch.setattr(
+        cl.get_http_session(), "post", lambda url, **kwargs: _FakeResponse("answer", usage)
+    )
+    return usage
+
+
+class _Step(nodes._MeteredStep, Node):
+    def prep(self, shared):
+        return ["a", "b", "c"]
+
+    def exec(self, prompts):
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            return list(pool.map(lambda p: cl.call_llm(p, use_cache=False), prompts))
+
+    def post(self, shared, prep_res, exec_res):
+        shared["answers"] = exec_res
+
+
+# ---------- 1. call_llm ------------------------------------------------------
+def test_call_llm_records_usage_and_cache_hits(openrouter):
+    metrics = RunMetrics()
+    with metrics.activate():
+        cl.call_llm("prompt")
+        cl.call_llm("prompt")  # из кеша
+        cl.call_llm("prompt", use_cache=False)
+
+    first, second, third = metrics.calls
+    assert (first.cache, first.prompt_tokens, first.completion_tokens) == ("miss", 120, 30)
+    assert second.cache == "hit" and second.estimated
+    assert third.cache == "off" and not third.estimated
+
+
+def test_call_llm_outside_a_run_records_nothing(openrouter):
+    assert cl.call_llm("prompt", use_cache=False) == "answer"
+    metrics = RunMetrics()
+    assert metrics.report()["llm"]["llm_calls"] == 0
+
+
+def test_failed_call_is_recorded(monkeypatch, openrouter):
+    def _fail(url, **kwargs):
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(cl.get_http_session(), "post", _fail)
+    metrics = RunMetrics()
+    with metrics.activate(), pytest.raises(ConnectionError):
+        cl.call_llm("prompt", use_cache=False)
+
+    assert metrics.calls[0].error == "ConnectionError"
+
+
+# ---------- 2. шаги Flow -----------------------------------------------------
+def test_step_phases_and_llm_calls_from_threads(openrouter):
+    ticks = itertools.count()
+    metrics = RunMetrics(clock=lambda: float(next(ticks)))
+    shared = {}
+    with metrics.activate():
+        _Step()._run(shared)
+
+    assert shared["answers"] == ["answer"] * 3
+    stage = metrics.report()["stages"][0]
+    assert stage["name"] == "_Step" and stage["runs"] == 1
+    assert stage["prep"] == stage["exec"] == stage["post"] == 1.0
+    assert stage["llm_calls"] == 3
+    assert stage["prompt_tokens"] == 360
+
+
+def test_reused_step_is_reported(tmp_path):
+    metrics = RunMetrics()
+    shared = {"reusable_outputs": {"relationships": {"summary": "S", "details": []}}}
+    with metrics.activate():
+        nodes.AnalyzeRelationships()._run(shared)
+
+    stage = metrics.report()["stages"][0]
+    assert stage["name"] == "AnalyzeRelationships"
+    assert stage["reused"] and stage["runs"] == 0
+    assert "reused" in format_summary(metrics.report())
+
+
+# ---------- 3. повторы и краулинг --------------------------------------------
+def test_retries_and_repairs_are_counted():
+    answers = iter(["not yaml", "still not yaml", "ok"])
+    failures = [ConnectionError("down")]
+
+    def _llm(prompt, use_cache=True):
+        if failures:
+            raise failures.pop()
+        return next(answers)
+
+    def _parse(text):
+        if text != "ok":
+            raise ValueError("bad")
+        return text
+
+    metrics = RunMetrics()
+    policy = RetryPolicy(max_attempts=3, max_repairs=2, sleep=lambda _s: None)
+    with metrics.activate():
+        assert policy.run(_llm, "prompt", parse=_parse) == "ok"
+
+    assert metrics.report()["retries"] == {"total": 3, "by_kind": {"transient": 1, "malformed": 2}}
+
+
+def test_crawl_bytes(tmp_path):
+    (tmp_path / "a.py").write_text("x = 1\n" * 100, encoding="utf-8")
+    shared = {
+        "repo_url": None,
+        "local_dir": str(tmp_path),
+        "project_name": "demo",
+        "include_patterns": {"*.py"},
+        "exclude_patterns": set(),
+        "max_file_size": 100000,
+        "quiet": True,
+    }
+    metrics = RunMetrics()
+    with metrics.activate():
+        nodes.FetchRepo()._run(shared)
+        record_crawl({"bytes_read": 10, "included": 1})
+
+    assert metrics.report()["crawl"]["bytes"] == 600 + 10
+    assert metrics.report()["crawl"]["files"] == 2
+    assert metrics.report()["stages"][0]["name"] == "FetchRepo"
+
+
+# ---------- 4. отчёт ---------------------------------------------------------
+def test_report_cost_and_summary(tmp_path, monkeypatch, openrouter):
+    monkeypatch.setenv("LLM_PRICE_PROMPT", "1.0")
+    monkeypatch.setenv("LLM_PRICE_COMPLETION", "10.0")
+    metrics = RunMetrics(run_id="run-1")
+    with metrics.activate():
+        _Step()._run({})
+        cl.call_llm("prompt")
+        cl.call_llm("prompt")  # попадание в кеш бесплатно
+
+    path = tmp_path / "reports" / "run.json"
+    report = metrics.write_report(str(path))
+
+    assert json.loads(path.read_text(encoding="utf-8")) == report
+    assert report["llm"]["llm_calls"] == 5
+    assert report["llm"]["billed_prompt_tokens"] == 4 * 120
+    assert report["llm"]["cost_usd"] == pytest.approx((4 * 120 * 1.0 + 4 * 30 * 10.0) / 1e6)
+
+    summary = format_summary(report)
+    assert "_Step" in summary and "Total" in summary
+    assert "cost $" in summary
@@ -0,0 +1,87 @@
+# tests/test_pattern_matcher.py
+"""
+PatternMatcher: одна скомпилированная регулярка вместо цикла по fnmatch.
+
+Проверяем:
+  1. Результат совпадает с any(fnmatch(...)) на типичных шаблонах.
+  2. Отсечение каталогов: целиком исключённые поддеревья, .gitignore "dir/".
+  3. crawl_local_files не заходит в отсечённые каталоги.
+"""
+import fnmatch
+import os
+
+import pathspec
+
+import utils.crawl_local_files as clf
+from main import DEFAULT_EXCLUDE_PATTERNS, DEFAULT_INCLUDE_PATTERNS
+from utils.pattern_matcher import PatternMatcher
+
+PATHS = [
+    "main.py", "src/app.js", "src/app.min.js", "venv/lib/site.py", "a/.venv/x.py",
+    "docs/index.md", "mydocs/a/b.md", "tests/test_x.py", "pkg/test_util.go",
+    "node_modules/x/index.js", "build/out.c", "Dockerfile", "web/Dockerfile",
+    "data/set.yaml", "weird[1].py", "dist/bundle.js",
+]
+
+
+# ---------- 1. эквивалентность fnmatch ------------------------------------
+def test_matches_like_fnmatch_loop():
+    include = DEFAULT_INCLUDE_PATTERNS
+    exclude = DEFAULT_EXCLUDE_PATTERNS
+    matcher = PatternMatcher(include, exclude)
+
+    for path in PATHS:
+        expected_in = any(fnmatch.fnmatch(path, p) for p in include)
+        expected_ex = any(fnmatch.fnmatch(path, p) for p in exclude)
+        assert matcher.is_included(path) == expected_in, path
+        assert matcher.is_excluded(path) == expected_ex, path
+
+
+def test_include_by_name_and_string_patterns():
+    matcher = PatternMatcher("*.py", "tests/*")
+    assert matcher.should_include("src/a.py", "a.py")
+    assert not matcher.should_include("tests/a.py", "a.py")
+    assert not matcher.should_include("src/a.md", "a.md")
+    assert PatternMatcher().should_include("anything")
+
+
+# ---------- 2. отсечение каталогов ----------------------------------------
+def test_prune_dir_covers_whole_subtrees_only():
+    matcher = PatternMatcher(None, {"*venv/*", "tests/*", "dir/?", "*.min.js"})
+
+    assert matcher.should_prune_dir("venv", "venv")
+    assert matcher.should_prune_dir("a/.venv", ".venv")
+    assert matcher.should_prune_dir("tests", "tests")
+    assert not matcher.should_prune_dir("dir", "dir")  # исключены лишь односимвольные имена
+    assert not matcher.should_prune_dir("src", "src")
+
+
+def test_prune_dir_honors_gitignore_directory_rules():
+    spec = pathspec.PathSpec.from_lines("gitwildmatch", ["build/", "*.log"])
+    matcher = PatternMatcher(gitignore_spec=spec)
+
+    assert matcher.should_prune_dir("build", "build")
+    assert matcher.should_prune_dir("pkg/build", "build")
+    assert not matcher.should_prune_dir("src", "src")
+    assert matcher.is_excluded("x/debug.log")
+
+
+# ---------- 3. crawl_local_files не листает отсечённое --------------------
+def test_crawl_local_files_skips_pruned_directories(tmp_path, monkeypatch):
+    for path in ("main.py", "venv/lib/site.py", "build/gen.py", "src/app.py"):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text("x = 1\n")
+    (tmp_path / ".gitignore").write_text("build/\n")
+
+    walked = []
+    real_scandir = os.scandir
+
+    def _scandir(path):
+        walked.append(os.path.relpath(path, tmp_path))
+        return real_scandir(path)
+
+    monkeypatch.setattr(clf.os, "scandir", _scandir)
+    result = clf.crawl_local_files(str(tmp_path), {"*.py"}, {"*venv/*"})
+
+    assert set(result["files"]) == {"main.py", os.path.join("src", "app.py")}
+    assert not any(d.startswith(("venv", "build")) for d in walked)
@@ -0,0 +1,71 @@
+# tests/test_progress.py
+"""
+ProgressReporter: редкие обновления строки на TTY, тишина в quiet-режиме,
+счётчики в stats краулеров.
+"""
+import io
+
+import utils.crawl_local_files as clf
+from utils.progress import ProgressReporter
+
+
+class _Tty(io.StringIO):
+    def isatty(self):
+        return True
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# ---------- 1. TTY: перерисовка не чаще interval --------------------------
+def test_tty_updates_are_rate_limited():
+    stream, clock = _Tty(), _Clock()
+    progress = ProgressReporter("Crawl", stream=stream, interval=1.0, clock=clock)
+
+    for _ in range(1000):
+        progress.scan()
+    clock.now = 1.5
+    progress.scan()
+
+    assert stream.getvalue().count("\r") == 2
+    assert "1001 scanned" in stream.getvalue()
+
+
+# ---------- 2. не TTY: только итог; quiet: ничего -------------------------
+def test_non_tty_prints_only_summary_and_quiet_prints_nothing():
+    stream = io.StringIO()
+    progress = ProgressReporter("Crawl", stream=stream)
+    for i in range(10):
+        progress.scan()
+        progress.add(f"f{i}", 100)
+    progress.finish()
+    assert stream.getvalue().splitlines() == ["Crawl: 10 scanned, 10 included, 0 skipped, 1 KB read"]
+
+    quiet_stream = _Tty()
+    quiet = ProgressReporter("Crawl", quiet=True, stream=quiet_stream)
+    quiet.scan()
+    quiet.message("warning")
+    quiet.finish()
+    assert quiet_stream.getvalue() == ""
+
+
+# ---------- 3. счётчики в stats краулера ----------------------------------
+def test_crawl_local_files_reports_counters(tmp_path):
+    for name, content in {"a.py": "aa", "b.md": "b", "big.py": "x" * 100}.items():
+        (tmp_path / name).write_text(content)
+    stream = io.StringIO()
+
+    result = clf.crawl_local_files(
+        str(tmp_path), {"*.py"}, max_file_size=50,
+        progress=ProgressReporter(quiet=True, stream=stream),
+    )
+
+    stats = result["stats"]
+    assert (stats["scanned"], stats["included"], stats["bytes_read"]) == (3, 1, 2)
+    assert stats["skipped_by_reason"] == {"pattern": 1, "size": 1}
+    assert stream.getvalue() == ""
@@ -0,0 +1,147 @@
+# tests/test_retry.py
+"""
+RetryPolicy: классы ошибок, экспоненциальная задержка с джиттером,
+Retry-After для 429 и дешёвый «repair»-запрос вместо полной перегенерации.
+"""
+import pytest
+import requests
+
+import nodes
+from utils.retry import (
+    FATAL,
+    MALFORMED,
+    RATE_LIMIT,
+    TRANSIENT,
+    MalformedOutputError,
+    RetryPolicy,
+)
+
+
+def _http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def _policy(sleeps, **kwargs):
+    return RetryPolicy(sleep=sleeps.append, rand=lambda: 1.0, **kwargs)
+
+
+# ---------- 1. Классификация и задержки ------------------------------------
+def test_classify():
+    policy = RetryPolicy()
+    assert policy.classify(_http_error(429)) == RATE_LIMIT
+    assert policy.classify(_http_error(503)) == TRANSIENT
+    assert policy.classify(_http_error(408)) == TRANSIENT
+    assert policy.classify(_http_error(401)) == FATAL
+    assert policy.classify(requests.ConnectionError("reset")) == TRANSIENT
+    assert policy.classify(MalformedOutputError(ValueError("bad"), "x")) == MALFORMED
+
+
+def test_exponential_backoff_is_capped_and_jittered():
+    policy = RetryPolicy(base_delay=2, max_delay=10, rand=lambda: 1.0)
+    error = requests.Timeout("slow")
+    assert [policy.delay(TRANSIENT, n, error) for n in range(5)] == [2, 4, 8, 10, 10]
+    policy.rand = lambda: 0.25
+    assert policy.delay(TRANSIENT, 2, error) == 2
+
+
+def test_rate_limit_honors_retry_after():
+    sleeps = []
+    calls = []
+
+    def _llm(prompt, use_cache=True):
+        calls.append(use_cache)
+        if len(calls) == 1:
+            raise _http_error(429, {"Retry-After": "7"})
+        return "ok"
+
+    assert _policy(sleeps).run(_llm, "p") == "ok"
+    assert sleeps == [7.0]
+    # Кеш — только для первой попытки
+    assert calls == [True, False]
+
+
+def test_fatal_error_is_not_retried():
+    sleeps = []
+    calls = []
+
+    def _llm(prompt, use_cache=True):
+        calls.append(prompt)
+        raise _http_error(401)
+
+    with pytest.raises(requests.HTTPError):
+        _policy(sleeps).run(_llm, "p")
+    assert len(calls) == 1 and sleeps == []
+
+
+def test_gives_up_after_max_attempts():
+    sleeps = []
+
+    def _llm(prompt, use_cache=True):
+        raise requests.ConnectionError("down")
+
+    with pytest.raises(requests.ConnectionError):
+        _policy(sleeps, max_attempts=3, base_delay=1).run(_llm, "p")
+    assert sleeps == [1, 2]
+
+
+# ---------- 2. Ремонт некорректного YAML -----------------------------------
+def test_malformed_output_is_repaired_without_regeneration():
+    sleeps = []
+    prompts = []
+
+    def _llm(prompt, use_cache=True):
+        prompts.append(prompt)
+        return "no yaml here" if len(prompts) == 1 else "```yaml\n- 0\n```"
+
+    result = _policy(sleeps).run(
+        _llm, "BIG PROMPT", parse=lambda r: nodes._parse_chapter_order(r, 1)
+    )
+    assert result == [0]
+    assert len(prompts) == 2
+    assert "BIG PROMPT" not in prompts[1] and "no yaml here" in prompts[1]
+    assert sleeps == []
+
+
+def test_regenerates_when_repair_fails():
+    sleeps = []
+    prompts = []
+
+    def _llm(prompt, use_cache=True):
+        prompts.append(prompt)
+        return "```yaml\n- 1\n- 0\n```" if len(prompts) == 3 else "garbage"
+
+    result = _policy(sleeps, max_attempts=2).run(
+        _llm, "BIG PROMPT", parse=lambda r: nodes._parse_chapter_order(r, 2)
+    )
+    assert result == [1, 0]
+    # полный запрос, ремонт, снова полный запрос — без паузы
+    assert [p == "BIG PROMPT" for p in prompts] == [True, False, True]
+    assert sleeps == []
+
+
+def test_node_uses_policy(monkeypatch):
+    prompts = []
+
+    def _fake_llm(prompt, use_cache=True, expect_fence=None):
+        prompts.append(prompt)
+        if len(prompts) == 1:
+            return "```yaml\n- 0 # A\n- 0 # A\n```"  # дубликат
+        return "```yaml\n- 1 # B\n- 0 # A\n```"
+
+    monkeypatch.setattr(nodes, "call_llm", _fake_llm)
+    shared = {
+        "abstractions": [
+            {"name": "A", "description": "a", "files": []},
+            {"name": "B", "description": "b", "files": []},
+        ],
+        "relationships": {"summary": "S", "details": [{"from": 0, "to": 1, "label": "uses"}]},
+        "project_name": "demo",
+        "use_cache": False,
+    }
+    nodes.OrderChapters(retry_policy=RetryPolicy(max_attempts=1)).run(shared)
+
+    assert shared["chapter_order"] == [1, 0]
+    assert "ordered list entry: 0" in prompts[1] and "- 0 # A\n- 0 # A" in prompts[1]
@@ -0,0 +1,148 @@
+# tests/test_write_chapters.py
+"""
+Тесты узла WriteChapters: последовательный и параллельный режимы.
+
+Проверяем:
+  1. Последовательный режим передаёт текст предыдущих глав в промпт.
+  2. Параллельный режим сохраняет порядок глав, реально пишет их
+     одновременно и добавляет недостающие ссылки prev/next — на языке
+     туториала или, для незнакомого языка, голыми ссылками.
+  3. Файлы главы читаются только при её написании: prep держит лишь
+     пути, перенесённые из прошлого прогона главы файлы не читают.
+"""
+import threading
+import time
+
+import nodes
+from utils.file_table import FileRecord, LazyFileTable
+
+
+def _shared(concurrency):
+    names = ["Alpha", "Beta", "Gamma", "Delta"]
+    return {
+        "project_name": "demo",
+        "language": "english",
+        "use_cache": False,
+        "llm_concurrency": concurrency,
+        "files": [("a.py", "print('a')")],
+        "abstractions": [
+            {"name": n, "description": f"About {n}", "files": [0]} for n in names
+        ],
+        "chapter_order": [2, 0, 3, 1],
+    }
+
+
+def _run(node, shared):
+    prep = node.prep(shared)
+    res = node._exec(prep)
+    node.post(shared, prep, res)
+    return shared["chapters"]
+
+
+# ---------- 1. последовательный режим -------------------------------------
+def test_sequential_passes_previous_chapter_text(monkeypatch):
+    prompts = []
+
+    def _fake_llm(prompt, use_cache=True):
+        prompts.append(prompt)
+        return f"# Chapter {len(prompts)}: X\n\nBODY-{len(prompts)}"
+
+    monkeypatch.setattr(nodes, "call_llm", _fake_llm)
+
+    chapters = _run(nodes.WriteChapters(), _shared(1))
+
+    assert len(chapters) == 4
+    assert "This is the first chapter." in prompts[0]
+    assert "BODY-1" in prompts[1] and "BODY-2" in prompts[2]
+
+
+# ---------- 2. параллельный режим -----------------------------------------
+def test_parallel_keeps_order_and_adds_transitions(monkeypatch):
+    active, peak = 0, 0
+    lock = threading.Lock()
+
+    def _fake_llm(prompt, use_cache=True):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        # первая глава отвечает дольше всех — порядок не должен сбиться
+        time.sleep(0.15 if "This is Chapter 1." in prompt else 0.05)
+        with lock:
+            active -= 1
+        num = prompt.split("This is Chapter ")[1].split(".")[0]
+        return f"# Chapter {num}: X\n\nDraft {num}"
+
+    monkeypatch.setattr(nodes, "call_llm", _fake_llm)
+
+    chapters = _run(nodes.WriteChapters(), _shared(4))
+
+    assert peak > 1, "главы писались последовательно"
+    assert [c.splitlines()[0] for c in chapters] == [
+        f"# Chapter {n}: X" for n in range(1, 5)
+    ]
+    assert all(f"Draft {n}" in c for n, c in enumerate(chapters, start=1))
+    # ссылки на соседние главы дописаны последовательным проходом
+    assert "(02_alpha.md)" in chapters[0]
+    assert "(01_gamma.md)" in chapters[1] and "(03_delta.md)" in chapters[1]
+    assert "(03_delta.md)" in chapters[3]
+
+
+def test_parallel_draft_sees_outline_of_previous_chapters(monkeypatch):
+    prompts = {}
+
+    def _fake_llm(prompt, use_cache=True):
+        num = int(prompt.split("This is Chapter ")[1].split(".")[0])
+        prompts[num] = prompt
+        return f"# Chapter {num}: X\n\nDraft"
+
+    monkeypatch.setattr(nodes, "call_llm", _fake_llm)
+
+    _run(nodes.WriteChapters(), _shared(2))
+
+    assert "This is the first chapter." in prompts[1]
+    assert "Chapter 1: Gamma\nAbout Gamma" in prompts[3]
+    assert "Chapter 2: Alpha\nAbout Alpha" in prompts[3]
+
+
+def test_parallel_transitions_follow_language(monkeypatch):
+    def _fake_llm(prompt, use_cache=True):
+        num = prompt.split("This is Chapter ")[1].split(".")[0]
+        return f"# Chapter {num}: X\n\nDraft"
+
+    monkeypatch.setattr(nodes, "call_llm", _fake_llm)
+
+    russian = _run(nodes.WriteChapters(), {**_shared(2), "language": "Russian"})
+    assert "В предыдущей главе мы рассмотрели [Gamma](01_gamma.md)." in russian[1]
+    assert "Далее: [Delta](03_delta.md)" in russian[1]
+
+    other = _run(nodes.WriteChapters(), {**_shared(2), "language": "klingon"})
+    assert "← [Gamma](01_gamma.md)" in other[1] and "→ [Delta](03_delta.md)" in other[1]
+    assert "previous chapter" not in other[1] and "Next:" not in other[1]
+
+
+# ---------- 3. содержимое файлов — только для пишущихся глав ----------------
+def test_files_are_loaded_only_for_written_chapters(monkeypatch):
+    loaded = []
+
+    def _loader(record):
+        loaded.append(record.path)
+        return f"# {record.path}"
+
+    paths = ["alpha.py", "beta.py", "gamma.py", "delta.py"]
+    table = LazyFileTable([FileRecord(p, 1, "0" * 64, p) for p in paths], _loader)
+    shared = {**_shared(1), "files": table}
+    for i, abstraction in enumerate(shared["abstractions"]):
+        abstraction["files"] = [i]
+    monkeypatch.setattr(nodes, "call_llm", lambda prompt, use_cache=True: "# Chapter 1: X\n\nBody")
+
+    items = nodes.WriteChapters().prep(shared)
+    assert loaded == []  # prep держит только пути
+    assert items[0]["related_files"] == [(2, "gamma.py")]
+
+    # Глава про Alpha (вторая) не изменилась с прошлого прогона
+    shared["previous_manifest"] = {"chapters": [{"key": items[1]["chapter_key"], "content": "old"}]}
+    chapters = _run(nodes.WriteChapters(), shared)
+
+    assert chapters[1] == "old"
+    assert sorted(loaded) == ["beta.py", "delta.py", "gamma.py"]
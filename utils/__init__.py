@@ -1,8 +1,22 @@
 # utils/__init__.py
+import functools
+import json
+import os
 import shutil
 import subprocess
+import tempfile
 from pathlib import Path
-from typing import Union
+from typing import Sequence, Set, Tuple, Union
+
+# Тайм-аут рендера одной диаграммы; он же — потолок для запуска mmdc на пачку
+MERMAID_TIMEOUT = int(os.getenv("MERMAID_TIMEOUT", "60"))
+# Пачке: запуск mmdc (Node + headless Chromium) плюс секунды на каждую диаграмму
+MERMAID_STARTUP_TIMEOUT = 20
+MERMAID_BATCH_ITEM_TIMEOUT = 2
+# Тема mmdc (-t); входит в ключ глобального кеша диаграмм
+MERMAID_THEME = os.getenv("MERMAID_THEME", "default")
+# Форматы картинок, которые умеет mmdc (выбираются расширением выходного файла)
+MERMAID_IMAGE_FORMATS = ("svg", "png")
 
 
 def is_tool_available(tool: str) -> bool:
@@ -13,21 +27,26 @@ def is_tool_available(tool: str) -> bool:
 def generate_mermaid_png(
     mmd_path: Union[str, Path],
     png_path: Union[str, Path],
+    timeout: int = MERMAID_TIMEOUT,
 ) -> bool:
     """
-    Конвертирует Mermaid-файл (.mmd) в PNG с помощью CLI `mmdc`.
+    Конвертирует Mermaid-файл (.mmd) в картинку с помощью CLI `mmdc`.
+    Формат — по расширению `png_path` (.png или .svg): SVG заметно
+    меньше и не требует растеризации.
 
     Возвращает
     ----------
     bool
-        • True  — PNG успешно сгенерирован и сохранён.
+        • True  — картинка успешно сгенерирована и сохранена.
         • False — CLI недоступна *или* при запуске произошла любая
           из перехватываемых ошибок.
 
     Функция устойчива к сбоям: при любой проблеме она молча возвращает False,
     чтобы не ронять основной workflow.
     """
-    # 1) Проверяем, что CLI найдена в PATH
+    # 1) Проверяем формат и что CLI найдена в PATH
+    if Path(png_path).suffix.lstrip(".") not in MERMAID_IMAGE_FORMATS:
+        return False
     mmdc_path = shutil.which("mmdc")
     if not mmdc_path:
         return False
@@ -35,9 +54,9 @@ def generate_mermaid_png(
     # 2) Пытаемся вызвать CLI
     try:
         subprocess.run(
-            [mmdc_path, "-i", str(mmd_path), "-o", str(png_path)],
+            [mmdc_path, "-i", str(mmd_path), "-o", str(png_path), "-t", MERMAID_THEME],
             check=True,
-            timeout=60,  # защита от зависания
+            timeout=timeout,  # защита от зависания
         )
         return True
     except (
@@ -47,3 +66,87 @@ def generate_mermaid_png(
         subprocess.TimeoutExpired,   # обработка тайм-аута
     ):
         return False
+
+
+def generate_mermaid_batch(
+    jobs: Sequence[Tuple[Union[str, Path], Union[str, Path]]],
+    timeout: int = MERMAID_TIMEOUT,
+) -> Set[Path]:
+    """
+    Рендерит пачку диаграмм одним запуском `mmdc`, то есть за один старт
+    браузера: все .mmd собираются в один Markdown-файл, а `mmdc` в режиме
+    Markdown (mermaid-cli ≥ 10) пишет по картинке `out-<n>.<формат>` на блок.
+
+    `jobs` — пары (.mmd, картинка); формат берётся из расширения картинки
+    первого задания (в пачке он у всех один). Тайм-аут — время запуска плюс
+    несколько секунд на диаграмму, но не больше `timeout`: одна зависшая
+    диаграмма не держит всю пачку дольше одного MERMAID_TIMEOUT. Возвращает
+    множество картинок, которые удалось получить; остальные вызывающий код
+    рендерит по одной (generate_mermaid_png), каждую со своим тайм-аутом.
+    Как и generate_mermaid_png, при любой ошибке молча возвращает то,
+    что успело получиться.
+    """
+    mmdc_path = shutil.which("mmdc")
+    if not mmdc_path or not jobs:
+        return set()
+
+    fmt = Path(jobs[0][1]).suffix.lstrip(".")
+    if fmt not in MERMAID_IMAGE_FORMATS:
+        return set()
+    rendered: Set[Path] = set()
+    with tempfile.TemporaryDirectory(prefix="mermaid-batch-") as tmp:
+        batch_md = Path(tmp) / "batch.md"
+        out_md = Path(tmp) / "out.md"
+        batch_md.write_text(
+            "\n\n".join(
+                f"```mermaid\n{Path(mmd).read_text(encoding='utf-8').strip()}\n```"
+                for mmd, _ in jobs
+            ),
+            encoding="utf-8",
+        )
+        try:
+            subprocess.run(
+                [mmdc_path, "-i", str(batch_md), "-o", str(out_md), "-e", fmt, "-t", MERMAID_THEME],
+                check=True,
+                timeout=min(MERMAID_STARTUP_TIMEOUT + MERMAID_BATCH_ITEM_TIMEOUT * len(jobs), timeout),
+            )
+        except (
+            subprocess.CalledProcessError,
+            FileNotFoundError,
+            PermissionError,
+            subprocess.TimeoutExpired,
+        ):
+            pass  # что-то могло отрендериться до ошибки — заберём его
+
+        for n, (_, image_path) in enumerate(jobs, start=1):
+            produced = Path(tmp) / f"out-{n}.{fmt}"
+            if produced.exists():
+                shutil.move(str(produced), str(image_path))
+                rendered.add(Path(image_path))
+    return rendered
+
+
+@functools.lru_cache(maxsize=1)
+def mermaid_cli_version() -> str:
+    """
+    Версия mermaid-cli для ключа кеша диаграмм — без запуска `mmdc`:
+    берётся из package.json пакета @mermaid-js/mermaid-cli рядом с
+    исполняемым файлом. Если его не найти — путь и mtime самого `mmdc`
+    (меняются при переустановке); без `mmdc` — "missing".
+    """
+    mmdc_path = shutil.which("mmdc")
+    if not mmdc_path:
+        return "missing"
+    real = Path(os.path.realpath(mmdc_path))
+    for parent in list(real.parents)[:4]:
+        package_json = parent / "package.json"
+        try:
+            package = json.loads(package_json.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        if package.get("name") == "@mermaid-js/mermaid-cli":
+            return str(package.get("version"))
+    try:
+        return f"{real}@{real.stat().st_mtime_ns}"
+    except OSError:
+        return str(real)
@@ -1,9 +1,17 @@
 import os
 import json
 import logging
+import queue
+import threading
 import requests
 from datetime import datetime
+from typing import Dict, Iterator, Optional
 from google import genai
+from requests.adapters import HTTPAdapter
+
+from utils.llm_cache import cache_key, get_cache
+from utils.metrics import note_cache_hit, note_usage, track_llm_call
+from utils.retry import MalformedOutputError
 
 # ================== Настройка логирования ==================
 log_directory = os.getenv("LOG_DIR", "logs")
@@ -21,91 +29,378 @@ file_handler.setFormatter(
 )
 logger.addHandler(file_handler)
 
-# Файл для кеша ответов
-cache_file = "llm_cache.json"
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# ================== Переиспользуемые клиенты ==================
+# Одна HTTP-сессия с пулом keep-alive соединений и по одному genai.Client
+# на API-ключ: без них каждый вызов платил за TCP+TLS рукопожатие или
+# создание клиента. Создаются лениво, под блокировкой — call_llm вызывается
+# из нескольких потоков (параллельная запись глав).
+HTTP_POOL_SIZE = int(os.getenv("LLM_HTTP_POOL_SIZE", "16"))
+
+_clients_lock = threading.Lock()
+_http_session: Optional[requests.Session] = None
+_genai_clients: Dict[str, genai.Client] = {}
+
+
+def get_http_session() -> requests.Session:
+    """Общая `requests.Session` с пулом на HTTP_POOL_SIZE соединений."""
+    global _http_session
+    if _http_session is None:
+        with _clients_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=HTTP_POOL_SIZE,
+                    pool_block=True,  # не открывать сверх пула — ждать свободное
+                    max_retries=0,    # повторы — забота узлов Flow
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
+
+
+def get_genai_client(api_key: str) -> genai.Client:
+    """Кешированный `genai.Client` для данного API-ключа."""
+    client = _genai_clients.get(api_key)
+    if client is None:
+        with _clients_lock:
+            client = _genai_clients.get(api_key)
+            if client is None:
+                client = genai.Client(api_key=api_key)
+                _genai_clients[api_key] = client
+    return client
+
+
+def _resolve_model() -> tuple[str, str]:
+    """Возвращает (provider, model) для текущего окружения."""
+    if os.getenv("OPENROUTER_API_KEY", "").strip():
+        return "openrouter", os.getenv("OPENROUTER_MODEL", "google/gemma-3-27b-it")
+    return "gemini", os.getenv("GEMINI_MODEL", "gemini-2.5-pro-exp-03-25")
+
+
+# ================== Потоковый режим ==================
+# По умолчанию ответ читается потоком: вместо общего таймаута действует
+# таймаут простоя (сколько можно ждать следующего фрагмента), так что длинные
+# главы не обрываются, а зависшие соединения отваливаются быстро.
+CONNECT_TIMEOUT = 10
+
+
+def _streaming_enabled() -> bool:
+    return os.getenv("LLM_STREAM", "1") != "0"
+
+
+def _idle_timeout() -> float:
+    return float(os.getenv("LLM_IDLE_TIMEOUT", "60"))
+
+
+def _fence_window() -> int:
+    """Сколько символов ответа ждать блок ```yaml, прежде чем оборвать поток."""
+    return int(os.getenv("LLM_FENCE_WINDOW", "2000"))
+
+
+def _cache_get(key: str, provider: str, model: str) -> Optional[str]:
+    try:
+        return get_cache(legacy_scope=(provider, model)).get(key)
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать кеш: {e}")
+        return None
+
+
+def _cache_set(key: str, provider: str, model: str, prompt: str, response_text: str):
+    try:
+        get_cache(legacy_scope=(provider, model)).set(key, response_text, prompt=prompt)
+    except Exception as e:
+        logger.error(f"Failed to save cache: {e}")
+
+
+def _openrouter_headers() -> Dict[str, str]:
+    openrouter_key = os.getenv("OPENROUTER_API_KEY", "").strip()
+    return {
+        "Authorization": f"Bearer {openrouter_key}",
+        "Content-Type": "application/json",
+        # при желании:
+        # "HTTP-Referer": os.getenv("REFERER_URL", ""),
+        # "X-Title": os.getenv("SITE_TITLE", ""),
+    }
+
+
+def _complete_openrouter(model: str, prompt: str) -> str:
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "user", "content": prompt}
+        ]
+    }
+    try:
+        resp = get_http_session().post(
+            OPENROUTER_URL,
+            headers=_openrouter_headers(),
+            json=payload,
+            timeout=(CONNECT_TIMEOUT, _idle_timeout())
+        )
+        resp.raise_for_status()
+    except Exception as e:
+        logger.error(f"OpenRouter API error: {e}")
+        raise
+
+    data = resp.json()
+    usage = data.get("usage") or {}
+    note_usage(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+    return data["choices"][0]["message"]["content"]
+
+
+def _stream_openrouter(model: str, prompt: str) -> Iterator[str]:
+    """Фрагменты ответа OpenRouter из SSE-потока (`stream: true`)."""
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "user", "content": prompt}
+        ],
+        "stream": True,
+    }
+    try:
+        # таймаут чтения у requests — это и есть таймаут простоя между байтами
+        resp = get_http_session().post(
+            OPENROUTER_URL,
+            headers=_openrouter_headers(),
+            json=payload,
+            stream=True,
+            timeout=(CONNECT_TIMEOUT, _idle_timeout())
+        )
+        resp.raise_for_status()
+    except Exception as e:
+        logger.error(f"OpenRouter API error: {e}")
+        raise
+
+    with resp:
+        for raw_line in resp.iter_lines():
+            # строки декодируем сами: у text/event-stream часто нет charset
+            line = raw_line.decode("utf-8")
+            if not line.startswith("data:"):
+                continue  # пустые строки и keep-alive комментарии (": ...")
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if "error" in chunk:
+                raise RuntimeError(f"OpenRouter stream error: {chunk['error']}")
+            usage = chunk.get("usage")
+            if usage:  # последний фрагмент несёт расход токенов
+                note_usage(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+            choices = chunk.get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+
+
+def _complete_gemini(model: str, prompt: str) -> str:
+    client = get_genai_client(os.getenv("GEMINI_API_KEY", ""))
+    response = client.models.generate_content(model=model, contents=[prompt])
+    _note_gemini_usage(response)
+    return response.text
+
+
+def _stream_gemini(model: str, prompt: str) -> Iterator[str]:
+    """Фрагменты ответа Gemini из generate_content_stream."""
+    client = get_genai_client(os.getenv("GEMINI_API_KEY", ""))
+    chunks = _with_idle_timeout(
+        lambda: client.models.generate_content_stream(model=model, contents=[prompt]),
+        _idle_timeout(),
+    )
+    for chunk in chunks:
+        _note_gemini_usage(chunk)  # у потока — нарастающий итог
+        if chunk.text:
+            yield chunk.text
+
+
+def _note_gemini_usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    if isinstance(prompt_tokens, int):
+        completion_tokens = getattr(usage, "candidates_token_count", None)
+        note_usage(prompt_tokens, completion_tokens if isinstance(completion_tokens, int) else 0)
+
+
+def _with_idle_timeout(make_iterator, timeout: float) -> Iterator:
+    """
+    Читает итератор в фоновом потоке и отдаёт его элементы; если следующий
+    элемент не пришёл за `timeout` секунд — TimeoutError. У genai нет
+    таймаута между фрагментами, поэтому ждём очередь, а не сокет.
+
+    При таймауте или уходе потребителя поток закрывается (close()), чтобы
+    фоновый поток не дочитывал ответ впустую. Генератор, занятый чтением,
+    из чужого потока не закрыть — тогда его закрывает сам фоновый поток,
+    как только дождётся следующего фрагмента.
+    """
+    items: "queue.Queue" = queue.Queue()
+    stop = threading.Event()
+    done = object()
+    source = []
+
+    def _produce():
+        iterator = None
+        try:
+            iterator = iter(make_iterator())
+            source.append(iterator)
+            for item in iterator:
+                if stop.is_set():
+                    break
+                items.put((item, None))
+        except BaseException as e:
+            items.put((None, e))
+        else:
+            items.put((done, None))
+        finally:
+            _close_quietly(iterator)
+
+    threading.Thread(target=_produce, daemon=True).start()
+    try:
+        while True:
+            try:
+                item, error = items.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"LLM stream idle for more than {timeout:g}s")
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+        for iterator in source:
+            _close_quietly(iterator)
+
+
+def _close_quietly(iterator):
+    close = getattr(iterator, "close", None)
+    if close is None:
+        return
+    try:
+        close()
+    except Exception:  # ValueError: генератор сейчас выполняется в другом потоке
+        pass
 
 
-def call_llm(prompt: str, use_cache: bool = True) -> str:
+def stream_llm(prompt: str, use_cache: bool = True) -> Iterator[str]:
+    """
+    Потоковый вариант call_llm: отдаёт фрагменты ответа по мере генерации.
+    Ответ из кеша приходит одним фрагментом. В кеш и в лог ответ попадает,
+    только если поток дочитан до конца — оборванный потребителем (через
+    close() или выход из цикла) не кешируется.
+    """
+    logger.info(f"PROMPT: {prompt}")
+
+    provider, model = _resolve_model()
+    key = cache_key(prompt, provider, model, {})
+    if use_cache:
+        cached = _cache_get(key, provider, model)
+        if cached is not None:
+            logger.info(f"RESPONSE (cache): {cached}")
+            note_cache_hit()
+            yield cached
+            return
+
+    if provider == "openrouter":
+        chunks = _stream_openrouter(model, prompt)
+    else:
+        chunks = _stream_gemini(model, prompt)
+
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    response_text = "".join(parts)
+    logger.info(f"RESPONSE ({'OpenRouter' if provider == 'openrouter' else 'Gemini'}, stream): {response_text}")
+
+    if use_cache:
+        _cache_set(key, provider, model, prompt, response_text)
+
+
+def call_llm(prompt: str, use_cache: bool = True, expect_fence: Optional[str] = None) -> str:
     """
     Универсальная обёртка над LLM: если задан OPENROUTER_API_KEY — уходит запрос
     в OpenRouter.ai, иначе — в Google Gemini через google-genai.
-    Результаты при use_cache=True сохраняются локально в JSON-файле.
+    Результаты при use_cache=True сохраняются в дисковом кеше
+    (см. utils.llm_cache; бэкенд задаётся LLM_CACHE_BACKEND). Ключ кеша
+    учитывает провайдера и модель, так что их смена не отдаёт чужие ответы.
+
+    Ответ читается потоком (LLM_STREAM=0 — одним запросом) с таймаутом
+    простоя LLM_IDLE_TIMEOUT. С `expect_fence="yaml"` поток обрывается, если
+    в первых LLM_FENCE_WINDOW символах нет блока ```yaml: такой ответ всё
+    равно не разберётся, и MalformedOutputError приходит сразу, а не после
+    полной генерации.
+
+    Каждый вызов учитывается в метриках запуска (utils.metrics): время,
+    токены запроса и ответа, попадание в кеш.
     """
+    with track_llm_call(prompt, use_cache) as call:
+        response_text = _call_llm(prompt, use_cache, expect_fence)
+        call.completed(response_text)
+    return response_text
+
+
+def _call_llm(prompt: str, use_cache: bool, expect_fence: Optional[str]) -> str:
+    if _streaming_enabled():
+        return _collect_stream(prompt, use_cache, expect_fence)
+
     logger.info(f"PROMPT: {prompt}")
 
+    provider, model = _resolve_model()
+    # параметров генерации пока нет — когда появятся, они войдут в ключ
+    generation_params = {}
+
     # --- попытка взять из кеша ---
+    key = cache_key(prompt, provider, model, generation_params)
     if use_cache:
-        cache = {}
-        if os.path.exists(cache_file):
-            try:
-                with open(cache_file, "r", encoding="utf-8") as f:
-                    cache = json.load(f)
-            except Exception:
-                logger.warning("Не удалось загрузить кеш, начинаем с пустого")
-        if prompt in cache:
-            logger.info(f"RESPONSE (cache): {cache[prompt]}")
-            return cache[prompt]
+        cached = _cache_get(key, provider, model)
+        if cached is not None:
+            logger.info(f"RESPONSE (cache): {cached}")
+            note_cache_hit()
+            return cached
 
     # --- если есть ключ OpenRouter — используем OpenRouter.ai ---
-    openrouter_key = os.getenv("OPENROUTER_API_KEY", "").strip()
-    if openrouter_key:
-        model = os.getenv("OPENROUTER_MODEL", "google/gemma-3-27b-it")
-        headers = {
-            "Authorization": f"Bearer {openrouter_key}",
-            "Content-Type": "application/json",
-            # при желании:
-            # "HTTP-Referer": os.getenv("REFERER_URL", ""),
-            # "X-Title": os.getenv("SITE_TITLE", ""),
-        }
-        payload = {
-            "model": model,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ]
-        }
-        try:
-            resp = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            resp.raise_for_status()
-        except Exception as e:
-            logger.error(f"OpenRouter API error: {e}")
-            raise
-
-        data = resp.json()
-        response_text = data["choices"][0]["message"]["content"]
+    if provider == "openrouter":
+        response_text = _complete_openrouter(model, prompt)
         logger.info(f"RESPONSE (OpenRouter): {response_text}")
-
     else:
         # --- по умолчанию: Google Gemini через genai.Client ---
-        client = genai.Client(api_key=os.getenv("GEMINI_API_KEY", ""))
-        model = os.getenv("GEMINI_MODEL", "gemini-2.5-pro-exp-03-25")
-        response = client.models.generate_content(model=model, contents=[prompt])
-        response_text = response.text
+        response_text = _complete_gemini(model, prompt)
         logger.info(f"RESPONSE (Gemini): {response_text}")
 
     # --- записываем в кеш ---
     if use_cache:
-        cache = {}
-        if os.path.exists(cache_file):
-            try:
-                with open(cache_file, "r", encoding="utf-8") as f:
-                    cache = json.load(f)
-            except Exception:
-                pass
-        cache[prompt] = response_text
-        try:
-            with open(cache_file, "w", encoding="utf-8") as f:
-                json.dump(cache, f)
-        except Exception as e:
-            logger.error(f"Failed to save cache: {e}")
+        _cache_set(key, provider, model, prompt, response_text)
 
     return response_text
 
 
+def _collect_stream(prompt: str, use_cache: bool, expect_fence: Optional[str]) -> str:
+    fence = f"```{expect_fence}" if expect_fence else None
+    window = _fence_window()
+    parts = []
+    received = 0
+    stream = stream_llm(prompt, use_cache)
+    try:
+        for chunk in stream:
+            parts.append(chunk)
+            received += len(chunk)
+            if fence and received >= window:
+                text = "".join(parts)
+                if fence not in text:
+                    logger.warning(f"Aborted stream: no {fence} block in the first {received} characters")
+                    raise MalformedOutputError(
+                        ValueError(f"No {fence} block in the first {received} characters of the response"),
+                        text,
+                    )
+                fence = None  # блок на месте — дочитываем без проверок
+    finally:
+        stream.close()
+    return "".join(parts)
+
+
 if __name__ == "__main__":
     test_prompt = "Hello, how are you?"
     print("Making call without cache...")
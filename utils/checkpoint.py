@@ -0,0 +1,150 @@
+import json
+import os
+import secrets
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+from utils.file_table import FileRecord, LazyFileTable
+from utils.repo_mirror import RepoMirror
+
+RUNS_DIR_NAME = ".runs"
+
+# Shared keys saved together with a step's output, so a resumed run sees
+# exactly what the step's post() left behind
+COMPANION_KEYS = {
+    "files": ("file_hashes", "project_name"),
+    "chapters": ("chapter_keys",),
+}
+
+
+def _write_json(path: str, data: Any):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class RunCheckpoint:
+    """
+    Run directory under <output_dir>/.runs/<run_id> holding everything needed
+    to resume a tutorial run:
+
+        inputs.json          the shared inputs of the run (no tokens)
+        files.json + blobs/  crawled files, content-addressed
+        <key>.json           output of each finished step (abstractions, ...)
+        chapters/<key>.md    each chapter as soon as it is written
+
+    Steps are saved when their post() completes; chapters individually, so a
+    failure on chapter 8 keeps chapters 1-7. Files already held in a blob
+    store (the repository mirror, or `blobs` itself) are saved as digests
+    plus the store's root, without copying their content. A run that
+    completes removes its directory (`discard`); only failed runs stay.
+    """
+
+    def __init__(self, run_dir: str):
+        self.run_dir = run_dir
+        self.run_id = os.path.basename(run_dir)
+        self.chapter_dir = os.path.join(run_dir, "chapters")
+        self.blobs = RepoMirror(os.path.join(run_dir, "blobs"))
+
+    @classmethod
+    def create(cls, output_dir: str, inputs: Dict) -> "RunCheckpoint":
+        run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(3)}"
+        checkpoint = cls(os.path.join(output_dir, RUNS_DIR_NAME, run_id))
+        os.makedirs(checkpoint.chapter_dir, exist_ok=True)
+        _write_json(os.path.join(checkpoint.run_dir, "inputs.json"), inputs)
+        return checkpoint
+
+    @classmethod
+    def open(cls, output_dir: str, run_id: str) -> "RunCheckpoint":
+        run_dir = os.path.join(output_dir, RUNS_DIR_NAME, run_id)
+        if not os.path.isfile(os.path.join(run_dir, "inputs.json")):
+            raise ValueError(f"No run '{run_id}' in {os.path.join(output_dir, RUNS_DIR_NAME)}")
+        return cls(run_dir)
+
+    def load_inputs(self) -> Dict:
+        return _read_json(os.path.join(self.run_dir, "inputs.json"))
+
+    # --- saving ---
+    def has_output(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.run_dir, f"{key}.json"))
+
+    def save_output(self, key: str, shared: Dict):
+        """Persist shared[key] (plus its companion keys) after a step's post()"""
+        record = {name: shared.get(name) for name in COMPANION_KEYS.get(key, ())}
+        if key == "files":
+            files = shared["files"]
+            store = getattr(files, "blob_store", None)
+            if store is not None:
+                # Contents are already content-addressed on disk: reference them
+                record["blob_root"] = os.path.abspath(store.root)
+                record["files"] = [[r.path, r.digest, r.size] for r in files.records]
+            else:
+                record["files"] = [
+                    [path, self.blobs.put_blob(content), len(content.encode("utf-8"))]
+                    for path, content in files
+                ]
+        else:
+            record[key] = shared[key]
+        _write_json(os.path.join(self.run_dir, f"{key}.json"), record)
+
+    def save_chapter(self, chapter_key: str, content: str):
+        path = os.path.join(self.chapter_dir, f"{chapter_key}.md")
+        fd, tmp_path = tempfile.mkstemp(dir=self.chapter_dir, prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    # --- loading ---
+    def load_outputs(self) -> Dict[str, Dict]:
+        """Saved steps as {key: {key: value, companion: value, ...}}"""
+        outputs = {}
+        for name in sorted(os.listdir(self.run_dir)):
+            if not name.endswith(".json") or name == "inputs.json":
+                continue
+            key = name[: -len(".json")]
+            record = _read_json(os.path.join(self.run_dir, name))
+            if record is None:
+                continue
+            if key == "files":
+                records = [FileRecord(path, size, digest, digest) for path, digest, size in record["files"]]
+                root = record.pop("blob_root", None)
+                store = RepoMirror(root) if root else self.blobs
+                record["files"] = LazyFileTable(records, lambda r, store=store: store.read_blob(r.source))
+            outputs[key] = record
+        return outputs
+
+    def discard(self):
+        """Remove the run directory once the run has completed"""
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+
+    def chapters(self) -> Dict[str, str]:
+        """Chapters written so far, by chapter key"""
+        chapters = {}
+        for name in os.listdir(self.chapter_dir):
+            if name.endswith(".md"):
+                with open(os.path.join(self.chapter_dir, name), "r", encoding="utf-8") as f:
+                    chapters[name[: -len(".md")]] = f.read()
+        return chapters
+
+    def restore(self, shared: Dict):
+        """
+        Put saved outputs back into shared: each finished step becomes a
+        reusable output (the node is skipped) and its companion keys are
+        restored as they were.
+        """
+        reusable = shared.setdefault("reusable_outputs", {})
+        for key, record in self.load_outputs().items():
+            reusable[key] = record.pop(key)
+            shared.update(record)
+        return reusable
@@ -0,0 +1,171 @@
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+# Rough, model-agnostic estimate: ~4 characters per token for code and English
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = 120_000
+
+# How IdentifyAbstractions covers the files: one budget-packed prompt,
+# map-reduce over shards, or "auto" — map-reduce only when build_context
+# would have to drop files even as signatures
+ABSTRACTION_MODES = ("single", "map_reduce", "auto")
+DEFAULT_ABSTRACTION_MODE = "auto"
+
+# File names that usually mark an entry point of a project
+ENTRY_POINT_NAMES = {
+    "main.py", "__main__.py", "app.py", "cli.py", "server.py", "manage.py",
+    "index.js", "index.ts", "main.js", "main.ts", "app.js", "app.ts", "server.js",
+    "main.go", "main.c", "main.cc", "main.cpp", "main.rs", "program.cs",
+    "readme.md", "readme.rst",
+}
+
+# Lines worth keeping when a file has to be reduced to its signatures
+SIGNATURE_RE = re.compile(
+    r"^\s*(?:"
+    r"(?:async\s+)?def\s|class\s|interface\s|struct\s|enum\s|trait\s|impl\s|"
+    r"func\s|fn\s|pub\s|export\s|function\s|type\s|module\s|package\s|"
+    r"(?:public|private|protected|internal|static|abstract)\s|"
+    r"#\s*define\s|template\s*<|@\w+"
+    r")"
+)
+MAX_SIGNATURE_LINES = 60
+IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used for budgeting (no tokenizer dependency)."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def extract_signatures(content: str, max_lines: int = MAX_SIGNATURE_LINES) -> str:
+    """Keep only declaration-like lines (defs, classes, exports...) of a file."""
+    lines = [ln.rstrip() for ln in content.splitlines() if SIGNATURE_RE.match(ln)]
+    if len(lines) > max_lines:
+        omitted = len(lines) - max_lines
+        lines = lines[:max_lines] + [f"... ({omitted} more declarations)"]
+    return "\n".join(lines)
+
+
+def score_files(files_data: Sequence[Tuple[str, str]]) -> List[float]:
+    """
+    Relevance score per file: entry points first, then files that many other
+    files refer to (fan-in by module name), with a mild penalty for size so
+    that one huge file doesn't crowd out several medium ones.
+    """
+    stems = []
+    self_mentions = []
+    mentions = Counter()
+    for path, content in files_data:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        # Count each identifier once per file: fan-in = number of files mentioning it
+        identifiers = set(IDENTIFIER_RE.findall(content))
+        mentions.update(identifiers)
+        stems.append(stem)
+        self_mentions.append(stem in identifiers)
+
+    scores = []
+    for (path, content), stem, own in zip(files_data, stems, self_mentions):
+        name = os.path.basename(path).lower()
+        fan_in = mentions.get(stem, 0) - own  # a file doesn't count towards its own fan-in
+        score = 0.0
+        if name in ENTRY_POINT_NAMES:
+            score += 3.0
+        if stem == "__init__":
+            fan_in = 0  # every package has one; the name says nothing
+        score += math.log2(1 + fan_in)
+        score -= 0.25 * math.log2(1 + estimate_tokens(content) / 1000)
+        scores.append(score)
+    return scores
+
+
+def build_context(
+    files_data: Sequence[Tuple[str, str]],
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+) -> Tuple[str, List[Tuple[int, str]], Dict]:
+    """
+    Pack files into an LLM context that fits `token_budget`.
+
+    Files are ranked by `score_files` and added in full while they fit; the
+    rest are reduced to their signatures if those fit, and dropped otherwise.
+    The context lists the packed files in their original index order.
+
+    Returns:
+        (context, file_info, report) where file_info is the full list of
+        (index, path) and report counts what was packed versus dropped.
+    """
+    scores = score_files(files_data)
+    ranked = sorted(range(len(files_data)), key=lambda i: scores[i], reverse=True)
+
+    remaining = token_budget
+    entries: Dict[int, str] = {}
+    full, signatures, dropped = [], [], []
+    for i in ranked:
+        path, content = files_data[i]
+        entry = f"--- File Index {i}: {path} ---\n{content}\n\n"
+        cost = estimate_tokens(entry)
+        if cost <= remaining:
+            entries[i] = entry
+            remaining -= cost
+            full.append(i)
+            continue
+
+        sig = extract_signatures(content)
+        if sig:
+            entry = f"--- File Index {i}: {path} (signatures only) ---\n{sig}\n\n"
+            cost = estimate_tokens(entry)
+            if cost <= remaining:
+                entries[i] = entry
+                remaining -= cost
+                signatures.append(i)
+                continue
+        dropped.append(i)
+
+    context = "".join(entries[i] for i in sorted(entries))
+    file_info = [(i, path) for i, (path, _) in enumerate(files_data)]
+    report = {
+        "token_budget": token_budget,
+        "used_tokens": token_budget - remaining,
+        "full_count": len(full),
+        "signature_count": len(signatures),
+        "dropped_count": len(dropped),
+        "signature_files": [files_data[i][0] for i in sorted(signatures)],
+        "dropped_files": [files_data[i][0] for i in sorted(dropped)],
+    }
+    return context, file_info, report
+
+
+def shard_files(
+    files_data: Sequence[Tuple[str, str]],
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+) -> List[List[int]]:
+    """
+    Split files into token-bounded shards of global indices for map-reduce.
+
+    Files are grouped by their directory and directories are taken in path
+    order, so neighbouring packages land in the same shard. A directory that
+    doesn't fit into one shard is split; a single file larger than the
+    budget gets a shard of its own (build_context then reduces it to
+    signatures).
+    """
+    by_dir: Dict[str, List[int]] = {}
+    for i, (path, _) in enumerate(files_data):
+        by_dir.setdefault(os.path.dirname(path), []).append(i)
+
+    shards: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for directory in sorted(by_dir):
+        for i in sorted(by_dir[directory], key=lambda idx: files_data[idx][0]):
+            path, content = files_data[i]
+            cost = estimate_tokens(f"--- File Index {i}: {path} ---\n{content}\n\n")
+            if current and current_tokens + cost > token_budget:
+                shards.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += cost
+    if current:
+        shards.append(current)
+    return shards
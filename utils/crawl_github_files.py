@@ -1,12 +1,166 @@
 import requests
 import base64
 import os
+import tarfile
 import tempfile
+import threading
 import git
 import time
-import fnmatch
-from typing import Union, Set, List, Dict, Tuple, Any
-from urllib.parse import urlparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from typing import Union, Set, List, Tuple
+from urllib.parse import quote, urlparse
+
+from utils.crawl_local_files import read_text_file
+from utils.pattern_matcher import PatternMatcher
+from utils.progress import ProgressReporter
+from utils.repo_mirror import SHA_RE, RepoMirror
+from utils.retry import parse_retry_after
+
+GITHUB_API_BASE = "https://api.github.com"
+GITHUB_RAW_BASE = "https://raw.githubusercontent.com"
+DEFAULT_MAX_WORKERS = 8
+
+
+class RateLimiter:
+    """
+    Process-wide view of the GitHub rate limit, shared by all download workers.
+
+    When a response says the limit is exhausted, every worker pauses until
+    the reset time instead of each recursive call sleeping on its own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+
+    def wait(self):
+        """Block while a global pause is in effect"""
+        while True:
+            with self._lock:
+                delay = self._resume_at - time.time()
+            if delay <= 0:
+                return
+            time.sleep(min(delay, 1.0))
+
+    def update(self, response) -> bool:
+        """Record rate-limit headers; returns True if the request must be retried"""
+        exhausted = response.headers.get("X-RateLimit-Remaining") == "0"
+        limited = response.status_code in (403, 429) and (
+            exhausted
+            or "rate limit" in response.text.lower()
+            or "Retry-After" in response.headers
+        )
+        if not limited:
+            if exhausted:
+                # This request made it, but the next one won't: pause everyone now
+                self._pause_until(int(response.headers.get("X-RateLimit-Reset", 0)) + 1)
+            return False
+
+        # Seconds or an HTTP date; anything else falls back to the reset time
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is not None:
+            resume_at = time.time() + retry_after
+        else:
+            reset_time = int(response.headers.get("X-RateLimit-Reset", 0))
+            resume_at = max(reset_time, time.time()) + 1
+        self._pause_until(resume_at)
+        return True
+
+    def _pause_until(self, resume_at):
+        with self._lock:
+            if resume_at > self._resume_at and resume_at > time.time():
+                self._resume_at = resume_at
+                print(f"Rate limit exceeded. Waiting for {resume_at - time.time():.0f} seconds...")
+
+
+def create_session(max_workers: int = DEFAULT_MAX_WORKERS) -> requests.Session:
+    """A session whose connection pool is large enough for all workers"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def split_clone_url(repo_url: str) -> Tuple[str, str]:
+    """Split 'git@host:owner/repo.git/tree/<ref>/<path>' into (clone URL, '<ref>/<path>')"""
+    base, sep, rest = repo_url.partition("/tree/")
+    if not sep:
+        return repo_url, ""
+    return base, rest.strip("/")
+
+
+def is_clone_url(repo_url: str) -> bool:
+    """URLs that are fetched with git itself rather than the GitHub API"""
+    clone_url, _ = split_clone_url(repo_url)
+    return repo_url.startswith(("git@", "ssh://", "file://")) or clone_url.endswith(".git")
+
+
+def resolve_clone_ref(clone_url: str, ref_path: str) -> Tuple[Union[str, None], str]:
+    """
+    Split '<ref>/<path>' into (ref, subdirectory) the way the HTTPS path does:
+    the longest branch or tag name that prefixes ref_path wins, otherwise the
+    first segment is taken as a commit SHA (or other ref).
+    """
+    if not ref_path:
+        return None, ""
+    refs = git.cmd.Git().ls_remote("--heads", "--tags", clone_url)
+    names = set()
+    for line in refs.splitlines():
+        name = line.split("\t", 1)[-1]
+        for prefix in ("refs/heads/", "refs/tags/"):
+            if name.startswith(prefix):
+                names.add(name[len(prefix):].removesuffix("^{}"))
+    matches = [n for n in names if ref_path == n or ref_path.startswith(n + "/")]
+    ref = max(matches, key=len) if matches else ref_path.split("/", 1)[0]
+    return ref, ref_path[len(ref):].strip("/")
+
+
+def resolve_clone_commit(clone_url: str, ref: Union[str, None]) -> Union[str, None]:
+    """Commit SHA that ref (or the default branch) points to, via one git ls-remote"""
+    if ref and SHA_RE.fullmatch(ref):
+        return ref
+    try:
+        refs = git.cmd.Git().ls_remote(clone_url, ref or "HEAD")
+    except git.GitCommandError:
+        return None
+    shas = {}
+    for line in refs.splitlines():
+        sha, _, name = line.partition("\t")
+        shas[name] = sha
+    # Annotated tags are listed twice; the peeled "^{}" entry is the commit
+    for name in (f"refs/heads/{ref}", f"refs/tags/{ref}^{{}}", f"refs/tags/{ref}", "HEAD"):
+        if name in shas:
+            return shas[name]
+    return None
+
+
+def sparse_checkout_patterns(subdir: str, include_patterns) -> List[str]:
+    """
+    Non-cone sparse-checkout patterns covering subdir and include_patterns.
+
+    Include patterns are matched against file names, so each one becomes a
+    "<subdir>/**/<pattern>" rule. The result is a superset of what
+    the pattern matcher accepts; exclusions are still applied after checkout.
+    """
+    base = f"/{subdir.strip('/')}/" if subdir else "/"
+    if not include_patterns:
+        return [base]
+    return [f"{base}**/{pattern}" for pattern in sorted(include_patterns)]
+
+
+def shallow_clone(clone_url: str, ref: Union[str, None], dest: str, sparse_patterns: List[str]):
+    """
+    Depth-1, blobless (--filter=blob:none) fetch of a single ref into dest,
+    checked out through sparse-checkout so only matching blobs are downloaded.
+    """
+    repo = git.Repo.init(dest)
+    repo.git.remote("add", "origin", clone_url)
+    repo.git.sparse_checkout("set", "--no-cone", *sparse_patterns)
+    repo.git.fetch("--depth", "1", "--filter=blob:none", "origin", ref or "HEAD")
+    repo.git.checkout("--quiet", "FETCH_HEAD")
+    return repo
+
 
 def crawl_github_files(
     repo_url, 
@@ -14,7 +168,14 @@ def crawl_github_files(
     max_file_size: int = 1 * 1024 * 1024,  # 1 MB
     use_relative_paths: bool = False,
     include_patterns: Union[str, Set[str]] = None,
-    exclude_patterns: Union[str, Set[str]] = None
+    exclude_patterns: Union[str, Set[str]] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    api_base: str = GITHUB_API_BASE,
+    raw_base: str = GITHUB_RAW_BASE,
+    session: requests.Session = None,
+    fetch_mode: str = "api",
+    mirror: RepoMirror = None,
+    progress: ProgressReporter = None,
 ):
     """
     Crawl files from a specific path in a GitHub repository at a specific commit.
@@ -32,6 +193,22 @@ def crawl_github_files(
                                                        If None, all files are included.
         exclude_patterns (str or set of str, optional): Pattern or set of patterns specifying which files to exclude.
                                                        If None, no files are excluded.
+        max_workers (int, optional): Number of directory listings/downloads to run concurrently (default: 8)
+        api_base (str, optional): Base URL of the GitHub API (default: https://api.github.com);
+                                  point it at a local stand-in server for testing
+        raw_base (str, optional): Base URL for raw file downloads (default: https://raw.githubusercontent.com)
+        fetch_mode (str, optional): "api" (default) lists the tree and downloads matching files one by one;
+                                    "tarball" streams the repository archive for the ref in a single request
+                                    and decodes only the matching members, without extracting to disk
+        session (requests.Session, optional): Session to reuse; one with a pool of `max_workers`
+                                              connections is created if omitted
+        mirror (RepoMirror, optional): Local content-addressed mirror. The ref is resolved to a
+                                       commit SHA first (no request at all when the URL already
+                                       names one); a snapshot of that commit with the same filters
+                                       is served from disk, otherwise the crawl result is stored
+        progress (ProgressReporter, optional): Where to report per-file progress; pass one with
+                                               quiet=True to silence output. Its counters (scanned,
+                                               skipped by reason, bytes read) are merged into stats
 
     Returns:
         dict: Dictionary with files and statistics
@@ -42,87 +219,119 @@ def crawl_github_files(
     if exclude_patterns and isinstance(exclude_patterns, str):
         exclude_patterns = {exclude_patterns}
 
-    def should_include_file(file_path: str, file_name: str) -> bool:
-        """Determine if a file should be included based on patterns"""
-        # If no include patterns are specified, include all files
-        if not include_patterns:
-            include_file = True
-        else:
-            # Check if file matches any include pattern
-            include_file = any(fnmatch.fnmatch(file_name, pattern) for pattern in include_patterns)
-
-        # If exclude patterns are specified, check if file should be excluded
-        if exclude_patterns and include_file:
-            # Exclude if file matches any exclude pattern
-            exclude_file = any(fnmatch.fnmatch(file_path, pattern) for pattern in exclude_patterns)
-            return not exclude_file
-
-        return include_file
+    # Include patterns match file names, exclude patterns match paths
+    matcher = PatternMatcher(include_patterns, exclude_patterns)
+    progress = progress or ProgressReporter(f"Crawling {repo_url}")
+
+    def build_result(files, skipped_files, base_path, source, commit=None):
+        return {
+            "files": dict(sorted(files.items())),  # completion order varies; keep indices stable
+            "stats": {
+                "downloaded_count": len(files),
+                "skipped_count": len(skipped_files),
+                "skipped_files": skipped_files,
+                "base_path": base_path if use_relative_paths else None,
+                "include_patterns": include_patterns,
+                "exclude_patterns": exclude_patterns,
+                "source": source,
+                "commit": commit,
+                **progress.finish(),
+            }
+        }
 
-    # Detect SSH URL (git@ or .git suffix)
-    is_ssh_url = repo_url.startswith("git@") or repo_url.endswith(".git")
+    def mirror_params(base_path):
+        """Everything besides the commit that determines the crawl result"""
+        return {
+            "path": base_path,
+            "include": sorted(include_patterns or []),
+            "exclude": sorted(exclude_patterns or []),
+            "max_file_size": max_file_size,
+            "relative": use_relative_paths,
+        }
 
-    if is_ssh_url:
-        # Clone repo via SSH to temp dir
+    def load_from_mirror(repo_id, commit, base_path):
+        cached = mirror.load(repo_id, commit, mirror_params(base_path))
+        if cached is None:
+            return None
+        files, stats = cached
+        progress.message(f"Loaded {len(files)} files of {repo_id}@{commit[:12]} from local mirror {mirror.root}")
+        result = build_result(files, [tuple(s) for s in stats.get("skipped_files", [])], base_path, "mirror", commit)
+        result["stats"]["mirrored_source"] = stats.get("source")
+        return result
+
+    def store_in_mirror(repo_id, base_path, result):
+        commit = result["stats"]["commit"]
+        # An empty result usually means a failed crawl; don't pin it to the commit
+        if mirror is not None and commit and result["files"]:
+            mirror.store(repo_id, commit, mirror_params(base_path), result["files"], result["stats"])
+        return result
+
+    if is_clone_url(repo_url):
+        clone_url, ref_path = split_clone_url(repo_url)
+        # Clone repo via git (SSH, HTTPS or file://) to temp dir
         with tempfile.TemporaryDirectory() as tmpdirname:
-            print(f"Cloning SSH repo {repo_url} to temp dir {tmpdirname} ...")
             try:
-                repo = git.Repo.clone_from(repo_url, tmpdirname)
+                ref, subdir = resolve_clone_ref(clone_url, ref_path)
+                if mirror is not None:
+                    commit = resolve_clone_commit(clone_url, ref)
+                    cached = commit and load_from_mirror(clone_url, commit, subdir)
+                    if cached:
+                        return cached
+                progress.message(f"Cloning {clone_url} (ref: {ref or 'default branch'}, depth 1, sparse) to temp dir {tmpdirname} ...")
+                cloned = shallow_clone(
+                    clone_url, ref, tmpdirname,
+                    sparse_checkout_patterns(subdir, include_patterns),
+                )
+                commit = cloned.head.commit.hexsha
             except Exception as e:
                 print(f"Error cloning repo: {e}")
                 return {"files": {}, "stats": {"error": str(e)}}
 
-            # Attempt to checkout specific commit/branch if in URL
-            # Parse ref and subdir from SSH URL? SSH URLs don't have branch info embedded
-            # So rely on default branch, or user can checkout manually later
-            # Optionally, user can pass ref explicitly in future API
-
-            # Walk directory
+            # Walk the checked-out subdirectory, never descending into .git
+            walk_root = os.path.join(tmpdirname, subdir) if subdir else tmpdirname
+            rel_root = walk_root if use_relative_paths else tmpdirname
             files = {}
             skipped_files = []
 
-            for root, dirs, filenames in os.walk(tmpdirname):
+            for root, dirs, filenames in os.walk(walk_root):
+                dirs[:] = [
+                    d for d in dirs
+                    if d != ".git" and not matcher.excludes_subtree(
+                        os.path.relpath(os.path.join(root, d), rel_root).replace(os.sep, "/"))
+                ]
                 for filename in filenames:
                     abs_path = os.path.join(root, filename)
-                    rel_path = os.path.relpath(abs_path, tmpdirname)
+                    rel_path = os.path.relpath(abs_path, rel_root).replace(os.sep, "/")
 
                     # Check file size
                     try:
                         file_size = os.path.getsize(abs_path)
                     except OSError:
                         continue
+                    progress.scan()
 
                     if file_size > max_file_size:
                         skipped_files.append((rel_path, file_size))
-                        print(f"Skipping {rel_path}: size {file_size} exceeds limit {max_file_size}")
+                        progress.skip(rel_path, "size")
                         continue
 
                     # Check include/exclude patterns
-                    if not should_include_file(rel_path, filename):
-                        print(f"Skipping {rel_path}: does not match include/exclude patterns")
+                    if not matcher.should_include(rel_path, filename):
+                        progress.skip(rel_path, "pattern")
                         continue
 
-                    # Read content
-                    try:
-                        with open(abs_path, "r", encoding="utf-8-sig") as f:
-                            content = f.read()
-                        files[rel_path] = content
-                        print(f"Added {rel_path} ({file_size} bytes)")
-                    except Exception as e:
-                        print(f"Failed to read {rel_path}: {e}")
-
-            return {
-                "files": files,
-                "stats": {
-                    "downloaded_count": len(files),
-                    "skipped_count": len(skipped_files),
-                    "skipped_files": skipped_files,
-                    "base_path": None,
-                    "include_patterns": include_patterns,
-                    "exclude_patterns": exclude_patterns,
-                    "source": "ssh_clone"
-                }
-            }
+                    # Read content: binaries are sniffed out, other encodings decoded
+                    read = read_text_file(abs_path)
+                    if "error" in read:
+                        progress.message(f"Failed to read {rel_path}: {read['error']}")
+                        progress.skip(rel_path, "read_error")
+                    elif read["content"] is None:
+                        progress.skip(rel_path, "binary")
+                    else:
+                        files[rel_path] = read["content"]
+                        progress.add(rel_path, read["bytes"])
+
+            return store_in_mirror(clone_url, subdir, build_result(files, skipped_files, subdir, "git_clone", commit))
 
     # Parse GitHub URL to extract owner, repo, commit/branch, and path
     parsed_url = urlparse(repo_url)
@@ -140,11 +349,25 @@ def crawl_github_files(
     if token:
         headers["Authorization"] = f"token {token}"
 
+    api_base = api_base.rstrip("/")
+    raw_base = raw_base.rstrip("/")
+    session = session or create_session(max_workers)
+    rate_limiter = RateLimiter()
+
+    def github_get(url, params=None, stream=False, accept=None):
+        """GET through the shared session, pausing all workers on rate limits"""
+        request_headers = {**headers, "Accept": accept} if accept else headers
+        while True:
+            rate_limiter.wait()
+            response = session.get(url, headers=request_headers, params=params, stream=stream)
+            if not rate_limiter.update(response):
+                return response
+
     def fetch_branches(owner: str, repo: str):
         """Get brancshes of the repository"""
 
-        url = f"https://api.github.com/repos/{owner}/{repo}/branches"
-        response = requests.get(url, headers=headers)
+        url = f"{api_base}/repos/{owner}/{repo}/branches"
+        response = github_get(url)
 
         if response.status_code == 404:
             if not token:
@@ -164,15 +387,30 @@ def crawl_github_files(
     def check_tree(owner: str, repo: str, tree: str):
         """Check the repository has the given tree"""
 
-        url = f"https://api.github.com/repos/{owner}/{repo}/git/trees/{tree}"
-        response = requests.get(url, headers=headers)
+        url = f"{api_base}/repos/{owner}/{repo}/git/trees/{tree}"
+        response = github_get(url)
 
         return True if response.status_code == 200 else False 
 
-    # Check if URL contains a specific branch/commit
-    if len(path_parts) > 2 and 'tree' == path_parts[2]:
-        join_parts = lambda i: '/'.join(path_parts[i:])
+    def resolve_commit(ref):
+        """Commit SHA for ref (default branch if None); one small request unless ref is a SHA"""
+        if ref and SHA_RE.fullmatch(ref):
+            return ref
+        response = github_get(
+            f"{api_base}/repos/{owner}/{repo}/commits/{quote(ref or 'HEAD', safe='')}",
+            accept="application/vnd.github.sha",
+        )
+        sha = response.text.strip() if response.status_code == 200 else ""
+        return sha if SHA_RE.fullmatch(sha) else None
 
+    join_parts = lambda i: '/'.join(path_parts[i:])
+
+    # Check if URL contains a specific branch/commit
+    if len(path_parts) > 3 and 'tree' == path_parts[2] and SHA_RE.fullmatch(path_parts[3]):
+        # A full commit SHA needs no lookup: it can be neither a branch nor ambiguous
+        ref = path_parts[3]
+        specific_path = join_parts(4)
+    elif len(path_parts) > 2 and 'tree' == path_parts[2]:
         branches = fetch_branches(owner, repo)
         branch_names = map(lambda branch: branch.get("name"), branches)
 
@@ -206,25 +444,37 @@ def crawl_github_files(
         # and let Github decide default branch
         ref = None
         specific_path = ""
+
+    repo_id = f"{parsed_url.netloc}/{owner}/{repo}"
+    commit = None
+    if mirror is not None:
+        commit = resolve_commit(ref)
+        if commit:
+            cached = load_from_mirror(repo_id, commit, specific_path)
+            if cached:
+                return cached
+            # Crawl exactly the commit the snapshot will be stored under
+            ref = commit
     
     # Dictionary to store path -> content mapping
     files = {}
     skipped_files = []
-    
-    def fetch_contents(path):
-        """Fetch contents of the repository at a specific path and commit"""
-        url = f"https://api.github.com/repos/{owner}/{repo}/contents/{path}"
+
+    def to_rel_path(item_path):
+        # Calculate relative path if requested
+        if use_relative_paths and specific_path:
+            # Make sure the path is relative to the specified subdirectory
+            if item_path.startswith(specific_path):
+                return item_path[len(specific_path):].lstrip('/')
+        return item_path
+
+    def list_directory(path):
+        """List one directory; returns (file items, subdirectory paths)"""
+        url = f"{api_base}/repos/{owner}/{repo}/contents/{path}"
         params = {"ref": ref} if ref != None else {}
-        
-        response = requests.get(url, headers=headers, params=params)
-        
-        if response.status_code == 403 and 'rate limit exceeded' in response.text.lower():
-            reset_time = int(response.headers.get('X-RateLimit-Reset', 0))
-            wait_time = max(reset_time - time.time(), 0) + 1
-            print(f"Rate limit exceeded. Waiting for {wait_time:.0f} seconds...")
-            time.sleep(wait_time)
-            return fetch_contents(path)
-            
+
+        response = github_get(url, params=params)
+
         if response.status_code == 404:
             if not token:
                 print(f"Error 404: Repository not found or is private.\n"
@@ -235,100 +485,202 @@ def crawl_github_files(
             else:
                 print(f"Error 404: Path '{path}' not found in repository or insufficient permissions with the provided token.\n"
                       f"Please verify the token has access to this repository and the path exists.")
-            return
-            
+            return [], []
+
         if response.status_code != 200:
             print(f"Error fetching {path}: {response.status_code} - {response.text}")
-            return
-        
+            return [], []
+
         contents = response.json()
-        
+
         # Handle both single file and directory responses
         if not isinstance(contents, list):
             contents = [contents]
-        
+
+        file_items, subdirs = [], []
         for item in contents:
-            item_path = item["path"]
-            
-            # Calculate relative path if requested
-            if use_relative_paths and specific_path:
-                # Make sure the path is relative to the specified subdirectory
-                if item_path.startswith(specific_path):
-                    rel_path = item_path[len(specific_path):].lstrip('/')
-                else:
-                    rel_path = item_path
-            else:
-                rel_path = item_path
-            
             if item["type"] == "file":
-                # Check if file should be included based on patterns
-                if not should_include_file(rel_path, item["name"]):
-                    print(f"Skipping {rel_path}: Does not match include/exclude patterns")
+                if accept_file(item):
+                    file_items.append(item)
+            elif item["type"] == "dir":
+                # Don't list subtrees that the exclude patterns rule out entirely
+                if not matcher.excludes_subtree(to_rel_path(item["path"])):
+                    subdirs.append(item["path"])
+        return file_items, subdirs
+
+    def accept_file(item):
+        """Apply include/exclude patterns and the size limit to a listed file"""
+        rel_path = to_rel_path(item["path"])
+        progress.scan()
+        # Check if file should be included based on patterns
+        if not matcher.should_include(rel_path, item["name"]):
+            progress.skip(rel_path, "pattern")
+            return False
+
+        # Check file size if available
+        file_size = item.get("size", 0)
+        if file_size > max_file_size:
+            skipped_files.append((item["path"], file_size))
+            progress.skip(rel_path, "size")
+            return False
+        return True
+
+    def list_tree():
+        """
+        List every file under specific_path with one recursive Git Trees API call.
+
+        Returns the accepted file items, or None when the listing is unavailable
+        or truncated by GitHub; the caller then falls back to per-directory listing.
+        """
+        tree_ish = ref
+        if tree_ish is None:
+            response = github_get(f"{api_base}/repos/{owner}/{repo}")
+            if response.status_code != 200:
+                return None
+            tree_ish = response.json().get("default_branch")
+            if not tree_ish:
+                return None
+
+        response = github_get(
+            f"{api_base}/repos/{owner}/{repo}/git/trees/{quote(tree_ish, safe='')}",
+            params={"recursive": "1"},
+        )
+        if response.status_code != 200:
+            return None
+        tree = response.json()
+        if tree.get("truncated"):
+            progress.message("Tree listing is truncated by GitHub; falling back to per-directory listing.")
+            return None
+
+        prefix = f"{specific_path}/" if specific_path else ""
+        file_items = []
+        for entry in tree.get("tree", []):
+            path = entry["path"]
+            if entry.get("type") != "blob":
+                continue
+            if specific_path and path != specific_path and not path.startswith(prefix):
+                continue
+            item = {
+                "path": path,
+                "name": path.rsplit("/", 1)[-1],
+                "size": entry.get("size", 0),
+                "download_url": f"{raw_base}/{owner}/{repo}/{quote(tree_ish)}/{quote(path)}",
+            }
+            if accept_file(item):
+                file_items.append(item)
+        return file_items
+
+    def download_file(item):
+        """Download one file; returns its content or None if it was skipped"""
+        item_path = item["path"]
+        rel_path = to_rel_path(item_path)
+
+        # For files, get raw content
+        if "download_url" in item and item["download_url"]:
+            file_response = github_get(item["download_url"])
+
+            # Final size check in case content-length header is available but differs from metadata
+            content_length = int(file_response.headers.get('content-length', 0))
+            if content_length > max_file_size:
+                skipped_files.append((item_path, content_length))
+                progress.skip(rel_path, "size")
+                return None
+
+            if file_response.status_code == 200:
+                progress.add(rel_path, len(file_response.content))
+                return file_response.text
+            progress.message(f"Failed to download {rel_path}: {file_response.status_code}")
+            progress.skip(rel_path, "download_error")
+            return None
+
+        # Alternative method if download_url is not available
+        content_response = github_get(item["url"])
+        if content_response.status_code != 200:
+            progress.message(f"Failed to get content for {rel_path}: {content_response.status_code}")
+            progress.skip(rel_path, "download_error")
+            return None
+        content_data = content_response.json()
+        if content_data.get("encoding") == "base64" and "content" in content_data:
+            # Check size of base64 content before decoding
+            if len(content_data["content"]) * 0.75 > max_file_size:  # Approximate size calculation
+                estimated_size = int(len(content_data["content"]) * 0.75)
+                skipped_files.append((item_path, estimated_size))
+                progress.skip(rel_path, "size")
+                return None
+
+            raw = base64.b64decode(content_data["content"])
+            progress.add(rel_path, len(raw))
+            return raw.decode('utf-8')
+        progress.message(f"Unexpected content format for {rel_path}")
+        progress.skip(rel_path, "download_error")
+        return None
+
+    def fetch_tarball():
+        """Stream the repository archive and keep the matching members"""
+        url = f"{api_base}/repos/{owner}/{repo}/tarball"
+        if ref != None:
+            url += f"/{quote(ref, safe='')}"
+        response = github_get(url, stream=True)
+        if response.status_code != 200:
+            print(f"Error fetching archive of {owner}/{repo}: {response.status_code} - {response.text}")
+            return False
+
+        prefix = f"{specific_path}/" if specific_path else ""
+        with response, tarfile.open(fileobj=response.raw, mode="r|*") as archive:
+            # Members are read strictly in stream order; nothing touches the disk
+            for member in archive:
+                if not member.isfile():
                     continue
-                
-                # Check file size if available
-                file_size = item.get("size", 0)
-                if file_size > max_file_size:
-                    skipped_files.append((item_path, file_size))
-                    print(f"Skipping {rel_path}: File size ({file_size} bytes) exceeds limit ({max_file_size} bytes)")
+                # Drop the "<owner>-<repo>-<sha>/" directory GitHub puts in front
+                item_path = member.name.split("/", 1)[-1]
+                if specific_path and item_path != specific_path and not item_path.startswith(prefix):
                     continue
-                
-                # For files, get raw content
-                if "download_url" in item and item["download_url"]:
-                    file_url = item["download_url"]
-                    file_response = requests.get(file_url, headers=headers)
-                    
-                    # Final size check in case content-length header is available but differs from metadata
-                    content_length = int(file_response.headers.get('content-length', 0))
-                    if content_length > max_file_size:
-                        skipped_files.append((item_path, content_length))
-                        print(f"Skipping {rel_path}: Content length ({content_length} bytes) exceeds limit ({max_file_size} bytes)")
-                        continue
-                        
-                    if file_response.status_code == 200:
-                        files[rel_path] = file_response.text
-                        print(f"Downloaded: {rel_path} ({file_size} bytes) ")
-                    else:
-                        print(f"Failed to download {rel_path}: {file_response.status_code}")
+                item = {"path": item_path, "name": item_path.rsplit("/", 1)[-1], "size": member.size}
+                if not accept_file(item):
+                    continue
+                rel_path = to_rel_path(item_path)
+                try:
+                    files[rel_path] = archive.extractfile(member).read().decode("utf-8")
+                    progress.add(rel_path, member.size)
+                except UnicodeDecodeError:
+                    progress.skip(rel_path, "decode_error")
+        return True
+
+    if fetch_mode == "tarball":
+        if fetch_tarball():
+            return store_in_mirror(repo_id, specific_path, build_result(files, skipped_files, specific_path, "tarball", commit))
+        progress.message("Falling back to per-file download.")
+        files.clear()
+        skipped_files.clear()
+
+    # List the whole tree in one request when possible; patterns and the size
+    # limit are applied to the listing before any file is fetched
+    tree_items = list_tree()
+    source = "git_tree" if tree_items is not None else "contents_api"
+
+    # Crawl from the specified path: directory listings and file downloads all
+    # run in one bounded pool; results are collected on this thread only
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        if tree_items is not None:
+            pending = {pool.submit(download_file, item): ("file", item) for item in tree_items}
+        else:
+            pending = {pool.submit(list_directory, specific_path): ("dir", specific_path)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, payload = pending.pop(future)
+                if kind == "dir":
+                    file_items, subdirs = future.result()
+                    for item in file_items:
+                        pending[pool.submit(download_file, item)] = ("file", item)
+                    for subdir in subdirs:
+                        pending[pool.submit(list_directory, subdir)] = ("dir", subdir)
                 else:
-                    # Alternative method if download_url is not available
-                    content_response = requests.get(item["url"], headers=headers)
-                    if content_response.status_code == 200:
-                        content_data = content_response.json()
-                        if content_data.get("encoding") == "base64" and "content" in content_data:
-                            # Check size of base64 content before decoding
-                            if len(content_data["content"]) * 0.75 > max_file_size:  # Approximate size calculation
-                                estimated_size = int(len(content_data["content"]) * 0.75)
-                                skipped_files.append((item_path, estimated_size))
-                                print(f"Skipping {rel_path}: Encoded content exceeds size limit")
-                                continue
-                                
-                            file_content = base64.b64decode(content_data["content"]).decode('utf-8')
-                            files[rel_path] = file_content
-                            print(f"Downloaded: {rel_path} ({file_size} bytes)")
-                        else:
-                            print(f"Unexpected content format for {rel_path}")
-                    else:
-                        print(f"Failed to get content for {rel_path}: {content_response.status_code}")
-            
-            elif item["type"] == "dir":
-                # Recursively process subdirectories
-                fetch_contents(item_path)
-    
-    # Start crawling from the specified path
-    fetch_contents(specific_path)
-    
-    return {
-        "files": files,
-        "stats": {
-            "downloaded_count": len(files),
-            "skipped_count": len(skipped_files),
-            "skipped_files": skipped_files,
-            "base_path": specific_path if use_relative_paths else None,
-            "include_patterns": include_patterns,
-            "exclude_patterns": exclude_patterns
-        }
-    }
+                    content = future.result()
+                    if content is not None:
+                        files[to_rel_path(payload["path"])] = content
+
+    return store_in_mirror(repo_id, specific_path, build_result(files, skipped_files, specific_path, source, commit))
 
 # Example usage
 if __name__ == "__main__":
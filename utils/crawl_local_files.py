@@ -1,6 +1,121 @@
+import codecs
 import os
-import fnmatch
-import pathspec
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from utils.file_table import FileRecord, LazyFileTable
+from utils.pattern_matcher import PatternMatcher
+from utils.progress import ProgressReporter
+from utils.repo_mirror import blob_hash
+
+DEFAULT_WALK_WORKERS = 8
+DEFAULT_READ_WORKERS = 8
+
+# Bytes inspected to tell text from binary; a NUL byte in them means binary
+BINARY_SNIFF_BYTES = 8192
+# Tried in order; latin-1 accepts any byte sequence, so decoding never fails
+FALLBACK_ENCODINGS = ("utf-8-sig", "cp1251", "latin-1")
+
+
+def decode_text(data) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Decode file bytes (or any buffer, e.g. an mmap) as text: (content,
+    encoding), or (None, None) if the data looks binary. UTF-16 is recognised
+    by its BOM (it is full of NULs); otherwise the first encoding in
+    FALLBACK_ENCODINGS that decodes wins.
+    """
+    if data[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+        try:
+            return str(data, "utf-16"), "utf-16"
+        except UnicodeDecodeError:
+            return None, None
+    if b"\0" in data[:BINARY_SNIFF_BYTES]:
+        return None, None
+    for encoding in FALLBACK_ENCODINGS:
+        try:
+            return str(data, encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    return None, None
+
+
+def read_text_file(filepath: str) -> Dict:
+    """
+    Read one file as text with binary sniffing and encoding fallback.
+
+    Binary files cost a single BINARY_SNIFF_BYTES read. Returns a dict with
+    "content" (None for binary or unreadable files), "encoding", "bytes",
+    "seconds" and, on failure, "error".
+    """
+    started = time.perf_counter()
+    result = {"content": None, "encoding": None, "bytes": 0}
+    try:
+        with open(filepath, "rb") as f:
+            head = f.read(BINARY_SNIFF_BYTES)
+            if b"\0" in head and not head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+                result["bytes"] = len(head)
+            else:
+                data = head + f.read()
+                result["bytes"] = len(data)
+                result["content"], result["encoding"] = decode_text(data)
+    except OSError as e:
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def _scan_directory(directory: str, rel_dir: str, matcher: PatternMatcher) -> Tuple[List[Tuple[str, int]], List[str]]:
+    """List one directory: (files as (relpath, size), subdirectories to descend into)"""
+    files, subdirs = [], []
+    try:
+        with os.scandir(os.path.join(directory, rel_dir) if rel_dir else directory) as it:
+            for entry in it:
+                rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                try:
+                    # Like os.walk: symlinked directories are not followed
+                    if entry.is_dir(follow_symlinks=False):
+                        if not matcher.should_prune_dir(rel_path, entry.name):
+                            subdirs.append(rel_path)
+                    elif entry.is_file():
+                        # The one stat per file; cached on the entry (free on Windows)
+                        files.append((rel_path, entry.stat().st_size))
+                except OSError:
+                    continue
+    except OSError as e:
+        print(f"Warning: Could not list directory {rel_dir or directory}: {e}")
+    return files, subdirs
+
+
+def walk_files(
+    directory: str,
+    matcher: PatternMatcher = None,
+    max_workers: int = DEFAULT_WALK_WORKERS,
+) -> Iterator[Tuple[str, int]]:
+    """
+    Yield (relpath, size) for every file below directory.
+
+    Directories are listed with os.scandir, several at a time on a thread
+    pool, and files are yielded as soon as their directory is listed, so the
+    caller can start filtering and reading before the walk is done. Order is
+    not deterministic. Subdirectories rejected by matcher.should_prune_dir are
+    never listed.
+    """
+    matcher = matcher or PatternMatcher()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = {pool.submit(_scan_directory, directory, "", matcher)}
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files, subdirs = future.result()
+                    for subdir in subdirs:
+                        pending.add(pool.submit(_scan_directory, directory, subdir, matcher))
+                    yield from files
+        finally:
+            # The consumer may stop early; don't leave listings queued
+            for future in pending:
+                future.cancel()
 
 
 def crawl_local_files(
@@ -9,6 +124,9 @@ def crawl_local_files(
     exclude_patterns=None,
     max_file_size=None,
     use_relative_paths=True,
+    progress: ProgressReporter = None,
+    max_workers: int = DEFAULT_READ_WORKERS,
+    lazy: bool = False,
 ):
     """
     Crawl files in a local directory with similar interface as crawl_github_files.
@@ -18,115 +136,82 @@ def crawl_local_files(
         exclude_patterns (set): File patterns to exclude (e.g. {"tests/*"})
         max_file_size (int): Maximum file size in bytes
         use_relative_paths (bool): Whether to use paths relative to directory
+        progress (ProgressReporter): Where to report progress; pass one with
+            quiet=True to silence output. A default TTY reporter is used if omitted
+        max_workers (int): Number of files read concurrently. Binary files
+            (a NUL byte near the start) are skipped after one small read; text
+            is decoded as UTF-8, then cp1251, then latin-1
+        lazy (bool): Don't keep contents in memory. Each file is still read
+            once (to skip binaries and hash it), but "files" is a
+            LazyFileTable of (path, content) that reloads contents on demand
 
     Returns:
-        dict: {"files": {filepath: content}}
+        dict: {"files": {filepath: content} or LazyFileTable, "stats": progress
+               counters plus "read_seconds" and per-file "file_metrics"
+               (bytes, seconds, encoding)}
     """
     if not os.path.isdir(directory):
         raise ValueError(f"Directory does not exist: {directory}")
 
     files_dict = {}
 
-    # --- Load .gitignore ---
-    gitignore_path = os.path.join(directory, ".gitignore")
-    gitignore_spec = None
-    if os.path.exists(gitignore_path):
-        try:
-            with open(gitignore_path, "r", encoding="utf-8-sig") as f:
-                gitignore_patterns = f.readlines()
-            gitignore_spec = pathspec.PathSpec.from_lines("gitwildmatch", gitignore_patterns)
-            print(f"Loaded .gitignore patterns from {gitignore_path}")
-        except Exception as e:
-            print(f"Warning: Could not read or parse .gitignore file {gitignore_path}: {e}")
-
-    all_files = []
-    for root, dirs, files in os.walk(directory):
-        # Filter directories using .gitignore and exclude_patterns early
-        excluded_dirs = set()
-        for d in dirs:
-            dirpath_rel = os.path.relpath(os.path.join(root, d), directory)
-
-            if gitignore_spec and gitignore_spec.match_file(dirpath_rel):
-                excluded_dirs.add(d)
+    # --- Compile include/exclude and .gitignore rules once ---
+    matcher = PatternMatcher.for_directory(directory, include_patterns, exclude_patterns)
+
+    progress = progress or ProgressReporter(f"Crawling {directory}")
+    file_metrics = {}
+
+    def read_file(relpath, filepath):
+        result = read_text_file(filepath)
+        file_metrics[relpath] = {
+            "bytes": result["bytes"],
+            "seconds": round(result["seconds"], 6),
+            "encoding": result["encoding"],
+        }
+        if "error" in result:
+            progress.message(f"Warning: Could not read file {filepath}: {result['error']}")
+            progress.skip(relpath, "read_error")
+        elif result["content"] is None:
+            progress.skip(relpath, "binary")
+        else:
+            progress.add(relpath, result["bytes"])
+            if lazy:
+                return FileRecord(relpath, result["bytes"], blob_hash(result["content"]), filepath)
+        return result["content"]
+
+    # Reads start while the walk is still listing directories; on network
+    # filesystems most of the crawl time is spent waiting on them
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        reads = {}
+        for rel_file, file_size in walk_files(directory, matcher):
+            filepath = os.path.join(directory, rel_file)
+            relpath = rel_file if use_relative_paths else filepath
+            progress.scan()
+
+            if matcher.is_excluded(relpath) or not matcher.is_included(relpath):
+                progress.skip(relpath, "pattern")
                 continue
 
-            if exclude_patterns:
-                for pattern in exclude_patterns:
-                    if fnmatch.fnmatch(dirpath_rel, pattern) or fnmatch.fnmatch(d, pattern):
-                        excluded_dirs.add(d)
-                        break
-
-        for d in dirs.copy():
-            if d in excluded_dirs:
-                dirs.remove(d)
-
-        for filename in files:
-            filepath = os.path.join(root, filename)
-            all_files.append(filepath)
-
-    total_files = len(all_files)
-    processed_files = 0
-
-    for filepath in all_files:
-        relpath = os.path.relpath(filepath, directory) if use_relative_paths else filepath
-
-        # --- Exclusion check ---
-        excluded = False
-        if gitignore_spec and gitignore_spec.match_file(relpath):
-            excluded = True
-
-        if not excluded and exclude_patterns:
-            for pattern in exclude_patterns:
-                if fnmatch.fnmatch(relpath, pattern):
-                    excluded = True
-                    break
-
-        included = False
-        if include_patterns:
-            for pattern in include_patterns:
-                if fnmatch.fnmatch(relpath, pattern):
-                    included = True
-                    break
-        else:
-            included = True
-
-        processed_files += 1 # Increment processed count regardless of inclusion/exclusion
-
-        status = "processed"
-        if not included or excluded:
-            status = "skipped (excluded)"
-            # Print progress for skipped files due to exclusion
-            if total_files > 0:
-                percentage = (processed_files / total_files) * 100
-                rounded_percentage = int(percentage)
-                print(f"\033[92mProgress: {processed_files}/{total_files} ({rounded_percentage}%) {relpath} [{status}]\033[0m")
-            continue # Skip to next file if not included or excluded
-
-        if max_file_size and os.path.getsize(filepath) > max_file_size:
-            status = "skipped (size limit)"
-            # Print progress for skipped files due to size limit
-            if total_files > 0:
-                percentage = (processed_files / total_files) * 100
-                rounded_percentage = int(percentage)
-                print(f"\033[92mProgress: {processed_files}/{total_files} ({rounded_percentage}%) {relpath} [{status}]\033[0m")
-            continue # Skip large files
-
-        # --- File is being processed ---        
-        try:
-            with open(filepath, "r", encoding="utf-8-sig") as f:
-                content = f.read()
-            files_dict[relpath] = content
-        except Exception as e:
-            print(f"Warning: Could not read file {filepath}: {e}")
-            status = "skipped (read error)"
-
-        # --- Print progress for processed or error files ---
-        if total_files > 0:
-            percentage = (processed_files / total_files) * 100
-            rounded_percentage = int(percentage)
-            print(f"\033[92mProgress: {processed_files}/{total_files} ({rounded_percentage}%) {relpath} [{status}]\033[0m")
-
-    return {"files": files_dict}
+            if max_file_size and file_size > max_file_size:
+                progress.skip(relpath, "size")
+                continue
+
+            reads[pool.submit(read_file, relpath, filepath)] = relpath
+
+        for future in as_completed(reads):
+            content = future.result()
+            if content is not None:
+                files_dict[reads[future]] = content
+
+    stats = progress.finish()
+    stats["read_seconds"] = round(sum(m["seconds"] for m in file_metrics.values()), 6)
+    stats["file_metrics"] = dict(sorted(file_metrics.items()))
+
+    # The walk is parallel, so arrival order varies; keep indices stable
+    if lazy:
+        records = [files_dict[path] for path in sorted(files_dict)]
+        return {"files": LazyFileTable.from_disk(records), "stats": stats}
+    return {"files": dict(sorted(files_dict.items())), "stats": stats}
 
 
 if __name__ == "__main__":
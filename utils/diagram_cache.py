@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterator, Optional, Tuple, Union
+
+DEFAULT_DIAGRAM_CACHE_DIR = ".diagram_cache"
+DEFAULT_DIAGRAM_QUOTA_MB = 512
+
+
+def _place(source: str, target: str):
+    """Hard-link `source` to `target` (copy across filesystems), atomically"""
+    directory = os.path.dirname(target) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    os.close(fd)
+    os.remove(tmp_path)
+    try:
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class DiagramCache:
+    """
+    Content-addressed cache of rendered diagrams shared by all tutorials.
+
+    Layout under `root`:
+        <k[:2]>/<k>.<format>    rendered image
+
+    The key `k` is the SHA-256 of the diagram source together with the
+    renderer version, theme and output format, so an identical diagram in
+    another project or output directory is never rendered twice, while
+    upgrading mermaid-cli or switching theme renders afresh. Outputs are
+    hard-linked from the cache (copied when that is not possible). Reading
+    an entry touches it; beyond `quota_bytes` the least recently used
+    entries are evicted.
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        quota_bytes: Optional[int] = None,
+        version: str = "",
+        theme: str = "default",
+    ):
+        self.root = root or os.getenv("DIAGRAM_CACHE_DIR", DEFAULT_DIAGRAM_CACHE_DIR)
+        if quota_bytes is None:
+            quota_bytes = int(os.getenv("DIAGRAM_CACHE_QUOTA_MB", DEFAULT_DIAGRAM_QUOTA_MB)) * 1024 * 1024
+        self.quota_bytes = quota_bytes
+        self.version = version
+        self.theme = theme
+
+    # --- keys and paths ---
+    def key(self, source: str, fmt: str) -> str:
+        payload = [source.strip(), self.version, self.theme, fmt]
+        return hashlib.sha256(json.dumps(payload).encode("utf-8")).hexdigest()
+
+    def entry_path(self, source: str, fmt: str) -> str:
+        key = self.key(source, fmt)
+        return os.path.join(self.root, key[:2], f"{key}.{fmt}")
+
+    # --- lookups ---
+    def fetch(self, source: str, target: Union[str, Path]) -> bool:
+        """Place the cached rendering of `source` at `target`; False on a miss"""
+        entry = self.entry_path(source, Path(target).suffix.lstrip("."))
+        if not os.path.isfile(entry):
+            return False
+        now = time.time_ns()
+        os.utime(entry, ns=(now, now))
+        _place(entry, str(target))
+        return True
+
+    def store(self, source: str, rendered: Union[str, Path]):
+        """Add a freshly rendered file to the cache, then enforce the quota"""
+        entry = self.entry_path(source, Path(rendered).suffix.lstrip("."))
+        _place(str(rendered), entry)
+        self.evict(keep=entry)
+
+    # --- eviction ---
+    def _entries(self) -> Iterator[Tuple[str, os.stat_result]]:
+        if not os.path.isdir(self.root):
+            return
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    yield path, os.stat(path)
+                except OSError:
+                    continue
+
+    def size(self) -> int:
+        return sum(st.st_size for _, st in self._entries())
+
+    def evict(self, keep: Optional[str] = None):
+        """Drop least recently used entries (except `keep`) until the cache fits the quota"""
+        entries = list(self._entries())
+        total = sum(st.st_size for _, st in entries)
+        if total <= self.quota_bytes:
+            return
+        entries = sorted(
+            (item for item in entries if item[0] != keep),
+            key=lambda item: item[1].st_mtime_ns,
+        )
+        while entries and total > self.quota_bytes:
+            path, st = entries.pop(0)
+            os.remove(path)
+            total -= st.st_size
@@ -0,0 +1,113 @@
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, NamedTuple, Sequence, Tuple, Union
+
+DEFAULT_CACHE_SIZE = 64  # decoded files kept in memory
+MMAP_THRESHOLD = 256 * 1024  # larger files are decoded straight from a memory map
+
+
+class FileRecord(NamedTuple):
+    """What stays in memory per file: no content, just where to get it"""
+    path: str  # path as shown to the LLM
+    size: int  # bytes on disk / in the blob
+    digest: str  # SHA-256 of the UTF-8 content (same address as RepoMirror blobs)
+    source: str  # filesystem path or blob digest, depending on the loader
+
+
+def read_disk_text(filepath: str) -> str:
+    """Decode a file the way the local crawler does, mmap-ing large files"""
+    # Imported here: crawl_local_files builds tables, so a top-level import would be circular
+    from utils.crawl_local_files import decode_text
+
+    with open(filepath, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                content, _ = decode_text(mapped)
+        else:
+            content, _ = decode_text(f.read())
+    if content is None:
+        raise ValueError(f"{filepath} no longer decodes as text")
+    return content
+
+
+class LazyFileTable(Sequence):
+    """
+    Drop-in replacement for the `[(path, content), ...]` list in shared["files"].
+
+    Only FileRecords are held in memory; `table[i]` loads the content through
+    `loader(record)` and keeps the most recently used `cache_size` decoded
+    strings. Nodes touch a few files per prompt, so memory follows the working
+    set of one prompt instead of the whole repository. Thread-safe, so
+    parallel chapter writers can share one table.
+    """
+
+    def __init__(
+        self,
+        records: Sequence[FileRecord],
+        loader: Callable[[FileRecord], str],
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ):
+        self.records: List[FileRecord] = list(records)
+        self._loader = loader
+        self.blob_store = None  # set when contents live in a RepoMirror blob store
+        self._cache_size = cache_size
+        self._cache: "OrderedDict[int, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_disk(cls, records: Sequence[FileRecord], cache_size: int = DEFAULT_CACHE_SIZE):
+        """Table over files on disk; record.source is the filesystem path"""
+        return cls(records, lambda record: read_disk_text(record.source), cache_size)
+
+    @classmethod
+    def from_blob_store(cls, store, files: Dict[str, str], cache_size: int = DEFAULT_CACHE_SIZE):
+        """
+        Move in-memory contents into a content-addressed store (a RepoMirror)
+        and return a table that reads them back on demand.
+        """
+        records = []
+        for path, content in files.items():
+            digest = store.put_blob(content)
+            records.append(FileRecord(path, len(content.encode("utf-8")), digest, digest))
+        table = cls(records, lambda record: store.read_blob(record.source), cache_size)
+        table.blob_store = store
+        return table
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        record = self.records[index]
+        return record.path, self.content(index)
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def path(self, index: int) -> str:
+        """Path only; never touches the content"""
+        return self.records[index].path
+
+    def content(self, index: int) -> str:
+        with self._lock:
+            if index in self._cache:
+                self._cache.move_to_end(index)
+                return self._cache[index]
+        content = self._loader(self.records[index])
+        with self._lock:
+            self._cache[index] = content
+            self._cache.move_to_end(index)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return content
+
+    def hashes(self) -> Dict[str, str]:
+        """path -> content digest, without loading anything"""
+        return {record.path: record.digest for record in self.records}
@@ -0,0 +1,330 @@
+"""
+Дисковый кеш ответов LLM.
+
+Раньше весь кеш лежал в одном `llm_cache.json`: каждый вызов `call_llm`
+читал и парсил файл целиком, а каждый промах — перезаписывал его целиком.
+Здесь кеш вынесен в подключаемые бэкенды с O(1) вводом-выводом на операцию:
+
+* `SQLiteCache` — таблица в SQLite (по умолчанию). Каждая запись —
+  отдельная транзакция, поэтому падение процесса не портит базу.
+* `LogCache` — append-only журнал (JSON Lines) + индекс в памяти
+  «ключ → смещение». Оборванная при падении последняя строка
+  отбрасывается при следующем открытии.
+
+Ключ записи — 128-битный BLAKE2b-дайджест от (провайдер, модель, промпт,
+параметры генерации) (`cache_key`). Поэтому в индексе не хранятся
+многомегабайтные строки, а смена `OPENROUTER_MODEL` / `GEMINI_MODEL` не
+отдаёт ответы чужой модели. Полный текст промпта сохраняется только при
+`LLM_CACHE_STORE_PROMPTS=1` — в отдельной таблице/поле, для отладки.
+
+Бэкенд выбирается переменными окружения:
+
+* `LLM_CACHE_BACKEND` — `sqlite` (по умолчанию) или `log`;
+* `LLM_CACHE_PATH`    — путь к файлу кеша;
+* `LLM_CACHE_STORE_PROMPTS` — `1`, чтобы сохранять промпты для отладки.
+
+При первом открытии старый `llm_cache.json` (если есть) однократно
+импортируется и переименовывается в `llm_cache.json.migrated`. Его
+записи не знают модель, поэтому получают провайдера и модель, активных
+в момент миграции (`legacy_scope`).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+__all__ = [
+    "CacheBackend",
+    "SQLiteCache",
+    "LogCache",
+    "cache_key",
+    "migrate_json_cache",
+    "open_cache",
+    "get_cache",
+]
+
+LEGACY_JSON_CACHE = "llm_cache.json"
+
+DEFAULT_PATHS = {
+    "sqlite": "llm_cache.sqlite3",
+    "log": "llm_cache.jsonl",
+}
+
+
+KEY_BYTES = 16
+
+
+def cache_key(
+    prompt: str,
+    provider: str = "",
+    model: str = "",
+    params: Optional[Mapping[str, Any]] = None,
+) -> str:
+    """
+    Ключ записи кеша — hex BLAKE2b-128 от (provider, model, params, prompt).
+
+    Параметры генерации сериализуются с сортировкой ключей, так что
+    порядок в словаре не влияет на результат.
+    """
+    h = hashlib.blake2b(digest_size=KEY_BYTES)
+    header = json.dumps(
+        [provider, model, dict(params or {})], sort_keys=True, ensure_ascii=False
+    )
+    h.update(header.encode("utf-8"))
+    h.update(b"\0")
+    h.update(prompt.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _store_prompts_default() -> bool:
+    return os.getenv("LLM_CACHE_STORE_PROMPTS", "").strip().lower() in ("1", "true", "yes")
+
+
+# ---------- базовый интерфейс ---------------------------------------------
+class CacheBackend:
+    """Минимальный интерфейс хранилища: get / set / get_prompt / close."""
+
+    store_prompts: bool = False
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, prompt: Optional[str] = None) -> None:
+        """Сохраняет ответ; `prompt` пишется только при `store_prompts`."""
+        raise NotImplementedError
+
+    def get_prompt(self, key: str) -> Optional[str]:
+        """Исходный промпт записи (если он сохранялся) — для отладки."""
+        return None
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+# ---------- SQLite ---------------------------------------------------------
+class SQLiteCache(CacheBackend):
+    """
+    Кеш в SQLite: поиск по первичному ключу, запись — одна транзакция.
+
+    Ключ хранится как 16-байтовый BLOB; промпты (если включено) — в
+    побочной таблице `prompts`, которую горячий путь не читает.
+    """
+
+    def __init__(self, path: str, store_prompts: Optional[bool] = None):
+        self.path = path
+        self.store_prompts = _store_prompts_default() if store_prompts is None else store_prompts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key BLOB PRIMARY KEY,"
+            " response TEXT NOT NULL) WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS prompts ("
+            " key BLOB PRIMARY KEY,"
+            " prompt TEXT NOT NULL) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (bytes.fromhex(key),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, prompt: Optional[str] = None) -> None:
+        raw = bytes.fromhex(key)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)",
+                (raw, value),
+            )
+            if prompt is not None and self.store_prompts:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO prompts (key, prompt) VALUES (?, ?)",
+                    (raw, prompt),
+                )
+
+    def get_prompt(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT prompt FROM prompts WHERE key = ?", (bytes.fromhex(key),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# ---------- append-only журнал --------------------------------------------
+class LogCache(CacheBackend):
+    """
+    Журнал JSON Lines: `{"k": <key>, "v": <response>[, "p": <prompt>]}`.
+
+    В памяти держим только «16-байтовый дайджест → (offset, length)»;
+    чтение — один `seek` + `read`, запись — одна дописанная строка с
+    `fsync`. Более поздняя запись с тем же ключом перекрывает раннюю.
+    """
+
+    def __init__(self, path: str, store_prompts: Optional[bool] = None):
+        self.path = path
+        self.store_prompts = _store_prompts_default() if store_prompts is None else store_prompts
+        self._lock = threading.Lock()
+        self._index: Dict[bytes, Tuple[int, int]] = {}
+        self._fh = open(path, "a+b")
+        self._load_index()
+
+    def _load_index(self) -> None:
+        self._fh.seek(0)
+        offset = 0
+        valid_end = 0
+        for line in self._fh:
+            length = len(line)
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("оборванная запись")
+                record = json.loads(line)
+                self._index[bytes.fromhex(record["k"])] = (offset, length)
+                valid_end = offset + length
+            except (ValueError, KeyError, TypeError):
+                # испорченную строку пропускаем, остальные записи не теряем
+                pass
+            offset += length
+        # отрезаем только хвост после последней целой записи — след падения
+        if valid_end < offset:
+            self._fh.truncate(valid_end)
+
+    def _read_record(self, key: str) -> Optional[dict]:
+        with self._lock:
+            pos = self._index.get(bytes.fromhex(key))
+            if pos is None:
+                return None
+            self._fh.seek(pos[0])
+            line = self._fh.read(pos[1])
+        return json.loads(line)
+
+    def get(self, key: str) -> Optional[str]:
+        record = self._read_record(key)
+        return record["v"] if record else None
+
+    def get_prompt(self, key: str) -> Optional[str]:
+        record = self._read_record(key)
+        return record.get("p") if record else None
+
+    def set(self, key: str, value: str, prompt: Optional[str] = None) -> None:
+        record = {"k": key, "v": value}
+        if prompt is not None and self.store_prompts:
+            record["p"] = prompt
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            offset = self._fh.seek(0, os.SEEK_END)
+            self._fh.write(line)
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._index[bytes.fromhex(key)] = (offset, len(line))
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def close(self) -> None:
+        with self._lock:
+            self._fh.close()
+
+
+BACKENDS = {
+    "sqlite": SQLiteCache,
+    "log": LogCache,
+}
+
+
+# ---------- миграция и фабрика --------------------------------------------
+def migrate_json_cache(
+    json_path: str,
+    backend: CacheBackend,
+    provider: str = "",
+    model: str = "",
+) -> int:
+    """
+    Однократно переносит записи старого `llm_cache.json` в `backend`.
+
+    Старый кеш был привязан только к тексту промпта, поэтому записи
+    получают ключи с переданными `provider` / `model`.
+
+    После успешного импорта файл переименовывается в `<json_path>.migrated`,
+    чтобы миграция не повторялась. Возвращает число перенесённых записей.
+    """
+    if not os.path.exists(json_path):
+        return 0
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+    except Exception:
+        return 0
+    if not isinstance(legacy, dict):
+        return 0
+
+    for prompt, response in legacy.items():
+        backend.set(cache_key(prompt, provider, model), response, prompt=prompt)
+    os.replace(json_path, json_path + ".migrated")
+    return len(legacy)
+
+
+def open_cache(
+    backend: Optional[str] = None,
+    path: Optional[str] = None,
+    legacy_json: Optional[str] = LEGACY_JSON_CACHE,
+    legacy_scope: Tuple[str, str] = ("", ""),
+) -> CacheBackend:
+    """
+    Создаёт бэкенд по имени (или из окружения) и выполняет миграцию.
+
+    `legacy_scope` — (provider, model), под которыми импортируются
+    записи старого JSON-кеша.
+    """
+    name = (backend or os.getenv("LLM_CACHE_BACKEND", "sqlite")).strip().lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM cache backend: {name!r} (expected one of {sorted(BACKENDS)})")
+    path = path or os.getenv("LLM_CACHE_PATH") or DEFAULT_PATHS[name]
+
+    cache = BACKENDS[name](path)
+    if legacy_json:
+        migrate_json_cache(legacy_json, cache, *legacy_scope)
+    return cache
+
+
+_cache: Optional[CacheBackend] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache(legacy_scope: Tuple[str, str] = ("", "")) -> CacheBackend:
+    """
+    Ленивый синглтон кеша для `call_llm` (потокобезопасный).
+
+    `legacy_scope` учитывается только при первом открытии — для миграции.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = open_cache(legacy_scope=legacy_scope)
+    return _cache
@@ -0,0 +1,105 @@
+"""
+Пакетный рендер диаграмм Mermaid для одного туториала.
+
+Каждый вызов `mmdc` поднимает Node и headless Chromium — это секунды на
+диаграмму. `MermaidRenderer` собирает все диаграммы туториала и рендерит
+их пачками по `batch_size` за один запуск `mmdc` (`render_batch`), не более
+`max_workers` запусков одновременно. Диаграммы, которые пачка не отдала
+(старый mermaid-cli, синтаксическая ошибка, тайм-аут), рендерятся по одной
+через `render_one` — в том же ограниченном пуле, каждая со своим тайм-аутом.
+
+С `cache` (utils.diagram_cache.DiagramCache) диаграмма, уже отрендеренная
+в любом туториале, берётся из глобального кеша, а новые туда добавляются:
+повторная генерация без изменений в диаграммах не запускает `mmdc` вовсе.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+__all__ = ["MermaidRenderer", "DEFAULT_RENDER_WORKERS", "DEFAULT_BATCH_SIZE"]
+
+DEFAULT_RENDER_WORKERS = 2
+DEFAULT_BATCH_SIZE = 40
+
+Job = Tuple[Path, Path]  # (.mmd, картинка .svg/.png)
+
+
+class MermaidRenderer:
+    """
+    Parameters
+    ----------
+    render_one:
+        Рендер одной диаграммы `(mmd_path, image_path) -> bool`
+        (совместимо с `utils.generate_mermaid_png`).
+    render_batch:
+        Рендер пачки `(jobs) -> множество готовых картинок`
+        (`utils.generate_mermaid_batch`); None — только по одной.
+    max_workers:
+        Сколько `mmdc` может работать одновременно.
+    batch_size:
+        Сколько диаграмм отдавать одному запуску `mmdc`.
+    cache:
+        Глобальный кеш диаграмм; None — без него.
+    """
+
+    def __init__(
+        self,
+        render_one: Callable[[Path, Path], bool],
+        render_batch: Optional[Callable[[List[Job]], Set[Path]]] = None,
+        max_workers: int = DEFAULT_RENDER_WORKERS,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        cache=None,
+    ):
+        self.render_one = render_one
+        self.render_batch = render_batch
+        self.max_workers = max(1, max_workers)
+        self.batch_size = max(1, batch_size)
+        self.cache = cache
+
+    def render(self, jobs: Iterable[Job]) -> Set[Path]:
+        """Рендерит диаграммы; возвращает картинки, которые есть на диске."""
+        pending: List[Job] = []
+        done: Set[Path] = set()
+        seen: Set[Path] = set()
+        for mmd_path, png_path in jobs:
+            mmd_path, png_path = Path(mmd_path), Path(png_path)
+            if png_path in seen:
+                continue  # одинаковый код в разных главах — один рендер
+            seen.add(png_path)
+            if png_path.exists() or self._from_cache(mmd_path, png_path):
+                done.add(png_path)
+            else:
+                pending.append((mmd_path, png_path))
+        if not pending:
+            return done
+        to_render = list(pending)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            # ---------- 1. пачками: один старт браузера на пачку ----------
+            if self.render_batch is not None:
+                batches = [
+                    pending[i : i + self.batch_size]
+                    for i in range(0, len(pending), self.batch_size)
+                ]
+                for rendered in pool.map(self.render_batch, batches):
+                    done.update(rendered)
+                pending = [job for job in pending if job[1] not in done]
+
+            # ---------- 2. остаток — по одной ----------------------------
+            results = pool.map(lambda job: self.render_one(*job), pending)
+            done.update(png for (_, png), ok in zip(pending, results) if ok)
+
+        # ---------- 3. новые картинки — в глобальный кеш -----------------
+        if self.cache is not None:
+            for mmd_path, png_path in to_render:
+                if png_path in done and png_path.is_file():
+                    self.cache.store(mmd_path.read_text(encoding="utf-8"), png_path)
+        return done
+
+    def _from_cache(self, mmd_path: Path, png_path: Path) -> bool:
+        if self.cache is None:
+            return False
+        return self.cache.fetch(mmd_path.read_text(encoding="utf-8"), png_path)
@@ -1,13 +1,25 @@
 """
 Обработка блоков ```mermaid``` в Markdown-тексте.
 
-Функция `render_mermaid_blocks` выполняет:
+Всё построено на одном потоковом сканере `scan_markdown`: за один проход
+по строкам он отдаёт обычные строки как есть и целые ```mermaid```-блоки
+(`MermaidBlock`). Поверх него `MermaidRewriter` собирает задания для
+пакетного рендера (`jobs`) и пишет итоговый Markdown прямо в файл
+(`write`) — и для глав, и для index.md, где первый блок заменяется схемой
+архитектуры. `render_mermaid_blocks` — прежний интерфейс поверх них.
+
+Формат (`fmt`): "svg" или "png" — картинки рендерятся при сборке;
+"client" — блоки остаются в Markdown как есть, а в конец файла
+добавляется подключение mermaid.js (`MERMAID_JS_INCLUDE`): диаграммы
+рисует браузер, и при сборке ничего не рендерится.
+
+Для каждого блока:
 
 * Поиск всех внешних ```mermaid```-блоков.
 * Если содержимое похоже на настоящую диаграмму — сохраняет код в
-  `<sha>.mmd`, рендерит PNG через `png_func` (совместимо с
-  `utils.generate_mermaid_png`). При успешном рендере заменяет блок
-  на `![Diagram](<sha>.png)`.
+  `<sha>.mmd`, рендерит картинку `<sha>.<fmt>` через `png_func`
+  (совместимо с `utils.generate_mermaid_png`). При успешном рендере
+  заменяет блок на `![Diagram](<sha>.<fmt>)`.
 * Если блок «демонстрационный» (например, внутри — пример YAML/JSON) или
   рендер завершился неуспешно (`png_func` → False), исходный Markdown
   остаётся без изменений.
@@ -19,10 +31,24 @@
 from __future__ import annotations
 
 import hashlib
+import io
+import os
 from pathlib import Path
-from typing import Callable, List
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple, Union
 
-__all__ = ["render_mermaid_blocks", "_sha10"]
+__all__ = [
+    "DIAGRAM_FORMATS",
+    "DEFAULT_DIAGRAM_FORMAT",
+    "LEGACY_DIAGRAM_FORMAT",
+    "CLIENT_FORMAT",
+    "MERMAID_JS_INCLUDE",
+    "MermaidBlock",
+    "MermaidRewriter",
+    "scan_markdown",
+    "is_real_diagram",
+    "render_mermaid_blocks",
+    "_sha10",
+]
 
 
 # ---------- служебные ------------------------------------------------------
@@ -42,15 +68,216 @@ MERMAID_PREFIXES: tuple[str, ...] = (
     "gantt",
 )
 
+# "client" — без рендера при сборке, диаграммы рисует mermaid.js в браузере
+CLIENT_FORMAT = "client"
+DIAGRAM_FORMATS: tuple[str, ...] = ("svg", "png", CLIENT_FORMAT)
+DEFAULT_DIAGRAM_FORMAT = "svg"
+# Формат манифестов --incremental, записанных до появления выбора формата
+LEGACY_DIAGRAM_FORMAT = "png"
+
+MERMAID_JS_URL = os.getenv(
+    "MERMAID_JS_URL", "https://cdn.jsdelivr.net/npm/mermaid@10/dist/mermaid.esm.min.mjs"
+)
+# Markdown → HTML превращает ```mermaid в <pre><code class="language-mermaid">;
+# просмотрщики с родной поддержкой Mermaid (GitHub) скрипт просто игнорируют
+MERMAID_JS_INCLUDE = (
+    '<script type="module">\n'
+    f'  import mermaid from "{MERMAID_JS_URL}";\n'
+    "  mermaid.initialize({ startOnLoad: false });\n"
+    '  await mermaid.run({ querySelector: "pre > code.language-mermaid, pre.mermaid" });\n'
+    "</script>"
+)
+
+
+# ---------- сканер -----------------------------------------------------------
+class MermaidBlock(NamedTuple):
+    """Содержимое ```mermaid```-блока (без ограждающих строк)."""
+
+    lines: List[str]
+    closed: bool  # False — файл закончился раньше закрывающего ```
+
+    @property
+    def code(self) -> str:
+        return "\n".join(self.lines).strip()
+
+    def source_lines(self) -> List[str]:
+        """Блок в исходном виде — для тех, что не заменяются картинкой."""
+        return ["```mermaid", *self.lines] + (["```"] if self.closed else [])
+
+
+TEXT_RUN_LINES = 512  # сколько обычных строк отдавать одним куском
+
+
+def scan_markdown(lines: Iterable[str]) -> Iterator[Union[List[str], MermaidBlock]]:
+    """
+    Один проход по строкам (без символов перевода строки): строки вне
+    ```mermaid``` отдаются кусками (списками до TEXT_RUN_LINES строк),
+    блок — целиком одним `MermaidBlock`. Вложенные ```lang … ``` внутри
+    блока считаются счётчиком `nested`: внешний блок закрывается только
+    парным ``` того же уровня.
+    """
+    text: List[str] = []
+    block: Optional[List[str]] = None
+    nested = 0
+
+    for raw in lines:
+        # ---------- вне mermaid-блока ------------------
+        if block is None:
+            if "```mermaid" in raw and raw.strip().startswith("```mermaid"):
+                if text:
+                    yield text
+                    text = []
+                block, nested = [], 0
+            else:
+                text.append(raw)
+                if len(text) >= TEXT_RUN_LINES:
+                    yield text
+                    text = []
+            continue
+
+        # ---------- внутри mermaid-блока --------------
+        stripped = raw.strip()
+        if stripped.startswith("```"):
+            if stripped != "```":
+                nested += 1  # вложенный ```lang (например ```yaml)
+            elif nested:
+                nested -= 1  # закрытие вложенного блока
+            else:
+                yield MermaidBlock(block, closed=True)  # закрываем ВНЕШНИЙ блок
+                block = None
+                continue
+        block.append(raw)
+
+    if text:
+        yield text
+    # незакрытый mermaid в конце файла
+    if block is not None:
+        yield MermaidBlock(block, closed=False)
+
+
+def is_real_diagram(code: str) -> bool:
+    """
+    Настоящая диаграмма, а не демонстрационный пример (YAML/JSON и т.п.):
+    первая непустая строка начинается с типа диаграммы.
+    """
+    return code.lstrip().startswith(MERMAID_PREFIXES)
+
+
+# ---------- переписывание ----------------------------------------------------
+class MermaidRewriter:
+    """
+    Parameters
+    ----------
+    out_dir:
+        Каталог, куда сохранять *.mmd / *.png.
+    png_func:
+        Функция рендера — должна вернуть True при успешном создании картинки.
+        None — ничего не рендерить: картинкой заменяются только блоки,
+        картинки которых уже есть (их отрендерил пакетный рендер по `jobs`).
+    first_block_image:
+        Строка, которой заменить первый mermaid-блок (index.md: схема
+        архитектуры). Тогда остальные блоки остаются как есть.
+    fmt:
+        "svg" (по умолчанию), "png" или "client" (см. описание модуля).
+    """
+
+    def __init__(
+        self,
+        out_dir: Path,
+        png_func: Optional[Callable[[Path, Path], bool]] = None,
+        first_block_image: Optional[str] = None,
+        fmt: str = DEFAULT_DIAGRAM_FORMAT,
+    ):
+        if fmt not in DIAGRAM_FORMATS:
+            raise ValueError(f"Unknown diagram format {fmt!r}; expected one of {DIAGRAM_FORMATS}")
+        self.out_dir = out_dir
+        self.png_func = png_func
+        self.first_block_image = first_block_image
+        self.fmt = fmt
+        self._existing: set = set()
+        self._client_diagrams = False
+
+    def _start(self):
+        # Один listdir вместо двух stat на каждую диаграмму; снимок берётся
+        # заново на каждом проходе — между ними PNG мог дорендерить пакет
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self._existing = set(os.listdir(self.out_dir))
+        self._client_diagrams = False
+
+    def _save_mmd(self, code: str) -> str:
+        """Сохраняет `<sha>.mmd` (если его ещё нет) и возвращает sha."""
+        sha = _sha10(code)
+        # .mmd сохраняем независимо от результата рендера — полезно для отладки
+        if f"{sha}.mmd" not in self._existing:
+            (self.out_dir / f"{sha}.mmd").write_text(code, encoding="utf-8")
+            self._existing.add(f"{sha}.mmd")
+        return sha
+
+    def jobs(self, lines: Iterable[str]) -> Iterator[Tuple[Path, Path]]:
+        """(.mmd, картинка) настоящих диаграмм, картинок которых ещё нет."""
+        if self.fmt == CLIENT_FORMAT:
+            return  # рендерит браузер
+        self._start()
+        for token in scan_markdown(lines):
+            if not isinstance(token, MermaidBlock) or not token.closed:
+                continue
+            code = token.code
+            if is_real_diagram(code):
+                sha = self._save_mmd(code)
+                if f"{sha}.{self.fmt}" not in self._existing:
+                    yield self.out_dir / f"{sha}.mmd", self.out_dir / f"{sha}.{self.fmt}"
+
+    def _block_lines(self, block: MermaidBlock, first: bool) -> List[str]:
+        if self.first_block_image is not None:
+            return [self.first_block_image] if first else block.source_lines()
+        if not block.closed:
+            return block.source_lines()
+        code = block.code
+        if not is_real_diagram(code):
+            return block.source_lines()
+        if self.fmt == CLIENT_FORMAT:
+            self._client_diagrams = True
+            return block.source_lines()
+        sha = self._save_mmd(code)
+        image_name = f"{sha}.{self.fmt}"
+        # рендер картинки (только если ещё нет)
+        ok = image_name in self._existing or (
+            self.png_func is not None
+            and self.png_func(self.out_dir / f"{sha}.mmd", self.out_dir / image_name)
+        )
+        if not ok:
+            # рендер упал — возвращаем исходный блок
+            return block.source_lines()
+        self._existing.add(image_name)
+        return [f"![Diagram]({image_name})"]
+
+    def write(self, lines: Iterable[str], fh: TextIO):
+        """Пишет переписанный Markdown прямо в `fh`, строки — через перевод строки."""
+        self._start()
+        sep = ""
+        first = True
+        for token in scan_markdown(lines):
+            if isinstance(token, MermaidBlock):
+                token = self._block_lines(token, first)
+                first = False
+            if token:
+                fh.write(sep + "\n".join(token))
+                sep = "\n"
+        # client: одно подключение mermaid.js на файл с диаграммами
+        if self._client_diagrams:
+            fh.write(sep + "\n" + MERMAID_JS_INCLUDE + "\n")
+
 
 # ---------- главная функция -----------------------------------------------
 def render_mermaid_blocks(
     md_text: str,
     out_dir: Path,
     png_func: Callable[[Path, Path], bool],
+    fmt: str = DEFAULT_DIAGRAM_FORMAT,
 ) -> str:
     """
-    Преобразует Markdown, рендеря реальные диаграммы Mermaid в PNG.
+    Преобразует Markdown, рендеря реальные диаграммы Mermaid в картинки
+    (или, при fmt="client", подключая mermaid.js).
 
     Parameters
     ----------
@@ -59,90 +286,16 @@ def render_mermaid_blocks(
     out_dir:
         Каталог, куда сохранять *.mmd / *.png.
     png_func:
-        Функция рендера — должна вернуть True при успешном создании PNG.
+        Функция рендера — должна вернуть True при успешном создании картинки.
+    fmt:
+        "svg" (по умолчанию), "png" или "client".
 
     Returns
     -------
     str
         Модифицированный Markdown.
     """
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    result: List[str] = []
-    in_mermaid = False
-    nested = 0
-    block: List[str] = []
-
-    for raw in md_text.splitlines():
-        stripped = raw.strip()
-
-        # ---------- открытие внешнего блока ----------
-        if not in_mermaid and stripped.startswith("```mermaid"):
-            in_mermaid = True
-            block.clear()
-            continue
-
-        # ---------- внутри mermaid-блока --------------
-        if in_mermaid:
-            # встречен ```
-            if stripped.startswith("```"):
-                # вложенный ```lang (например ```yaml)
-                if stripped != "```":
-                    nested += 1
-                    block.append(raw)
-                    continue
-
-                # закрытие вложенного блока
-                if nested:
-                    nested -= 1
-                    block.append(raw)
-                    continue
-
-                # закрываем ВНЕШНИЙ mermaid-блок
-                code = "\n".join(block).strip()
-                first = next((ln for ln in code.splitlines() if ln.strip()), "")
-
-                is_real = first.lstrip().startswith(MERMAID_PREFIXES)
-                replaced = False
-
-                if is_real:
-                    sha = _sha10(code)
-                    png_name = f"{sha}.png"
-                    png_path = out_dir / png_name
-
-                    # .mmd сохраняем независимо от результата рендера —
-                    # полезно для отладки
-                    mmd_path = out_dir / f"{sha}.mmd"
-                    if not mmd_path.exists():
-                        mmd_path.write_text(code, encoding="utf-8")
-
-                    # рендер PNG (только если ещё нет)
-                    ok = png_path.exists() or png_func(mmd_path, png_path)
-
-                    if ok:
-                        result.append(f"![Diagram]({png_name})")
-                        replaced = True
-
-                if not replaced:
-                    # либо демонстрационный блок, либо рендер упал —
-                    # возвращаем исходный блок
-                    result.append("```mermaid")
-                    result.extend(block)
-                    result.append("```")
-
-                in_mermaid = False
-                continue
-
-            # обычная строка внутри mermaid
-            block.append(raw)
-            continue
-
-        # ---------- вне mermaid-блока ------------------
-        result.append(raw)
-
-    # незакрытый mermaid в конце файла — возвращаем как есть
-    if in_mermaid:
-        result.append("```mermaid")
-        result.extend(block)
+    buf = io.StringIO()
+    MermaidRewriter(out_dir, png_func, fmt=fmt).write(md_text.splitlines(), buf)
+    return buf.getvalue()
 
-    return "\n".join(result)
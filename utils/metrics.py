@@ -0,0 +1,323 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from utils.context_builder import CHARS_PER_TOKEN, estimate_tokens
+
+PHASES = ("prep", "exec", "post")
+
+# Cache statuses of an LLM call
+CACHE_HIT = "hit"
+CACHE_MISS = "miss"
+CACHE_OFF = "off"  # use_cache=False: retries, repair prompts, --no-cache
+
+_active: Optional["RunMetrics"] = None
+_local = threading.local()
+
+
+def current_metrics() -> Optional["RunMetrics"]:
+    """The metrics of the run in progress, or None outside RunMetrics.activate()"""
+    return _active
+
+
+def _price(name: str) -> Optional[float]:
+    value = os.getenv(name, "").strip()
+    return float(value) if value else None
+
+
+class LLMCall:
+    """One call_llm: where it was made, how long it took, what it cost"""
+
+    def __init__(self, stage: str, prompt: str, use_cache: bool):
+        self.stage = stage
+        self.prompt_chars = len(prompt)
+        self.response_chars = 0
+        self.cache = CACHE_MISS if use_cache else CACHE_OFF
+        self.prompt_tokens: Optional[int] = None  # as reported by the provider
+        self.completion_tokens: Optional[int] = None
+        self.estimated = False
+        self.seconds = 0.0
+        self.error: Optional[str] = None
+
+    def completed(self, response: str):
+        self.response_chars = len(response)
+        # No usage from the provider (cache hit, older API): estimate it
+        if self.prompt_tokens is None:
+            self.prompt_tokens = self.prompt_chars // CHARS_PER_TOKEN + 1
+            self.completion_tokens = estimate_tokens(response)
+            self.estimated = True
+
+    def as_dict(self) -> Dict:
+        return dict(vars(self))
+
+
+class RunMetrics:
+    """
+    Timings, LLM usage, retries and crawl volume of one tutorial run.
+
+    While activated (``with metrics.activate():``) flow steps record the
+    wall time of their prep, exec and post, and every call_llm records its
+    time, prompt and completion tokens (reported by the provider, else
+    estimated at ~4 characters per token) and whether it came from the
+    cache. Calls are attributed to the step running at the time; steps run
+    one after another, so this holds for the threads a step starts too.
+    Outside activate() all the recording hooks are no-ops.
+
+    Costs are computed when LLM_PRICE_PROMPT / LLM_PRICE_COMPLETION (USD
+    per million tokens) are set; cache hits cost nothing.
+    """
+
+    def __init__(self, run_id: Optional[str] = None, clock=time.perf_counter):
+        self.run_id = run_id
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self._started = None
+        self.wall_seconds = 0.0
+        self.stage: Optional[str] = None  # step currently running
+        self.stages: Dict[str, Dict] = {}
+        self.calls: List[LLMCall] = []
+        self.retries: Counter = Counter()  # (stage, kind) -> count
+        self.crawl = {"bytes": 0, "files": 0, "source": None}
+
+    # --- activation ---
+    @contextmanager
+    def activate(self) -> Iterator["RunMetrics"]:
+        global _active
+        previous, _active = _active, self
+        self._started = self._clock()
+        try:
+            yield self
+        finally:
+            self.wall_seconds = self._clock() - self._started
+            _active = previous
+
+    # --- recording ---
+    def _stage_record(self, stage: str) -> Dict:
+        record = self.stages.get(stage)
+        if record is None:
+            record = self.stages[stage] = {"runs": 0, "reused": False, **{phase: 0.0 for phase in PHASES}}
+        return record
+
+    @contextmanager
+    def phase(self, stage: str, phase: str):
+        """Time the prep, exec or post of a flow step"""
+        with self._lock:
+            record = self._stage_record(stage)
+            if phase == PHASES[0]:
+                record["runs"] += 1
+        previous, self.stage = self.stage, stage
+        started = self._clock()
+        try:
+            yield
+        finally:
+            elapsed = self._clock() - started
+            self.stage = previous
+            with self._lock:
+                record[phase] += elapsed
+
+    def reused(self, stage: str):
+        """The step's output came from an earlier run; it did not run"""
+        with self._lock:
+            self._stage_record(stage)["reused"] = True
+
+    def add_call(self, call: LLMCall):
+        with self._lock:
+            self.calls.append(call)
+
+    def add_retry(self, kind: str):
+        with self._lock:
+            self.retries[(self.stage or "-", kind)] += 1
+
+    def add_crawl(self, stats: Dict):
+        with self._lock:
+            self.crawl["bytes"] += stats.get("bytes_read", 0)
+            self.crawl["files"] += stats.get("included", stats.get("downloaded_count", 0))
+            self.crawl["source"] = stats.get("source", self.crawl["source"])
+
+    # --- report ---
+    def report(self) -> Dict:
+        """The run as JSON-ready data: per-stage and total figures plus every LLM call"""
+        prompt_price = _price("LLM_PRICE_PROMPT")
+        completion_price = _price("LLM_PRICE_COMPLETION")
+
+        def llm_totals(calls):
+            billed = [c for c in calls if c.cache != CACHE_HIT]
+            totals = {
+                "llm_calls": len(calls),
+                "cache_hits": sum(c.cache == CACHE_HIT for c in calls),
+                "cache_misses": sum(c.cache == CACHE_MISS for c in calls),
+                "uncached": sum(c.cache == CACHE_OFF for c in calls),
+                "errors": sum(c.error is not None for c in calls),
+                "llm_seconds": round(sum(c.seconds for c in calls), 3),
+                "prompt_tokens": sum(c.prompt_tokens or 0 for c in calls),
+                "completion_tokens": sum(c.completion_tokens or 0 for c in calls),
+                "billed_prompt_tokens": sum(c.prompt_tokens or 0 for c in billed),
+                "billed_completion_tokens": sum(c.completion_tokens or 0 for c in billed),
+                "cost_usd": None,
+            }
+            if prompt_price is not None or completion_price is not None:
+                totals["cost_usd"] = round(
+                    totals["billed_prompt_tokens"] * (prompt_price or 0) / 1e6
+                    + totals["billed_completion_tokens"] * (completion_price or 0) / 1e6,
+                    6,
+                )
+            return totals
+
+        with self._lock:
+            calls = list(self.calls)
+            stages = {name: dict(record) for name, record in self.stages.items()}
+            retries = Counter(self.retries)
+            crawl = dict(self.crawl)
+
+        stage_rows = []
+        for name, record in stages.items():
+            stage_calls = [c for c in calls if c.stage == name]
+            stage_rows.append({
+                "name": name,
+                **{key: round(value, 3) if isinstance(value, float) else value for key, value in record.items()},
+                "seconds": round(sum(record[phase] for phase in PHASES), 3),
+                **llm_totals(stage_calls),
+                "retries": sum(count for (stage, _), count in retries.items() if stage == name),
+            })
+
+        by_kind = Counter()
+        for (_, kind), count in retries.items():
+            by_kind[kind] += count
+        return {
+            "run_id": self.run_id,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "wall_seconds": round(self.wall_seconds, 3),
+            "stages": stage_rows,
+            "llm": {**llm_totals(calls), "estimated_calls": sum(c.estimated for c in calls)},
+            "retries": {"total": sum(by_kind.values()), "by_kind": dict(by_kind)},
+            "crawl": crawl,
+            "calls": [c.as_dict() for c in calls],
+        }
+
+    def write_report(self, path: str) -> Dict:
+        """Write report() to `path` as JSON (atomically) and return it"""
+        report = self.report()
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+        return report
+
+
+# --- hooks for call_llm, RetryPolicy and the crawl ---
+@contextmanager
+def track_llm_call(prompt: str, use_cache: bool) -> Iterator[LLMCall]:
+    """
+    Record one call_llm in the active run. Yields the call record, which the
+    caller completes with the response; provider usage and cache hits are
+    noted on it through note_usage() / note_cache_hit() from the same
+    thread. Nested calls (call_llm streaming through stream_llm) count once.
+    """
+    metrics = _active
+    outer = getattr(_local, "call", None)
+    call = LLMCall(metrics.stage if metrics else None, prompt, use_cache)
+    if metrics is None or outer is not None:
+        yield outer or call
+        return
+    _local.call = call
+    started = time.perf_counter()
+    try:
+        yield call
+    except BaseException as e:
+        call.error = type(e).__name__
+        raise
+    finally:
+        _local.call = None
+        call.seconds = round(time.perf_counter() - started, 3)
+        metrics.add_call(call)
+
+
+def note_usage(prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+    """Token counts reported by the provider for the call in progress"""
+    call = getattr(_local, "call", None)
+    if call is not None and prompt_tokens is not None:
+        call.prompt_tokens = prompt_tokens
+        call.completion_tokens = completion_tokens or 0
+
+
+def note_cache_hit():
+    call = getattr(_local, "call", None)
+    if call is not None:
+        call.cache = CACHE_HIT
+
+
+def record_retry(kind: str):
+    """A retried or repaired LLM call (kind: a utils.retry error class)"""
+    if _active is not None:
+        _active.add_retry(kind)
+
+
+def record_crawl(stats: Dict):
+    """Crawler stats (bytes_read, included files, source) of the run's fetch"""
+    if _active is not None:
+        _active.add_crawl(stats)
+
+
+# --- summary ---
+def _tokens(count: int) -> str:
+    return f"{count / 1000:.1f}k" if count >= 1000 else str(count)
+
+
+def format_summary(report: Dict) -> str:
+    """Human-readable table of a report(): where the time and tokens went"""
+    header = ("Stage", "Runs", "Prep", "Exec", "Post", "Total", "LLM", "Hit/Miss", "Tokens in/out", "Retries")
+    rows = []
+    for stage in report["stages"]:
+        if stage["reused"] and not stage["runs"]:
+            rows.append((stage["name"], "reused", "", "", "", "", "", "", "", ""))
+            continue
+        rows.append((
+            stage["name"],
+            str(stage["runs"]),
+            f"{stage['prep']:.1f}s",
+            f"{stage['exec']:.1f}s",
+            f"{stage['post']:.1f}s",
+            f"{stage['seconds']:.1f}s",
+            str(stage["llm_calls"]),
+            f"{stage['cache_hits']}/{stage['cache_misses'] + stage['uncached']}",
+            f"{_tokens(stage['prompt_tokens'])}/{_tokens(stage['completion_tokens'])}",
+            str(stage["retries"]),
+        ))
+    llm = report["llm"]
+    rows.append((
+        "Total", "", "", "", "", f"{report['wall_seconds']:.1f}s",
+        str(llm["llm_calls"]),
+        f"{llm['cache_hits']}/{llm['cache_misses'] + llm['uncached']}",
+        f"{_tokens(llm['prompt_tokens'])}/{_tokens(llm['completion_tokens'])}",
+        str(report["retries"]["total"]),
+    ))
+
+    widths = [max(len(row[i]) for row in [header, *rows]) for i in range(len(header))]
+
+    def line(row):
+        cells = [row[0].ljust(widths[0])] + [cell.rjust(width) for cell, width in zip(row[1:], widths[1:])]
+        return "  ".join(cells).rstrip()
+
+    lines = [line(header), "  ".join("-" * width for width in widths)]
+    lines += [line(row) for row in rows[:-1]]
+    lines += ["  ".join("-" * width for width in widths), line(rows[-1])]
+
+    notes = []
+    if llm["estimated_calls"]:
+        notes.append(f"tokens of {llm['estimated_calls']} call(s) estimated")
+    if llm["cost_usd"] is not None:
+        notes.append(f"cost ${llm['cost_usd']:.4f} (cache hits free)")
+    if llm["errors"]:
+        notes.append(f"{llm['errors']} failed call(s)")
+    crawl = report["crawl"]
+    notes.append(f"crawled {crawl['bytes'] / 1024:.0f} KB in {crawl['files']} files")
+    lines.append("LLM time " + f"{llm['llm_seconds']:.1f}s; " + "; ".join(notes))
+    return "\n".join(lines)
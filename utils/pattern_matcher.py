@@ -0,0 +1,105 @@
+import fnmatch
+import os
+import re
+from typing import Iterable, Optional, Union
+
+import pathspec
+
+# Probes standing in for "any file below a directory": a NUL byte never
+# appears in a real path, so only wildcards can match these. Requiring both
+# keeps patterns like "dir/?" (one-character names only) from pruning a tree.
+_DESCENDANT_PROBES = ("/\0", "/\0/\0\0")
+
+
+def compile_patterns(patterns: Optional[Iterable[str]]) -> Optional[re.Pattern]:
+    """
+    Compile fnmatch-style patterns into one alternation regex.
+
+    Matching the result against a string is equivalent to
+    `any(fnmatch.fnmatch(s, p) for p in patterns)`, but costs a single regex
+    call instead of one call per pattern. Returns None for no patterns.
+    """
+    if not patterns:
+        return None
+    parts = sorted({fnmatch.translate(os.path.normcase(p)) for p in patterns})
+    return re.compile("|".join(parts))
+
+
+class PatternMatcher:
+    """
+    Include/exclude patterns and .gitignore rules, compiled once per crawl.
+
+    Shared by the local and GitHub crawlers. Exclude patterns and .gitignore
+    rules are tested against the file path; include patterns against the
+    path, or against the bare file name where a caller passes one (the GitHub
+    crawler matches includes by name).
+    """
+
+    def __init__(
+        self,
+        include_patterns: Union[str, Iterable[str], None] = None,
+        exclude_patterns: Union[str, Iterable[str], None] = None,
+        gitignore_spec: Optional[pathspec.PathSpec] = None,
+    ):
+        if isinstance(include_patterns, str):
+            include_patterns = {include_patterns}
+        if isinstance(exclude_patterns, str):
+            exclude_patterns = {exclude_patterns}
+        self._include = compile_patterns(include_patterns)
+        self._exclude = compile_patterns(exclude_patterns)
+        self.gitignore_spec = gitignore_spec
+
+    @classmethod
+    def for_directory(cls, directory: str, include_patterns=None, exclude_patterns=None):
+        """Matcher that also honors the .gitignore at the root of directory"""
+        gitignore_path = os.path.join(directory, ".gitignore")
+        gitignore_spec = None
+        if os.path.exists(gitignore_path):
+            try:
+                with open(gitignore_path, "r", encoding="utf-8-sig") as f:
+                    gitignore_spec = pathspec.PathSpec.from_lines("gitwildmatch", f.readlines())
+                print(f"Loaded .gitignore patterns from {gitignore_path}")
+            except Exception as e:
+                print(f"Warning: Could not read or parse .gitignore file {gitignore_path}: {e}")
+        return cls(include_patterns, exclude_patterns, gitignore_spec)
+
+    def is_included(self, text: str) -> bool:
+        """True if there are no include patterns or one of them matches"""
+        return self._include is None or self._include.match(os.path.normcase(text)) is not None
+
+    def is_excluded(self, path: str) -> bool:
+        """True if an exclude pattern or a .gitignore rule matches path"""
+        if self._exclude is not None and self._exclude.match(os.path.normcase(path)):
+            return True
+        return bool(self.gitignore_spec and self.gitignore_spec.match_file(path))
+
+    def should_include(self, path: str, name: Optional[str] = None) -> bool:
+        """Apply include patterns (to name if given, else path) and exclusions"""
+        return self.is_included(path if name is None else name) and not self.is_excluded(path)
+
+    def excludes_subtree(self, path: str) -> bool:
+        """
+        True if the exclusions rule out every file below directory `path`,
+        e.g. "*venv/*" for "venv" or a "build/" rule in .gitignore.
+        """
+        path = path.rstrip("/")
+        if self._exclude is not None:
+            candidate = os.path.normcase(path)
+            if all(self._exclude.match(candidate + probe) for probe in _DESCENDANT_PROBES):
+                return True
+        if self.gitignore_spec:
+            return bool(self.gitignore_spec.match_file(path) or self.gitignore_spec.match_file(path + "/"))
+        return False
+
+    def should_prune_dir(self, path: str, name: Optional[str] = None) -> bool:
+        """
+        Local crawler rule for skipping a directory without listing it: an
+        exclude pattern matches the directory itself (by path or name), or
+        the exclusions cover its whole subtree.
+        """
+        if self._exclude is not None:
+            if self._exclude.match(os.path.normcase(path.rstrip("/"))):
+                return True
+            if name and self._exclude.match(os.path.normcase(name)):
+                return True
+        return self.excludes_subtree(path)
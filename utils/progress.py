@@ -0,0 +1,110 @@
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, TextIO
+
+DEFAULT_INTERVAL = 0.2  # seconds between TTY status line redraws
+
+
+class ProgressReporter:
+    """
+    Thread-safe progress counters for the crawlers, with throttled output.
+
+    On a TTY a single status line is redrawn at most every `interval`
+    seconds; elsewhere (logs, CI) nothing is printed per file and only the
+    final summary is written. `quiet=True` silences all output. Either way,
+    `summary()` returns the counters for the result `stats`.
+    """
+
+    def __init__(
+        self,
+        label: str = "Crawling",
+        quiet: bool = False,
+        stream: Optional[TextIO] = None,
+        interval: float = DEFAULT_INTERVAL,
+        clock=time.monotonic,
+    ):
+        self.label = label
+        self.quiet = quiet
+        self.stream = stream or sys.stdout
+        self.interval = interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tty = not quiet and hasattr(self.stream, "isatty") and self.stream.isatty()
+        self._last_render = None
+        self._line_dirty = False
+        self.scanned = 0
+        self.included = 0
+        self.bytes_read = 0
+        self.skipped = Counter()
+
+    # --- counters ---
+    def scan(self, count: int = 1):
+        """Files seen by the walk or listing, before any filtering"""
+        with self._lock:
+            self.scanned += count
+            self._maybe_render()
+
+    def add(self, path: str, nbytes: int):
+        """A file that made it into the result"""
+        with self._lock:
+            self.included += 1
+            self.bytes_read += nbytes
+            self._maybe_render()
+
+    def skip(self, path: str, reason: str):
+        """A file left out; reason is a short key such as "pattern" or "size" """
+        with self._lock:
+            self.skipped[reason] += 1
+            self._maybe_render()
+
+    # --- output ---
+    def message(self, text: str):
+        """Print a one-off line (warning, phase change) unless quiet"""
+        if self.quiet:
+            return
+        with self._lock:
+            self._clear_line()
+            print(text, file=self.stream)
+
+    def finish(self) -> Dict:
+        """Print the final summary line and return the counters"""
+        summary = self.summary()
+        if not self.quiet:
+            with self._lock:
+                self._clear_line()
+                print(f"{self.label}: {self._status()}", file=self.stream)
+        return summary
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                "scanned": self.scanned,
+                "included": self.included,
+                "bytes_read": self.bytes_read,
+                "skipped_by_reason": dict(self.skipped),
+            }
+
+    def _status(self) -> str:
+        skipped = sum(self.skipped.values())
+        return (f"{self.scanned} scanned, {self.included} included, {skipped} skipped, "
+                f"{self.bytes_read / 1024:.0f} KB read")
+
+    def _maybe_render(self):
+        # Called with the lock held
+        if not self._tty:
+            return
+        now = self._clock()
+        if self._last_render is not None and now - self._last_render < self.interval:
+            return
+        self._last_render = now
+        self.stream.write(f"\r\033[K\033[92m{self.label}: {self._status()}\033[0m")
+        self.stream.flush()
+        self._line_dirty = True
+
+    def _clear_line(self):
+        # Called with the lock held
+        if self._line_dirty:
+            self.stream.write("\r\033[K")
+            self._line_dirty = False
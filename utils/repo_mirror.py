@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from typing import Dict, Optional, Tuple
+
+DEFAULT_MIRROR_DIR = ".repo_mirror"
+DEFAULT_QUOTA_MB = 2048
+
+SHA_RE = re.compile(r"[0-9a-f]{40}")
+
+
+def blob_hash(content: str) -> str:
+    """Content address of a file: SHA-256 of its UTF-8 bytes"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _atomic_write(path: str, data: bytes):
+    """Write via a temp file + rename so readers never see a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class RepoMirror:
+    """
+    Content-addressed local mirror of crawled repositories.
+
+    Layout under `root`:
+        blobs/<h[:2]>/<h>                          file contents, keyed by SHA-256
+        snapshots/<repo>/<commit>/<filters>.json   path -> blob hash + crawl stats
+
+    A snapshot is keyed by repository, commit SHA and the crawl filters
+    (subdirectory, include/exclude patterns, size limit), so regenerating a
+    tutorial for the same commit skips the download entirely. Blobs are shared
+    between snapshots, so files unchanged across commits are stored once.
+    When the mirror grows beyond `quota_bytes`, least recently used snapshots
+    are evicted and blobs no longer referenced are removed.
+    """
+
+    def __init__(self, root: Optional[str] = None, quota_bytes: Optional[int] = None):
+        self.root = root or os.getenv("REPO_MIRROR_DIR", DEFAULT_MIRROR_DIR)
+        if quota_bytes is None:
+            quota_bytes = int(os.getenv("REPO_MIRROR_QUOTA_MB", DEFAULT_QUOTA_MB)) * 1024 * 1024
+        self.quota_bytes = quota_bytes
+        self.blob_dir = os.path.join(self.root, "blobs")
+        self.snapshot_dir = os.path.join(self.root, "snapshots")
+
+    # --- keys and paths ---
+    @staticmethod
+    def filter_key(params: Dict) -> str:
+        """Stable digest of the crawl filters that shaped a snapshot"""
+        normalized = {
+            k: sorted(v) if isinstance(v, (set, list, tuple)) else v
+            for k, v in params.items()
+        }
+        return hashlib.sha256(
+            json.dumps(normalized, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+
+    def _snapshot_path(self, repo_id: str, commit: str, params: Dict) -> str:
+        safe_repo = re.sub(r"[^A-Za-z0-9._-]+", "_", repo_id).strip("_")
+        return os.path.join(self.snapshot_dir, safe_repo, commit, f"{self.filter_key(params)}.json")
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    # --- blobs ---
+    def put_blob(self, content: str) -> str:
+        digest = blob_hash(content)
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            _atomic_write(path, content.encode("utf-8"))
+        return digest
+
+    def read_blob(self, digest: str) -> str:
+        with open(self.blob_path(digest), "r", encoding="utf-8") as f:
+            return f.read()
+
+    # --- snapshots ---
+    def load(self, repo_id: str, commit: str, params: Dict) -> Optional[Tuple[Dict[str, str], Dict]]:
+        """Return (files, stats) for a mirrored snapshot, or None on a miss"""
+        path = self._snapshot_path(repo_id, commit, params)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            files = {p: self.read_blob(h) for p, h in snapshot["files"].items()}
+        except (OSError, ValueError, KeyError):
+            return None
+        # Mark as recently used for LRU eviction; an explicit timestamp keeps
+        # full precision where the filesystem clock ticks coarsely
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+        return files, snapshot.get("stats", {})
+
+    def store(self, repo_id: str, commit: str, params: Dict, files: Dict[str, str], stats: Dict):
+        """Save a crawl result and evict old snapshots if over quota"""
+        manifest = {path: self.put_blob(content) for path, content in files.items()}
+        snapshot = {
+            "repo": repo_id,
+            "commit": commit,
+            "created": time.time(),
+            "files": manifest,
+            "stats": {k: v for k, v in stats.items() if k not in ("include_patterns", "exclude_patterns")},
+        }
+        path = self._snapshot_path(repo_id, commit, params)
+        _atomic_write(path, json.dumps(snapshot).encode("utf-8"))
+        # Never evict what was just stored: the caller may read its blobs back
+        self.evict(keep=path)
+
+    # --- eviction ---
+    def _snapshots(self):
+        for dirpath, _, filenames in os.walk(self.snapshot_dir):
+            for name in filenames:
+                if name.endswith(".json"):
+                    path = os.path.join(dirpath, name)
+                    yield path, os.stat(path)
+
+    def _blobs(self):
+        for dirpath, _, filenames in os.walk(self.blob_dir):
+            for name in filenames:
+                if not name.startswith(".tmp-"):
+                    path = os.path.join(dirpath, name)
+                    yield name, path, os.stat(path).st_size
+
+    def size(self) -> int:
+        return sum(st.st_size for _, st in self._snapshots()) + sum(s for _, _, s in self._blobs())
+
+    def evict(self, keep: Optional[str] = None):
+        """Drop least recently used snapshots (except `keep`) until the mirror fits the quota"""
+        total = self.size()
+        if total <= self.quota_bytes:
+            return
+        snapshots = sorted(
+            (item for item in self._snapshots() if item[0] != keep),
+            key=lambda item: item[1].st_mtime_ns,
+        )
+        while snapshots and total > self.quota_bytes:
+            path, st = snapshots.pop(0)
+            os.remove(path)
+            total -= st.st_size + self._collect_garbage()
+            commit_dir = os.path.dirname(path)
+            if not os.listdir(commit_dir):
+                shutil.rmtree(commit_dir)
+
+    def _collect_garbage(self) -> int:
+        """Remove blobs that no snapshot references any more; return bytes freed"""
+        referenced = set()
+        for path, _ in self._snapshots():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    referenced.update(json.load(f)["files"].values())
+            except (OSError, ValueError, KeyError):
+                continue
+        freed = 0
+        for digest, path, size in list(self._blobs()):
+            if digest not in referenced:
+                os.remove(path)
+                freed += size
+        return freed
@@ -0,0 +1,159 @@
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+from utils.metrics import record_retry
+
+# Error classes
+RATE_LIMIT = "rate_limit"  # HTTP 429: wait as long as the server asks
+TRANSIENT = "transient"  # network errors, timeouts, 5xx: back off and retry
+MALFORMED = "malformed"  # the answer came back but does not parse: repair it
+FATAL = "fatal"  # other 4xx (bad key, bad request): retrying won't help
+
+REPAIR_PROMPT = """Your previous answer could not be parsed:
+{error}
+
+Previous answer:
+{response}
+
+Fix the problem and reply with the corrected YAML only, in a ```yaml block, keeping the content and structure that was asked for.
+"""
+
+
+class MalformedOutputError(ValueError):
+    """The LLM answered, but neither the answer nor its repairs parsed"""
+
+    def __init__(self, error: Exception, response: str):
+        super().__init__(str(error))
+        self.response = response
+
+
+def status_code(exc: Exception) -> Optional[int]:
+    """HTTP status of a requests/google-genai error, if it has one"""
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code
+    return getattr(getattr(exc, "response", None), "status_code", None)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After value (delta-seconds or HTTP date); None if unparseable"""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:  # "-0000" dates come back naive; they are UTC
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def retry_after(exc: Exception) -> Optional[float]:
+    """Seconds from the Retry-After header of an HTTP error"""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    return parse_retry_after(headers.get("Retry-After"))
+
+
+class RetryPolicy:
+    """
+    How an LLM step retries, by error class:
+
+    * rate limit - sleep for Retry-After when the server sends it, otherwise
+      back off like a transient error;
+    * transient - exponential backoff with full jitter,
+      ``uniform(0, min(max_delay, base_delay * 2**attempt))``, so parallel
+      writers hitting the same outage don't retry in lockstep;
+    * malformed - the answer is sent back with the parse error in a short
+      "repair this YAML" prompt (up to ``max_repairs`` times) before paying
+      for a full regeneration, which then follows without a delay;
+    * fatal - raised at once.
+
+    ``max_attempts`` counts full prompts, as Node's ``max_retries`` did. Only
+    the first one may be answered from the cache.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        base_delay: float = 2.0,
+        max_delay: float = 60.0,
+        max_repairs: int = 1,
+        max_retry_after: float = 300.0,
+        sleep: Callable[[float], None] = time.sleep,
+        rand: Callable[[], float] = random.random,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_repairs = max_repairs
+        self.max_retry_after = max_retry_after
+        self.sleep = sleep
+        self.rand = rand
+
+    def classify(self, exc: Exception) -> str:
+        if isinstance(exc, MalformedOutputError):
+            return MALFORMED
+        code = status_code(exc)
+        if code == 429:
+            return RATE_LIMIT
+        if code is not None and 400 <= code < 500 and code != 408:
+            return FATAL
+        # 5xx, connection errors, timeouts and anything the SDKs raise
+        # without a status (they were always retried) back off and retry
+        return TRANSIENT
+
+    def delay(self, kind: str, attempt: int, exc: Exception) -> float:
+        if kind == MALFORMED:
+            return 0.0
+        if kind == RATE_LIMIT:
+            seconds = retry_after(exc)
+            if seconds is not None:
+                return min(seconds, self.max_retry_after)
+        return self.rand() * min(self.max_delay, self.base_delay * 2 ** attempt)
+
+    def run(
+        self,
+        llm: Callable[..., str],
+        prompt: str,
+        parse: Optional[Callable[[str], object]] = None,
+        use_cache: bool = True,
+        label: str = "LLM call",
+    ):
+        """
+        Call ``llm(prompt, use_cache=...)`` and return ``parse(response)`` (or
+        the raw response without a parser), retrying per the policy.
+        """
+        for attempt in range(self.max_attempts):
+            try:
+                return self._attempt(llm, prompt, parse, use_cache and attempt == 0)
+            except Exception as e:
+                kind = self.classify(e)
+                if kind == FATAL or attempt == self.max_attempts - 1:
+                    raise
+                wait = self.delay(kind, attempt, e)
+                record_retry(kind)
+                print(f"{label}: {kind} error ({e}); retry {attempt + 1}/{self.max_attempts - 1} in {wait:.1f}s")
+                if wait > 0:
+                    self.sleep(wait)
+
+    def _attempt(self, llm, prompt, parse, use_cache):
+        response = llm(prompt, use_cache=use_cache)
+        if parse is None:
+            return response
+        for repair in range(self.max_repairs + 1):
+            try:
+                return parse(response)
+            except Exception as e:
+                error = e
+            if repair == self.max_repairs:
+                break
+            record_retry(MALFORMED)
+            response = llm(REPAIR_PROMPT.format(error=error, response=response), use_cache=False)
+        raise MalformedOutputError(error, response) from error
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Dict, Optional, Sequence, Set, Tuple
+
+from utils.repo_mirror import blob_hash
+
+MANIFEST_NAME = ".tutorial_manifest.json"
+MANIFEST_VERSION = 1
+
+# Settings that change what the LLM produces; outputs are only reused when
+# all of them match the previous run
+REUSE_SETTINGS = ("project_name", "language", "max_abstraction_num")
+
+
+def manifest_path(output_path: str) -> str:
+    return os.path.join(output_path, MANIFEST_NAME)
+
+
+def load_manifest(output_path: str) -> Optional[Dict]:
+    """The manifest of the last successful run into output_path, if any"""
+    try:
+        with open(manifest_path(output_path), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+
+def save_manifest(output_path: str, manifest: Dict):
+    """Write the manifest atomically, so a crash never leaves half of one"""
+    os.makedirs(output_path, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=output_path, prefix=".manifest-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({**manifest, "version": MANIFEST_VERSION, "created": time.time()},
+                  f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, manifest_path(output_path))
+
+
+def file_hashes(files_data: Sequence[Tuple[str, str]]) -> Dict[str, str]:
+    """path -> content digest; a LazyFileTable already knows them without loading"""
+    if hasattr(files_data, "hashes"):
+        return files_data.hashes()
+    return {path: blob_hash(content) for path, content in files_data}
+
+
+def changed_files(previous: Dict[str, str], current: Dict[str, str]) -> Set[str]:
+    """Paths added, removed or modified since the previous manifest"""
+    return {
+        path for path in previous.keys() | current.keys()
+        if previous.get(path) != current.get(path)
+    }
+
+
+def chapter_key(item: Dict, hashes: Dict[str, str], file_paths: Sequence[str]) -> str:
+    """
+    Digest of everything a chapter is written from: its abstraction, the
+    content of its files, its place in the tutorial and the language. A
+    chapter with an unchanged key can be copied from the previous run.
+    """
+    details = item["abstraction_details"]
+    payload = {
+        "chapter_num": item["chapter_num"],
+        "name": details["name"],
+        "description": details["description"],
+        "files": [(path, hashes.get(path)) for path in file_paths],
+        "listing": item["full_chapter_listing"],
+        "prev": (item.get("prev_chapter") or {}).get("filename"),
+        "next": (item.get("next_chapter") or {}).get("filename"),
+        "language": item.get("language"),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()